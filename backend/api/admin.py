@@ -1,6 +1,8 @@
 from django.contrib import admin
-from .models import User, Group, Message
+from .models import User, Group, GroupReadState, Job, Message
 
 admin.site.register(User)
 admin.site.register(Group)
 admin.site.register(Message)
+admin.site.register(GroupReadState)
+admin.site.register(Job)
@@ -0,0 +1,259 @@
+# archive.py
+"""
+Archive of cold message history.
+
+`archive_messages()` moves the messages of months older than the hot
+window (`MESSAGE_HOT_MONTHS`) out of the database into gzip-compressed JSON
+lines files, one per group and month, at
+`<MESSAGE_ARCHIVE_DIR>/<group id>/<YYYY-MM>.jsonl.gz`, in `(created, id)`
+order. On PostgreSQL a month whose rows were all archived is dropped as a
+whole partition, otherwise the archived rows are deleted. A group's latest
+message stays in the table because the inbox shows it.
+
+Deleted messages are not archived: their tombstones are dropped, and
+`Group.pruned_seq` records that the change feed can no longer replay the
+changes of the rows that left the table.
+
+`Group.archived_until` marks the end of a group's archived range, so
+`merge_archived` only opens files when a page of history reaches past it;
+`get_messages` then serves archived messages like the rows still in the
+table, `mark_read` accepts their ids and exports include them. Archived
+messages are not searchable. Like rows in the table, they
+disappear with their group, and are skipped once their sender is deleted.
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timezone as dt_timezone
+from functools import reduce
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Group, Message, User
+from .pagination import decode_cursor
+from .partitions import add_months, drop_partition, ensure_partitions, month_start
+
+FIELDS = ["id", "sender_id", "content", "created", "updated"]
+
+
+def group_directory(group_id):
+    return os.path.join(settings.MESSAGE_ARCHIVE_DIR, str(group_id))
+
+
+def archive_path(group_id, month):
+    return os.path.join(group_directory(group_id), f"{month:%Y-%m}.jsonl.gz")
+
+
+def _read_rows(path):
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        return [json.loads(line) for line in archive]
+
+
+def _write_rows(path, rows):
+    """
+    Merge `rows` into the archive file at `path`. Rows archived earlier are
+    kept, so running the archival again after an interruption is safe.
+    """
+    merged = {}
+    if os.path.exists(path):
+        merged.update((row["id"], row) for row in _read_rows(path))
+    merged.update((row["id"], row) for row in rows)
+    ordered = sorted(merged.values(), key=lambda row: (parse_datetime(row["created"]), row["id"]))
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Readers never see a partly written file
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as archive:
+            for row in ordered:
+                archive.write(json.dumps(row, separators=(",", ":")) + "\n")
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _serialize(row):
+    return {**row, "created": row["created"].isoformat(), "updated": row["updated"].isoformat()}
+
+
+def _delete_rows(ids, start, end, batch_size):
+    table = connection.ops.quote_name(Message._meta.db_table)
+    with connection.cursor() as cursor:
+        for offset in range(0, len(ids), batch_size):
+            batch = ids[offset:offset + batch_size]
+            # The `created` range lets PostgreSQL prune other partitions.
+            # Deleting in SQL sends no signals: the responses served from
+            # the archive are the same, and read states may keep pointing
+            # at archived messages.
+            cursor.execute(
+                f"DELETE FROM {table} WHERE created >= %s AND created < %s AND id IN ({', '.join(['%s'] * len(batch))})",
+                [start, end, *batch],
+            )
+
+
+def archive_messages(hot_months=None, batch_size=1000):
+    """
+    Archive every month before the last `hot_months` whole months.
+    Returns a summary of what was moved.
+    """
+    if hot_months is None:
+        hot_months = settings.MESSAGE_HOT_MONTHS
+    summary = {"partitions_created": ensure_partitions(), "months": [], "messages": 0, "partitions_dropped": []}
+    cutoff = add_months(month_start(timezone.now()), -hot_months)
+    latest = Group.objects.exclude(last_message=None).values("last_message_id")
+    cold = Message.objects.filter(created__lt=cutoff).exclude(id__in=latest)
+
+    for month in cold.datetimes("created", "month", tzinfo=dt_timezone.utc):
+        start, end = month_start(month), add_months(month_start(month), 1)
+        in_month = cold.filter(created__gte=start, created__lt=end)
+        ids = []
+        for group_id in in_month.order_by().values_list("group_id", flat=True).distinct():
+            rows = list(in_month.filter(group_id=group_id).order_by("created", "id").values(*FIELDS, "seq", "deleted"))
+            # Tombstones of deleted messages are dropped, not archived
+            _write_rows(archive_path(group_id, start), [
+                _serialize({field: row[field] for field in FIELDS}) for row in rows if row["deleted"] is None
+            ])
+            # Readers look in the archive before the rows leave the table
+            Group.objects.filter(Q(archived_until=None) | Q(archived_until__lt=end), id=group_id).update(
+                archived_until=end
+            )
+            # The change feed can no longer replay changes up to here
+            pruned = max(row["seq"] for row in rows)
+            Group.objects.filter(id=group_id, pruned_seq__lt=pruned).update(pruned_seq=pruned)
+            ids.extend(row["id"] for row in rows)
+
+        with transaction.atomic():
+            retained = Message.objects.filter(created__gte=start, created__lt=end).exclude(id__in=ids).exists()
+            if retained or not drop_partition(start):
+                _delete_rows(ids, start, end, batch_size)
+            else:
+                summary["partitions_dropped"].append(f"{start:%Y-%m}")
+        summary["months"].append(f"{start:%Y-%m}")
+        summary["messages"] += len(ids)
+    return summary
+
+
+def _archived_rows(group_id, position, ascending):
+    """
+    Archived rows of a group after (`ascending`) or before `position`, a
+    `(created, id)` pair or None, nearest first.
+    """
+    directory = group_directory(group_id)
+    if not os.path.isdir(directory):
+        return
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".jsonl.gz"))
+    if not ascending:
+        names.reverse()
+    for name in names:
+        if position is not None:
+            month = name[:7]
+            if (month < f"{position[0]:%Y-%m}") if ascending else (month > f"{position[0]:%Y-%m}"):
+                continue
+        rows = _read_rows(os.path.join(directory, name))
+        if not ascending:
+            rows.reverse()
+        for row in rows:
+            row["created"] = parse_datetime(row["created"])
+            key = (row["created"], row["id"])
+            if position is None or (key > position if ascending else key < position):
+                yield row
+
+
+def _with_senders(group_id, rows, chunk_size):
+    """
+    Turn archived `rows` into unsaved `Message` instances with their
+    sender, loading the senders of `chunk_size` rows at a time.
+    """
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            return
+        senders = User.objects.in_bulk({row["sender_id"] for row in chunk})
+        for row in chunk:
+            sender = senders.get(row["sender_id"])
+            if sender is None:
+                # Deleted with its sender
+                continue
+            yield Message(
+                id=row["id"], group_id=group_id, sender=sender, content=row["content"],
+                created=row["created"], updated=parse_datetime(row["updated"]),
+            )
+
+
+def read_archive(group_id, position=None, ascending=False, limit=50):
+    """
+    Up to `limit` archived messages of a group as unsaved `Message`
+    instances with their sender, nearest to `position` first.
+    """
+    messages = _with_senders(group_id, _archived_rows(group_id, position, ascending), limit)
+    return list(islice(messages, limit))
+
+
+def iter_archive(group_id, position=None, chunk_size=1000):
+    """
+    Every archived message of a group after `position`, oldest first, like
+    `read_archive` but one month file at a time.
+    """
+    return _with_senders(group_id, _archived_rows(group_id, position, ascending=True), chunk_size)
+
+
+def find_archived(group_id, message_id):
+    """
+    The `(created, id)` position of an archived message of a group, or None.
+    """
+    for row in _archived_rows(group_id, None, ascending=False):
+        if row["id"] == message_id:
+            return row["created"], row["id"]
+    return None
+
+
+def count_archived_after(group_id, position):
+    """
+    Number of archived messages of a group after `position`.
+    """
+    return sum(1 for _ in _archived_rows(group_id, position, ascending=True))
+
+
+def _values_row(message, lookups):
+    # The row `.values(*lookups)` would have read for the message
+    return {lookup: reduce(getattr, lookup.split("__"), message) for lookup in lookups}
+
+
+def merge_archived(group, lookups, rows, limit, before, after):
+    """
+    `apaginate_by_created` extension that completes a page of the group's
+    history with archived messages when the page reaches past
+    `group.archived_until`. The archived messages become rows with the
+    same `lookups` as the rows read from the table.
+    """
+    until = group.archived_until
+    if until is None:
+        return rows
+    if after:
+        position = decode_cursor(after)
+        if position[0] >= until:
+            return rows
+    else:
+        position = decode_cursor(before) if before else None
+        if len(rows) > limit and rows[-1]["created"] >= until:
+            return rows
+
+    archived = read_archive(group.id, position, ascending=bool(after), limit=limit + 1)
+    # A row can be in both while it is being archived
+    merged = {message.id: _values_row(message, lookups) for message in archived}
+    merged.update((row["id"], row) for row in rows)
+    ordered = sorted(merged.values(), key=lambda row: (row["created"], row["id"]), reverse=not after)
+    return ordered[:limit + 1]
+
+
+def delete_group_archive(group_id):
+    shutil.rmtree(group_directory(group_id), ignore_errors=True)
@@ -0,0 +1,198 @@
+# authentication.py
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTTokenUserAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User
+from .revocation import revocations
+
+# Claims copied into every token so most requests never need the user row
+TOKEN_USER_CLAIMS = ("is_staff", "is_superuser")
+
+
+class RevocableRefreshToken(RefreshToken):
+    """
+    Refresh token whose blacklist check goes through the revocation cache,
+    so tokens that were never revoked are accepted without a query.
+    """
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if not revocations.might_be_revoked(jti):
+            return
+        if BlacklistedToken.objects.filter(token__jti=jti).exists():
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        blacklisted, created = super().blacklist()
+        revocations.add(self.payload[api_settings.JTI_CLAIM])
+        return blacklisted, created
+
+
+def get_token_for_user(user):
+    """
+    Create a refresh token carrying the claims `LazyTokenUser` reads. The
+    access tokens derived from it inherit the same claims.
+    """
+    refresh = RevocableRefreshToken.for_user(user)
+    for claim in TOKEN_USER_CLAIMS:
+        refresh[claim] = getattr(user, claim)
+    return refresh
+
+
+class UserCache:
+    """
+    Small per-process LRU cache of user rows with a time-to-live.
+
+    Entries hold field values rather than model instances so every caller
+    gets its own `User` object. Entries are dropped from `api.signals`
+    whenever a user is saved or deleted.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._field_names = [field.attname for field in User._meta.concrete_fields]
+
+    def _cached_values(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+        return None
+
+    def _store(self, user_id, values):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, user_id):
+        if self.ttl <= 0:
+            return User.objects.get(id=user_id)
+
+        values = self._cached_values(user_id)
+        if values is None:
+            values = User.objects.values_list(*self._field_names).get(id=user_id)
+            self._store(user_id, values)
+        return User.from_db("default", self._field_names, values)
+
+    async def aget(self, user_id):
+        """
+        Asynchronous version of `get`; cache hits never leave the event loop.
+        """
+        if self.ttl <= 0:
+            return await User.objects.aget(id=user_id)
+
+        values = self._cached_values(user_id)
+        if values is None:
+            values = await User.objects.values_list(*self._field_names).aget(id=user_id)
+            self._store(user_id, values)
+        return User.from_db("default", self._field_names, values)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(
+    ttl=getattr(settings, "USER_CACHE_TTL", 60),
+    max_size=getattr(settings, "USER_CACHE_SIZE", 10000),
+)
+
+
+class LazyTokenUser(TokenUser):
+    """
+    Stateless user built from the claims of a validated access token.
+
+    `id`, `is_staff` and `is_superuser` come straight from the token. Reading
+    any other attribute loads the full `User` row once per request, through
+    `user_cache`.
+    """
+
+    @cached_property
+    def user(self):
+        return user_cache.get(self.id)
+
+    @cached_property
+    def is_staff(self):
+        if "is_staff" in self.token:
+            return self.token["is_staff"]
+        return self.user.is_staff
+
+    @cached_property
+    def is_superuser(self):
+        if "is_superuser" in self.token:
+            return self.token["is_superuser"]
+        return self.user.is_superuser
+
+    @cached_property
+    def username(self):
+        return self.user.username
+
+    def __getattr__(self, name):
+        # Only reached for attributes TokenUser does not define itself
+        if name.startswith("_") or name in ("token", "user"):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+
+class ActiveTokenUserAuthentication(JWTTokenUserAuthentication):
+    """
+    Authenticates with a `LazyTokenUser`, like `JWTTokenUserAuthentication`,
+    but still rejects tokens of users that were deleted or deactivated, as
+    simplejwt's `JWTAuthentication` does. The check reads the user row
+    through `user_cache`, so it costs no query while the row is cached;
+    other processes see the change once their entry expires
+    (`USER_CACHE_TTL`).
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        try:
+            is_active = user.user.is_active
+        except User.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+def get_full_user(user):
+    """
+    Return the `User` model instance behind `request.user`.
+    """
+    if isinstance(user, LazyTokenUser):
+        return user.user
+    return user
+
+
+async def aget_full_user(user):
+    """
+    Asynchronous version of `get_full_user`.
+    """
+    if isinstance(user, LazyTokenUser):
+        if "user" not in user.__dict__:
+            # Fill the cached property the synchronous path would have set
+            user.__dict__["user"] = await user_cache.aget(user.id)
+        return user.user
+    return user
@@ -0,0 +1,316 @@
+# benchmarks.py
+"""
+Micro-benchmarks for the API's hot paths.
+
+Each benchmark is a function registered with `@benchmark(name)` that takes
+the parsed command options and returns a JSON-serializable dict of results.
+Run them with `python manage.py benchmark <name>`; the command executes them
+against a throwaway test database so real data is never touched.
+"""
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .authentication import get_token_for_user
+from .models import Group, Message, User
+from .pooling import connection_stats, stats as connection_counters
+from .renderers import MessagePackRenderer, compact_messages
+from .serializers import (
+    GetUserSerializer, GroupSerializer, GroupValuesSerializer, MessageSerializer, MessageValuesSerializer,
+    UserValuesSerializer,
+)
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """
+    Summarize a list of durations in seconds as milliseconds.
+    """
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+    }
+
+
+@contextmanager
+def throwaway_database():
+    """
+    Point the default connection at a freshly migrated test database for
+    the duration of the block, then destroy it.
+
+    SQLite gets a file-backed database rather than the shared in-memory
+    one, so concurrent threads wait on each other instead of failing with
+    "database table is locked".
+    """
+    setup_test_environment()
+    directory = None
+    if connection.vendor == "sqlite":
+        directory = tempfile.mkdtemp(prefix="chartapp-bench-")
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(directory, "bench.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if directory is not None:
+            os.rmdir(directory)
+
+
+def measure(func, iterations):
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+@contextmanager
+def legacy_password_hashing():
+    """
+    Temporarily restore the old `User.save`, which re-hashed the password
+    on every save, so both behaviours can be measured in the same run.
+    """
+    original_save = User.save
+
+    def save(self, *args, **kwargs):
+        self.set_password(self.password)
+        original_save(self, *args, **kwargs)
+
+    User.save = save
+    try:
+        yield
+    finally:
+        User.save = original_save
+
+
+@benchmark("passwords")
+def password_benchmark(options):
+    """
+    Compare profile PATCH latency and bulk update throughput with and without
+    re-hashing the password on every save.
+    """
+    iterations = options["iterations"]
+    password = make_password("secret")
+    User.objects.bulk_create(
+        (
+            User(email=f"bench{i}@example.com", username=f"bench {i}", password=password)
+            for i in range(options["users"])
+        ),
+        hashed_passwords=True,
+    )
+    users = list(User.objects.order_by("id"))
+
+    client = APIClient()
+    client.force_authenticate(users[0])
+    url = reverse("user-management")
+
+    def patch(i):
+        client.patch(url, {"id": users[0].id, "username": f"renamed {i}"}, format="json")
+
+    def legacy_bulk_update(i):
+        for user in users:
+            user.username = f"bulk {i}"
+            user.save()
+
+    def bulk_update(i):
+        for user in users:
+            user.username = f"bulk {i}"
+        User.objects.bulk_update(users, ["username"])
+
+    with legacy_password_hashing():
+        before_patch = measure(patch, iterations)
+        before_bulk = measure(legacy_bulk_update, 1)
+    after_patch = measure(patch, iterations)
+    after_bulk = measure(bulk_update, 1)
+
+    return {
+        "patch": {"before": summarize(before_patch), "after": summarize(after_patch)},
+        "bulk_update_rows_per_second": {
+            "before": len(users) / before_bulk[0],
+            "after": len(users) / after_bulk[0],
+        },
+    }
+
+
+@benchmark("conditional")
+def conditional_get_benchmark(options):
+    """
+    Compare bytes and latency of a full message page with a revalidated one.
+    """
+    iterations = options["iterations"]
+    user = User.objects.create_user("conditional@example.com", "secret", username="conditional")
+    group = Group.objects.create(host=user, name="conditional")
+    Message.objects.bulk_create(
+        Message(group=group, sender=user, content=f"benchmark message {i}") for i in range(200)
+    )
+    client = APIClient()
+    client.force_authenticate(user)
+    url = reverse("get-group-messages", args=[group.id])
+    params = {"limit": 200}
+
+    full = client.get(url, params)
+    etag = full["ETag"]
+    revalidated = client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+    return {
+        "bytes": {"full": len(full.content), "not_modified": len(revalidated.content)},
+        "full": summarize(measure(lambda i: client.get(url, params), iterations)),
+        "not_modified": summarize(
+            measure(lambda i: client.get(url, params, HTTP_IF_NONE_MATCH=etag), iterations)
+        ),
+    }
+
+
+@benchmark("connections")
+def connection_benchmark(options):
+    """
+    Compare request latency when every request opens its own database
+    connection (CONN_MAX_AGE=0) and when it reuses a persistent one.
+
+    Requests go through the WSGI handler rather than the test client, which
+    skips the end-of-request handling that closes connections.
+    """
+    iterations = options["iterations"]
+    user = User.objects.create_user("connections@example.com", "secret", username="connections")
+    group = Group.objects.create(host=user, name="connections")
+    group.participants.add(user)
+    handler = WSGIHandler()
+    factory = RequestFactory()
+    url = reverse("inbox")
+    authorization = f"JWT {get_token_for_user(user).access_token}"
+
+    def get(i):
+        request = factory.get(url, HTTP_AUTHORIZATION=authorization)
+        response = handler(request.environ, lambda status, headers: None)
+        # Sends request_finished, which closes the connection or keeps it
+        response.close()
+
+    max_age = connection.settings_dict["CONN_MAX_AGE"]
+    results = {}
+    try:
+        for mode, age in (("per_request", 0), ("persistent", 600)):
+            connection.close()
+            connection.settings_dict["CONN_MAX_AGE"] = age
+            connection_counters.reset()
+            samples = measure(get, iterations)
+            results[mode] = {
+                "latency": summarize(samples),
+                "connections_opened": connection_stats()["databases"][connection.alias]["opened"],
+            }
+    finally:
+        connection.settings_dict["CONN_MAX_AGE"] = max_age
+    return results
+
+
+@benchmark("msgpack")
+def msgpack_benchmark(options):
+    """
+    Compare payload size and encode time of a page of messages rendered as
+    JSON and as a compact MessagePack page, as the history endpoint does.
+    """
+    iterations = options["iterations"]
+    password = make_password("secret")
+    User.objects.bulk_create(
+        (User(email=f"msgpack{i}@example.com", username=f"msgpack {i}", password=password) for i in range(10)),
+        hashed_passwords=True,
+    )
+    senders = list(User.objects.filter(email__startswith="msgpack"))
+    group = Group.objects.create(host=senders[0], name="msgpack")
+    Message.objects.bulk_create(
+        Message(group=group, sender=senders[i % len(senders)], content=f"benchmark message {i}")
+        for i in range(200)
+    )
+    messages = list(
+        Message.objects.filter(group=group).order_by("-created", "-id").values(*MessageValuesSerializer.lookups)
+    )
+
+    def as_json(i):
+        return JSONRenderer().render({"data": MessageValuesSerializer.represent(messages)})
+
+    def as_msgpack(i):
+        return MessagePackRenderer().render({"group": group.id, **compact_messages(messages)})
+
+    return {
+        "messages": len(messages),
+        "bytes": {"json": len(as_json(0)), "msgpack": len(as_msgpack(0))},
+        "encode": {"json": summarize(measure(as_json, iterations)), "msgpack": summarize(measure(as_msgpack, iterations))},
+    }
+
+
+@benchmark("serializers")
+def serializer_benchmark(options):
+    """
+    Compare the rows per second of the `ModelSerializer`s used by the API
+    with their `.values()` counterparts, query included, on lists of users,
+    groups and messages.
+    """
+    iterations = options["iterations"]
+    password = make_password("secret")
+    User.objects.bulk_create(
+        (User(email=f"rows{i}@example.com", username=f"rows {i}", password=password) for i in range(200)),
+        hashed_passwords=True,
+    )
+    users = list(User.objects.filter(email__startswith="rows"))
+    groups = Group.objects.bulk_create(Group(host=users[i], name=f"rows {i}") for i in range(100))
+    Group.participants.through.objects.bulk_create(
+        Group.participants.through(group=group, user=users[(i + j) % len(users)])
+        for i, group in enumerate(groups) for j in range(5)
+    )
+    Message.objects.bulk_create(
+        Message(group=groups[i % len(groups)], sender=users[i % len(users)], content=f"benchmark message {i}")
+        for i in range(2000)
+    )
+
+    cases = {
+        "users": (User.objects.filter(email__startswith="rows").order_by("id"), GetUserSerializer, UserValuesSerializer),
+        "groups": (Group.objects.order_by("id").prefetch_related("participants"), GroupSerializer, GroupValuesSerializer),
+        "messages": (Message.objects.for_listing().order_by("-created", "-id"), MessageSerializer, MessageValuesSerializer),
+    }
+    results = {}
+    for name, (queryset, model_serializer, values_serializer) in cases.items():
+        rows = queryset.count()
+        timings = {
+            "model_serializer": measure(lambda i: model_serializer(queryset.all(), many=True).data, iterations),
+            "values_serializer": measure(lambda i: values_serializer(queryset.all()).data, iterations),
+        }
+        results[name] = {
+            "rows": rows,
+            **{
+                kind: {"rows_per_second": rows / statistics.fmean(samples), **summarize(samples)}
+                for kind, samples in timings.items()
+            },
+        }
+        results[name]["speedup"] = (
+            results[name]["values_serializer"]["rows_per_second"] / results[name]["model_serializer"]["rows_per_second"]
+        )
+    return results
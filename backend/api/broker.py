@@ -0,0 +1,154 @@
+# broker.py
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+def group_channel(group_id):
+    """
+    Name of the broker channel that carries live events for a group.
+    """
+    return f"chat.group.{group_id}"
+
+
+class InProcessBroker:
+    """
+    Broker that fans events out to subscribers living in the same process.
+
+    Only suitable for tests: messages published by the `runjobs` worker
+    never reach the subscribers of the ASGI server.
+    """
+
+    cross_process = False
+
+    def __init__(self, location=None):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, payload):
+        """
+        Deliver `payload` (a JSON string) to every subscriber of `channel`.
+        Safe to call from any thread.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(payload)
+
+    async def subscribe(self, channel):
+        subscription = InProcessSubscription(self, channel)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+
+class InProcessSubscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+    def deliver(self, payload):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, payload)
+
+    async def get(self):
+        return await self._queue.get()
+
+    async def close(self):
+        self.broker._unsubscribe(self)
+
+
+class RedisBroker:
+    """
+    Broker backed by Redis pub/sub, or any server speaking the same protocol
+    (Valkey, KeyDB, ...). Lets WSGI workers publish to subscribers held by
+    separate ASGI processes.
+    """
+
+    cross_process = True
+
+    def __init__(self, location=None):
+        import redis
+        import redis.asyncio
+
+        self.location = location or "redis://localhost:6379/0"
+        self._client = redis.Redis.from_url(self.location)
+        self._async_redis = redis.asyncio
+
+    def publish(self, channel, payload):
+        self._client.publish(channel, payload)
+
+    async def subscribe(self, channel):
+        client = self._async_redis.Redis.from_url(self.location)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(channel)
+        return RedisSubscription(client, pubsub)
+
+
+class RedisSubscription:
+    def __init__(self, client, pubsub):
+        self._client = client
+        self._pubsub = pubsub
+
+    async def get(self):
+        while True:
+            message = await self._pubsub.get_message(timeout=None)
+            if message is not None and message["type"] == "message":
+                return message["data"].decode()
+
+    async def close(self):
+        await self._pubsub.aclose()
+        await self._client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    Return the process-wide broker configured by `settings.CHAT_BROKER`.
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = getattr(settings, "CHAT_BROKER", {})
+                backend = import_string(config.get("BACKEND", "api.broker.RedisBroker"))
+                _broker = backend(config.get("LOCATION"))
+    return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    global _broker
+    if setting == "CHAT_BROKER":
+        with _broker_lock:
+            _broker = None
+
+
+def publish_message(group_id, data):
+    """
+    Push a serialized message to everyone subscribed to its group.
+    The payload is encoded once here rather than once per subscriber.
+
+    Runs from the `message.created` job, which retries when the broker
+    cannot be reached.
+    """
+    payload = json.dumps({"type": "message.created", "data": data}, cls=JSONEncoder)
+    get_broker().publish(group_channel(group_id), payload)
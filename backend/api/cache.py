@@ -0,0 +1,240 @@
+# cache.py
+"""
+Response cache for the read endpoints.
+
+Entries live in the `responses` alias of `settings.CACHES`: an in-process
+LRU (`LocMemCache`) by default, or any Redis-compatible server through
+Django's `RedisCache`. Keys combine the user, the request's query string
+and version tokens of the resources a response depends on. `api.signals`
+replaces those tokens whenever users, groups or messages change, so stale
+entries are never read again and simply age out.
+
+With the in-process backend every worker keeps its own tokens; run a
+shared backend when several processes serve the API.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from .conditional import not_modified, set_validators
+from .instrumentation import serializing
+from .routing import primary_reads
+
+CACHE_ALIAS = "responses"
+# The user directory
+USERS = "users"
+
+
+def group_version(group_id):
+    return f"group:{group_id}"
+
+
+def user_version(user_id):
+    return f"user:{user_id}"
+
+
+class CacheStats:
+    """
+    Per-process hit/miss counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": caches[CACHE_ALIAS].__class__.__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else None,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+stats = CacheStats()
+
+
+def _new_version():
+    # Starts with its creation time so readers can tell how recently the
+    # resource changed, truncated to milliseconds: rounding up would make a
+    # fresh token look newer than a check made right after
+    return f"{int(time.time() * 1000) / 1000:.3f}-{uuid.uuid4().hex}"
+
+
+def _changed_since(versions, seconds):
+    threshold = time.time() - seconds
+    for version in versions:
+        created, _, _ = version.partition("-")
+        try:
+            if float(created) > threshold:
+                return True
+        except ValueError:
+            # Token from before versions carried a timestamp
+            continue
+    return False
+
+
+def _build_reads(versions):
+    """
+    Reads of a cache miss go to the primary while a resource's last change
+    may not have reached the replicas: a stale answer would otherwise stay
+    cached until the resource changes again.
+    """
+    if settings.DATABASE_REPLICAS and _changed_since(versions, settings.REPLICA_STICKY_SECONDS):
+        return primary_reads()
+    return nullcontext()
+
+
+def _version_key(resource):
+    return f"version:{resource}"
+
+
+def _version_keys(resources):
+    return [_version_key(resource) for resource in resources]
+
+
+def get_versions(resources):
+    """
+    Return the current version token of each resource, in one round trip.
+    """
+    cache = caches[CACHE_ALIAS]
+    keys = _version_keys(resources)
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            version = _new_version()
+            # Another process may have created the token meanwhile
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+        versions.append(version)
+    return versions
+
+
+async def aget_versions(resources):
+    """
+    Asynchronous version of `get_versions`.
+    """
+    cache = caches[CACHE_ALIAS]
+    keys = _version_keys(resources)
+    found = await cache.aget_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            version = _new_version()
+            if not await cache.aadd(key, version, timeout=None):
+                version = await cache.aget(key, version)
+        versions.append(version)
+    return versions
+
+
+def invalidate(*resources):
+    """
+    Give the resources new version tokens, orphaning every cached response
+    built from their previous state.
+    """
+    caches[CACHE_ALIAS].set_many(
+        {_version_key(resource): _new_version() for resource in resources}, timeout=None
+    )
+
+
+def _response_key(request, name, versions):
+    query = hashlib.sha1(request.META.get("QUERY_STRING", "").encode()).hexdigest()
+    # Views may build a different payload per negotiated format
+    return f"response:{name}:{request.accepted_renderer.format}:{request.user.id}:{query}:{':'.join(versions)}"
+
+
+def _cached_response(request, entry):
+    payload, etag, last_modified = entry
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = Response(payload, status=status.HTTP_200_OK)
+        set_validators(response, etag, last_modified)
+    response["X-Cache"] = "HIT"
+    return response
+
+
+def _fresh_response(request, etag, last_modified, payload):
+    response = Response(payload, status=status.HTTP_200_OK)
+    set_validators(response, etag, last_modified)
+    response["X-Cache"] = "MISS"
+    return response
+
+
+def cached_read(request, name, resources, build):
+    """
+    Serve a read endpoint through the response cache.
+
+    `build()` runs on a miss. It reads the data and returns
+    `(etag, last_modified, render)`, where `render()` produces the response
+    payload; it is only called when the client's copy is stale, so a
+    revalidated miss never serializes anything.
+    """
+    cache = caches[CACHE_ALIAS]
+    versions = get_versions(resources)
+    key = _response_key(request, name, versions)
+
+    entry = cache.get(key)
+    stats.record(entry is not None)
+    if entry is not None:
+        return _cached_response(request, entry)
+
+    with _build_reads(versions):
+        etag, last_modified, render = build()
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            response["X-Cache"] = "MISS"
+            return response
+        with serializing():
+            payload = render()
+    cache.set(key, (payload, etag, last_modified))
+    return _fresh_response(request, etag, last_modified, payload)
+
+
+async def acached_read(request, name, resources, build):
+    """
+    Asynchronous version of `cached_read`; `build` is a coroutine function,
+    `render` stays synchronous since it only serializes rows already read.
+    """
+    cache = caches[CACHE_ALIAS]
+    versions = await aget_versions(resources)
+    key = _response_key(request, name, versions)
+
+    entry = await cache.aget(key)
+    stats.record(entry is not None)
+    if entry is not None:
+        return _cached_response(request, entry)
+
+    with _build_reads(versions):
+        etag, last_modified, render = await build()
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            response["X-Cache"] = "MISS"
+            return response
+        with serializing():
+            payload = render()
+    await cache.aset(key, (payload, etag, last_modified))
+    return _fresh_response(request, etag, last_modified, payload)
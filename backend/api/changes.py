@@ -0,0 +1,59 @@
+# changes.py
+"""
+Change feed of a group's messages, for clients that keep a local copy.
+
+Every insert, edit and deletion of a message takes the next number of its
+group's change sequence (`Group.change_seq`) and stores it in
+`Message.seq`. Sequence numbers are issued under the group's row lock, so
+changes become visible in sequence order. A row only keeps its latest
+change, so the feed returns the current state of each message changed
+after `since`; deletions show up as tombstones with `deleted` set and empty
+content. Numbers of rolled back transactions are skipped, so the sequence
+may have gaps.
+
+Rows that leave the table (see `api.archive`) take their changes with
+them. `Group.pruned_seq` is the highest sequence number lost that way; a
+client behind it has to reload the history and then follow the feed again
+from the `seq` it was given.
+"""
+from .models import Message
+from .pagination import InvalidCursor, get_page_size
+from .serializers import MessageChangeValuesSerializer
+
+
+class ChangesPruned(Exception):
+    """
+    Raised when the changes after `since` can no longer all be replayed.
+    """
+
+
+def parse_since(params):
+    try:
+        since = int(params.get("since", 0))
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor("since must be an integer") from e
+    if since < 0:
+        raise InvalidCursor("since must not be negative")
+    return since
+
+
+def list_changes(group, params):
+    """
+    Return `(changes, seq, more)` for the changes of `group` after the
+    `since` query parameter, oldest first. `seq` is the value to pass as
+    `since` next; `more` tells whether further changes are waiting.
+
+    Query parameters:
+        since (int): `seq` of the previous response, 0 for everything.
+        limit (int): Page size.
+    """
+    since = parse_since(params)
+    if since < group.pruned_seq:
+        raise ChangesPruned(f"Changes up to {group.pruned_seq} are no longer available")
+    limit = get_page_size(params)
+    changes = MessageChangeValuesSerializer(
+        Message.objects.filter(group_id=group.id, seq__gt=since).order_by("seq")[: limit + 1]
+    ).data
+    more = len(changes) > limit
+    changes = changes[:limit]
+    return changes, changes[-1]["seq"] if changes else since, more
@@ -0,0 +1,41 @@
+# conditional.py
+"""
+Helpers for conditional GET (`If-None-Match` / `If-Modified-Since`).
+
+Views compute cheap validators from data they read anyway (ids and
+modification times) and call `not_modified` before serializing anything.
+Pages of a collection that rows can leave only get an ETag: the newest
+modification time of the remaining rows does not change when one is
+deleted, so `If-Modified-Since` would answer 304 for a stale page.
+"""
+import hashlib
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """
+    Build a strong ETag from the values that determine a representation.
+    """
+    return quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Return a 304 response when the client's copy is still current, else None.
+    `last_modified` is an aware datetime or None.
+    """
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(timegm(last_modified.utctimetuple()))
+    return response
@@ -0,0 +1,82 @@
+# directory.py
+from collections import namedtuple
+
+from django.db.models import Q
+
+from .models import User
+from .pagination import InvalidCursor, MAX_PAGE_SIZE, decode_values, encode_values, get_page_size
+from .serializers import GetUserSerializer
+
+# Fields a client may ask for with `?fields=`, in GetUserSerializer order
+DIRECTORY_FIELDS = tuple(GetUserSerializer.Meta.fields)
+
+# `versions` holds `(id, updated_at)` of every row, for conditional GET
+DirectoryPage = namedtuple("DirectoryPage", ["rows", "next", "versions"])
+
+
+def parse_fields(params):
+    raw = params.get("fields")
+    if not raw:
+        return DIRECTORY_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in raw.split(",") if field.strip()))
+    unknown = set(fields) - set(DIRECTORY_FIELDS)
+    if unknown or not fields:
+        raise InvalidCursor(f"fields must be a subset of {', '.join(DIRECTORY_FIELDS)}")
+    return fields
+
+
+def parse_ids(raw):
+    try:
+        ids = [int(pk) for pk in raw.split(",") if pk.strip()]
+    except ValueError as e:
+        raise InvalidCursor("ids must be a comma separated list of integers") from e
+    if len(ids) > MAX_PAGE_SIZE:
+        raise InvalidCursor(f"At most {MAX_PAGE_SIZE} ids can be looked up at once")
+    return ids
+
+
+def list_users(params):
+    """
+    Return one `DirectoryPage` of the user directory.
+
+    Rows are plain dicts read with `.values()`, so only the requested
+    columns are selected. Pages are keyed on `id`.
+
+    Query parameters:
+        ids (str): Comma separated ids to look up; disables pagination.
+        search (str): Case-insensitive prefix of the username or email.
+        fields (str): Comma separated subset of `DIRECTORY_FIELDS`.
+        cursor (str): `next` cursor of the previous page.
+        limit (int): Page size.
+    """
+    fields = parse_fields(params)
+    users = User.objects.order_by("id")
+    # `id` and `updated_at` are always read for the cursor and validators
+    columns = tuple(dict.fromkeys(fields + ("id", "updated_at")))
+
+    if params.get("ids"):
+        rows = list(users.filter(id__in=parse_ids(params["ids"])).values(*columns))
+        return _page(rows, fields, None)
+
+    search = params.get("search", "").strip()
+    if search:
+        users = users.filter(Q(username__istartswith=search) | Q(email__istartswith=search))
+    if params.get("cursor"):
+        (after,) = decode_values(params["cursor"], 1)
+        if not isinstance(after, int):
+            raise InvalidCursor("Invalid cursor")
+        users = users.filter(id__gt=after)
+
+    limit = get_page_size(params)
+    rows = list(users.values(*columns)[: limit + 1])
+    next_cursor = encode_values(rows[limit - 1]["id"]) if len(rows) > limit else None
+    return _page(rows[:limit], fields, next_cursor)
+
+
+def _page(rows, fields, next_cursor):
+    versions = [(row["id"], row["updated_at"]) for row in rows]
+    for row in rows:
+        for column in ("id", "updated_at"):
+            if column not in fields:
+                del row[column]
+    return DirectoryPage(rows, next_cursor, versions)
@@ -0,0 +1,114 @@
+# export.py
+"""
+Streaming exports of a group's message history.
+
+Rows are read with `.values_list().iterator()`, which uses a server-side
+cursor on PostgreSQL, and encoded one by one without DRF serializers, so
+memory use does not depend on the size of the group. Archived messages
+come first, read from the archive one month file at a time.
+"""
+import csv
+import heapq
+import json
+from itertools import chain
+
+from django.conf import settings
+from django.db.models import Q
+
+from .archive import find_archived, iter_archive
+from .models import Group, Message
+
+EXPORT_FIELDS = (
+    "id", "group_id", "sender_id", "sender__username", "sender__email", "content", "created",
+)
+CSV_HEADER = ("id", "group", "sender_id", "sender_username", "sender_email", "content", "created")
+
+
+def format_datetime(value):
+    """
+    Format a datetime the way DRF's `DateTimeField` does by default.
+    """
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def _archived_row(message):
+    sender = message.sender
+    return (
+        message.id, message.group_id, sender.id, sender.username, sender.email, message.content, message.created,
+    )
+
+
+def _position(row):
+    return row[6], row[0]
+
+
+def export_rows(group_id, after_id=None):
+    """
+    Yield the messages of a group as tuples of `EXPORT_FIELDS`, oldest first.
+    When `after_id` is given the export resumes right after that message.
+    """
+    archived_until = Group.objects.filter(id=group_id).values_list("archived_until", flat=True).first()
+    queryset = Message.objects.filter(group_id=group_id).visible()
+    position = None
+    if after_id is not None:
+        position = Message.objects.filter(group_id=group_id, id=after_id).values_list("created", "id").first()
+        if position is None and archived_until is not None:
+            position = find_archived(group_id, after_id)
+        if position is None:
+            raise Message.DoesNotExist(f"Message {after_id} is not part of group {group_id}")
+        created, _ = position
+        queryset = queryset.filter(Q(created__gt=created) | Q(created=created, id__gt=after_id))
+    queryset = queryset.order_by("created", "id").values_list(*EXPORT_FIELDS)
+    if archived_until is None or (position is not None and position[0] >= archived_until):
+        return queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+    # The few table rows older than the archived range are the group's
+    # latest message, which is never archived, and rows being archived
+    # right now, which are in both places
+    kept = list(queryset.filter(created__lt=archived_until))
+    kept_ids = {row[0] for row in kept}
+    archived = (
+        _archived_row(message)
+        for message in iter_archive(group_id, position, chunk_size=settings.EXPORT_CHUNK_SIZE)
+        if message.id not in kept_ids
+    )
+    return chain(
+        heapq.merge(archived, kept, key=_position),
+        queryset.filter(created__gte=archived_until).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE),
+    )
+
+
+def ndjson_lines(rows):
+    for pk, group_id, sender_id, username, email, content, created in rows:
+        yield json.dumps({
+            "id": pk,
+            "group": group_id,
+            "sender": {"username": username, "email": email, "id": sender_id},
+            "content": content,
+            "created": format_datetime(created),
+        }) + "\n"
+
+
+class Echo:
+    """
+    File-like object whose `write` returns the value instead of storing it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for pk, group_id, sender_id, username, email, content, created in rows:
+        yield writer.writerow((pk, group_id, sender_id, username, email, content, format_datetime(created)))
+
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", ndjson_lines),
+    "csv": ("text/csv", csv_lines),
+}
@@ -0,0 +1,289 @@
+# instrumentation.py
+"""
+Per-request timing: database queries, serializer time and handler time.
+
+`RequestInstrumentationMiddleware` measures a sample of requests
+(`INSTRUMENTATION_SAMPLE_RATE`) and reports each one in a JSON log line on
+the `api.instrumentation` logger. The `Server-Timing` header with the same
+numbers only goes to staff users, or to everyone with
+`INSTRUMENTATION_SERVER_TIMING`. The `instrument` decorator adds the view's
+own handler time to those numbers; on a project without the middleware it
+samples and reports the view by itself.
+
+Serializer time covers the blocks wrapped in `serializing()`, such as the
+`render()` step of the response cache, and the rendering of the view's
+response, which `instrument` does itself so it can be timed.
+
+Queries are counted with `connection.execute_wrapper`, so no debug cursor
+is needed. Both work on asynchronous views as well; the wrappers are then
+installed on the thread that runs the request's ORM calls. A request that runs the same SQL statement more than
+`INSTRUMENTATION_N_PLUS_ONE_THRESHOLD` times logs a warning, which is the
+usual signature of an N+1 query pattern.
+"""
+import asyncio
+import functools
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = Counter()
+        self.serializer_time = 0.0
+        self.handler_time = None
+        self.total_time = None
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.query_time += duration
+        self.statements[sql] += 1
+
+    def server_timing(self):
+        entries = [
+            f'db;dur={self.query_time * 1000:.2f};desc="{self.queries} queries"',
+            f"serializer;dur={self.serializer_time * 1000:.2f}",
+        ]
+        if self.handler_time is not None:
+            entries.append(f"handler;dur={self.handler_time * 1000:.2f}")
+        if self.total_time is not None:
+            entries.append(f"total;dur={self.total_time * 1000:.2f}")
+        return ", ".join(entries)
+
+
+def is_sampled():
+    rate = settings.INSTRUMENTATION_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started)
+
+
+def _query_wrappers():
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(_record_query))
+    return stack
+
+
+@contextmanager
+def collect(metrics):
+    """
+    Make `metrics` the current request's metrics and record every query run
+    on any database connection of this thread until the block exits.
+    """
+    token = _current.set(metrics)
+    try:
+        with _query_wrappers():
+            yield metrics
+    finally:
+        _current.reset(token)
+
+
+@asynccontextmanager
+async def acollect(metrics):
+    """
+    Asynchronous version of `collect`. The async ORM runs queries through
+    `sync_to_async`, so the wrappers go on the connections of that thread.
+    """
+    token = _current.set(metrics)
+    try:
+        wrappers = await sync_to_async(_query_wrappers)()
+        try:
+            yield metrics
+        finally:
+            await sync_to_async(wrappers.close)()
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def serializing():
+    """
+    Count the block as serializer time of the request being measured.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - started
+
+
+def render_now(response):
+    """
+    Render a DRF response now, as serializer time, instead of leaving it to
+    the handler after the view returned.
+    """
+    if getattr(response, "is_rendered", True):
+        return
+    with serializing():
+        response.render()
+
+
+def shows_server_timing(request):
+    if settings.INSTRUMENTATION_SERVER_TIMING:
+        return True
+    # DRF stores the user it authenticated on the underlying request
+    user = getattr(request, "user", None)
+    return bool(user is not None and user.is_authenticated and user.is_staff)
+
+
+def report(request, response, metrics):
+    if shows_server_timing(request):
+        response["Server-Timing"] = metrics.server_timing()
+    logger.info(json.dumps({
+        "event": "request",
+        "method": request.method,
+        "path": request.path,
+        "view": metrics.view,
+        "status": response.status_code,
+        "queries": metrics.queries,
+        "query_ms": round(metrics.query_time * 1000, 2),
+        "serializer_ms": round(metrics.serializer_time * 1000, 2),
+        "handler_ms": None if metrics.handler_time is None else round(metrics.handler_time * 1000, 2),
+        "total_ms": None if metrics.total_time is None else round(metrics.total_time * 1000, 2),
+    }))
+
+    if metrics.statements:
+        sql, repeats = metrics.statements.most_common(1)[0]
+        if repeats > settings.INSTRUMENTATION_N_PLUS_ONE_THRESHOLD:
+            logger.warning(
+                "Possible N+1 query in %s %s: statement ran %d times: %s",
+                request.method, request.path, repeats, sql,
+            )
+
+
+class RequestInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Lets Django call the middleware without a thread hop, the
+            # same way `MiddlewareMixin` does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Tells `instrument` that sampling was already decided
+        request.instrumentation = None
+        if not is_sampled():
+            return self.get_response(request)
+
+        metrics = request.instrumentation = RequestMetrics()
+        started = time.perf_counter()
+        with collect(metrics):
+            response = self.get_response(request)
+        metrics.total_time = time.perf_counter() - started
+        report(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        request.instrumentation = None
+        if not is_sampled():
+            return await self.get_response(request)
+
+        metrics = request.instrumentation = RequestMetrics()
+        started = time.perf_counter()
+        async with acollect(metrics):
+            response = await self.get_response(request)
+        metrics.total_time = time.perf_counter() - started
+        report(request, response, metrics)
+        return response
+
+
+def instrument(view):
+    """
+    Record the handler time of a view, synchronous or asynchronous. Place
+    it above `@api_view` so authentication and permission checks are
+    included.
+    """
+    # `@api_view` returns a generic `view` function; the name of the
+    # decorated function lives on the generated class
+    name = getattr(view, "cls", view).__name__
+
+    if asyncio.iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if hasattr(request, "instrumentation"):
+                metrics = request.instrumentation
+                if metrics is None:
+                    return await view(request, *args, **kwargs)
+                metrics.view = name
+                started = time.perf_counter()
+                response = await view(request, *args, **kwargs)
+                render_now(response)
+                metrics.handler_time = time.perf_counter() - started
+                return response
+
+            if not is_sampled():
+                return await view(request, *args, **kwargs)
+            metrics = RequestMetrics()
+            metrics.view = name
+            started = time.perf_counter()
+            async with acollect(metrics):
+                response = await view(request, *args, **kwargs)
+                render_now(response)
+            metrics.handler_time = time.perf_counter() - started
+            report(request, response, metrics)
+            return response
+
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if hasattr(request, "instrumentation"):
+            metrics = request.instrumentation
+            if metrics is None:
+                return view(request, *args, **kwargs)
+            metrics.view = name
+            started = time.perf_counter()
+            response = view(request, *args, **kwargs)
+            render_now(response)
+            metrics.handler_time = time.perf_counter() - started
+            return response
+
+        if not is_sampled():
+            return view(request, *args, **kwargs)
+        metrics = RequestMetrics()
+        metrics.view = name
+        started = time.perf_counter()
+        with collect(metrics):
+            response = view(request, *args, **kwargs)
+            render_now(response)
+        metrics.handler_time = time.perf_counter() - started
+        report(request, response, metrics)
+        return response
+
+    return wrapper
+
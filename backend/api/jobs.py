@@ -0,0 +1,222 @@
+# jobs.py
+"""
+Durable background jobs backed by the `Job` table.
+
+Request handlers only insert rows with `enqueue()`; `python manage.py
+runjobs` runs a pool of worker threads that claim due jobs, run them and
+delete them. Handlers are registered per kind with `@job_handler(kind)` and
+receive every job of a claimed batch at once, so side effects such as
+WebSocket fan-out are done in bulk.
+
+A batch whose handler raises is retried with exponential backoff up to
+`JOB_MAX_ATTEMPTS` times, then kept with status `failed` for inspection.
+Handlers whose side effects must not be repeated raise `BatchFailed` with
+the jobs that failed, and only those are retried.
+Jobs of a worker that died are claimed again after `JOB_LOCK_TIMEOUT`
+seconds, so handlers must tolerate running twice.
+"""
+import logging
+import random
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .broker import publish_message
+from .models import Job, Message
+from .serializers import MessageValuesSerializer
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+MESSAGE_CREATED = "message.created"
+
+
+class BatchFailed(Exception):
+    """
+    Raised by a handler when only some jobs of its batch failed. The other
+    jobs are done and are not run again.
+    """
+
+    def __init__(self, failed, error):
+        super().__init__(f"{type(error).__name__}: {error}")
+        self.failed = failed
+        self.error = error
+
+
+def job_handler(kind):
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload, run_after=None):
+    return Job.objects.create(kind=kind, payload=payload, run_after=run_after or timezone.now())
+
+
+async def aenqueue(kind, payload, run_after=None):
+    """
+    Asynchronous version of `enqueue`.
+    """
+    return await Job.objects.acreate(kind=kind, payload=payload, run_after=run_after or timezone.now())
+
+
+def enqueue_many(kind, payloads):
+    now = timezone.now()
+    return Job.objects.bulk_create([Job(kind=kind, payload=payload, run_after=now) for payload in payloads])
+
+
+def _due(now):
+    stale = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Q(status=Job.PENDING, run_after__lte=now) | Q(status=Job.RUNNING, locked_at__lt=stale)
+
+
+def claim(worker, batch_size=None, kinds=None):
+    """
+    Lock up to `batch_size` due jobs of a single kind for `worker` and
+    return them, oldest first. The kind is that of the oldest due job.
+    """
+    batch_size = batch_size or settings.JOB_BATCH_SIZE
+    now = timezone.now()
+    due = Job.objects.filter(_due(now))
+    if kinds:
+        due = due.filter(kind__in=kinds)
+    kind = due.order_by("run_after", "id").values_list("kind", flat=True).first()
+    if kind is None:
+        return []
+
+    token = f"{worker}:{uuid.uuid4().hex}"[:64]
+    with transaction.atomic():
+        # SKIP LOCKED lets workers claim disjoint batches on PostgreSQL; the
+        # UPDATE re-checks the filter, which is enough where it is ignored
+        ids = list(
+            due.filter(kind=kind).order_by("run_after", "id")
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)[:batch_size]
+        )
+        Job.objects.filter(_due(now), id__in=ids).update(
+            status=Job.RUNNING, locked_by=token, locked_at=now, attempts=F("attempts") + 1,
+        )
+    return list(Job.objects.filter(locked_by=token).order_by("run_after", "id"))
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait before the next attempt: exponential backoff capped at
+    `JOB_RETRY_BACKOFF_MAX`, with jitter so failed batches spread out.
+    """
+    delay = min(settings.JOB_RETRY_BACKOFF_MAX, settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_batch(jobs):
+    """
+    Run one claimed batch. Returns True when the handler succeeded.
+    """
+    kind = jobs[0].kind
+    try:
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise LookupError(f"No handler is registered for jobs of kind {kind!r}")
+        handler(jobs)
+    except Exception as error:
+        failed = jobs
+        if isinstance(error, BatchFailed):
+            failed, error = error.failed, error.error
+        logger.exception("%d of %d %s job(s) failed", len(failed), len(jobs), kind)
+        now = timezone.now()
+        for job in failed:
+            job.last_error = f"{type(error).__name__}: {error}"
+            job.locked_by = ""
+            job.locked_at = None
+            if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+                job.status = Job.FAILED
+            else:
+                job.status = Job.PENDING
+                job.run_after = now + timedelta(seconds=retry_delay(job.attempts))
+        Job.objects.bulk_update(failed, ["status", "run_after", "locked_by", "locked_at", "last_error"])
+        failed_ids = {job.id for job in failed}
+        Job.objects.filter(id__in=[job.id for job in jobs if job.id not in failed_ids]).delete()
+        return False
+
+    Job.objects.filter(id__in=[job.id for job in jobs]).delete()
+    return True
+
+
+def work(worker, batch_size=None, kinds=None):
+    """
+    Claim and run one batch. Returns the number of jobs it contained.
+    """
+    jobs = claim(worker, batch_size, kinds)
+    if jobs:
+        run_batch(jobs)
+    return len(jobs)
+
+
+def drain(worker="drain", batch_size=None, kinds=None):
+    """
+    Run batches until no job is due. Returns the number of jobs run.
+    """
+    total = 0
+    while True:
+        count = work(worker, batch_size, kinds)
+        if not count:
+            return total
+        total += count
+
+
+def queue_stats():
+    """
+    Depth and lag of the queue per kind. `lag_seconds` is how long the
+    oldest due job has been waiting for a worker.
+    """
+    now = timezone.now()
+    due = Q(status=Job.PENDING, run_after__lte=now)
+    rows = Job.objects.values("kind").annotate(
+        pending=Count("id", filter=Q(status=Job.PENDING)),
+        due=Count("id", filter=due),
+        running=Count("id", filter=Q(status=Job.RUNNING)),
+        failed=Count("id", filter=Q(status=Job.FAILED)),
+        oldest_due=Min("run_after", filter=due),
+    ).order_by("kind")
+
+    kinds = {}
+    for row in rows:
+        oldest_due = row.pop("oldest_due")
+        row["lag_seconds"] = (now - oldest_due).total_seconds() if oldest_due else 0.0
+        kinds[row.pop("kind")] = row
+    return {
+        "depth": sum(row["pending"] for row in kinds.values()),
+        "lag_seconds": max((row["lag_seconds"] for row in kinds.values()), default=0.0),
+        "kinds": kinds,
+    }
+
+
+@job_handler(MESSAGE_CREATED)
+def fan_out_messages(jobs):
+    """
+    Push new messages to the group's WebSocket subscribers, loading and
+    serializing the whole batch with one query. Only the jobs of messages
+    that could not be published are retried, so subscribers do not get the
+    others twice.
+    """
+    jobs_by_message = defaultdict(list)
+    for job in jobs:
+        jobs_by_message[job.payload["message_id"]].append(job)
+    # Messages deleted in the meantime, tombstones included, are skipped
+    messages = Message.objects.filter(id__in=list(jobs_by_message)).visible().order_by("created", "id")
+    failed, error = [], None
+    for data in MessageValuesSerializer(messages).data:
+        try:
+            publish_message(data["group"], data)
+        except Exception as publish_error:
+            failed.extend(jobs_by_message[data["id"]])
+            error = publish_error
+    if failed:
+        raise BatchFailed(failed, error) from error
@@ -0,0 +1,322 @@
+# loadtest.py
+"""
+Concurrent load tests for the chat API.
+
+`seed()` fills the database with a synthetic dataset and `run_scenario()`
+drives one endpoint from a pool of threads, each with its own test client
+and database connection. Every request is timed and its queries counted, so
+reports from different runs (or database backends) can be compared side by
+side. Run them with `python manage.py loadtest`, which works on a throwaway
+test database of whichever engine `DB_ENGINE` selects.
+
+`run_scenario` serves requests through the WSGI handler, one thread per
+concurrent client, like a threaded WSGI server. `run_scenario_asgi` sends
+the same requests through Django's ASGI application from a single event
+loop, like an ASGI server, so the two interfaces can be compared.
+"""
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.contrib.auth.hashers import make_password
+from django.core.asgi import get_asgi_application
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .authentication import get_token_for_user
+from .benchmarks import summarize
+from .models import Group, Message, User
+
+SEED_PASSWORD = "loadtest-password"
+
+Dataset = namedtuple("Dataset", "users groups")
+
+
+def seed(users, groups, participants, messages):
+    """
+    Create `users` users, `groups` groups hosted by the first users, each with
+    `participants` members and `messages` messages.
+
+    All users share one password so the hasher runs once instead of once
+    per row.
+    """
+    password = make_password(SEED_PASSWORD)
+    User.objects.bulk_create(
+        (User(email=f"load{i}@example.com", username=f"load {i}", password=password) for i in range(users)),
+        hashed_passwords=True,
+    )
+    accounts = list(User.objects.order_by("id"))
+
+    hosts = [accounts[i % len(accounts)] for i in range(groups)]
+    Group.objects.bulk_create(
+        Group(host=host, name=f"load group {i}") for i, host in enumerate(hosts)
+    )
+    rooms = list(Group.objects.order_by("id"))
+
+    Membership = Group.participants.through
+    members = {}
+    for i, group in enumerate(rooms):
+        ids = {group.host_id}
+        ids.update(accounts[(i + offset) % len(accounts)].id for offset in range(participants))
+        members[group.id] = sorted(ids)
+    Membership.objects.bulk_create(
+        (Membership(group_id=group_id, user_id=user_id) for group_id, ids in members.items() for user_id in ids),
+        batch_size=1000,
+    )
+
+    for group in rooms:
+        ids = members[group.id]
+        created = [Message(group=group, sender_id=ids[i % len(ids)], content=f"load message {i}") for i in range(messages)]
+        with transaction.atomic():
+            Message.assign_seqs(created)
+            Message.objects.bulk_create(created, batch_size=1000)
+        if created:
+            group.record_messages(created)
+
+    return Dataset(users=accounts, groups=rooms)
+
+
+class Scenario:
+    """
+    One endpoint under load. `request(client, i)` issues the i-th request and
+    returns the response. `user(i)`, when given, is the user it authenticates
+    as; `prepare(count)` runs once, untimed, before the requests.
+    """
+
+    def __init__(self, request, user=None, prepare=None):
+        self.request = request
+        self.user = user
+        self.prepare = prepare
+
+
+def build_scenarios(dataset):
+    users, groups = dataset.users, dataset.groups
+
+    def host(i):
+        return groups[i % len(groups)].host
+
+    def send_message(client, i):
+        group = groups[i % len(groups)]
+        return client.post(
+            reverse("send-message", args=[group.id]),
+            {"content": f"load test {i}"},
+            content_type="application/json",
+        )
+
+    def get_messages(client, i):
+        group = groups[i % len(groups)]
+        return client.get(reverse("get-group-messages", args=[group.id]))
+
+    def get_users(client, i):
+        return client.get(reverse("get-all-users"), {"limit": 50})
+
+    def add_members(client, i):
+        group = groups[i % len(groups)]
+        picked = random.Random(i).sample(users, min(5, len(users)))
+        return client.post(
+            reverse("add-members", args=[group.id]),
+            {"user_ids": [user.id for user in picked]},
+            content_type="application/json",
+        )
+
+    def token_obtain(client, i):
+        return client.post(
+            reverse("token_obtain_pair"),
+            {"email": users[i % len(users)].email, "password": SEED_PASSWORD},
+            content_type="application/json",
+        )
+
+    # Refresh tokens rotate and are blacklisted once used, so every request
+    # gets a token of its own
+    refresh_tokens = {}
+
+    def mint_refresh_tokens(count):
+        for i in range(count):
+            refresh_tokens[i] = str(get_token_for_user(users[i % len(users)]))
+
+    def token_refresh(client, i):
+        return client.post(
+            reverse("token_refresh"), {"refresh": refresh_tokens.pop(i)}, content_type="application/json"
+        )
+
+    return {
+        "send_message": Scenario(send_message, user=host),
+        "get_messages": Scenario(get_messages, user=host),
+        "get_users": Scenario(get_users, user=lambda i: users[i % len(users)]),
+        "add_members": Scenario(add_members, user=host),
+        "token_obtain": Scenario(token_obtain),
+        "token_refresh": Scenario(token_refresh, prepare=mint_refresh_tokens),
+    }
+
+
+def authorization(user):
+    return f"JWT {get_token_for_user(user).access_token}"
+
+
+def run_scenario(scenario, requests, concurrency):
+    """
+    Issue `requests` requests from `concurrency` threads and summarize
+    latency, throughput, queries per request and failures.
+    """
+    if scenario.prepare is not None:
+        scenario.prepare(requests)
+    headers = {}
+    if scenario.user is not None:
+        headers = {i: authorization(scenario.user(i)) for i in range(requests)}
+
+    local = threading.local()
+    results = [None] * requests
+
+    def worker(i):
+        if not hasattr(local, "client"):
+            # Server errors are part of the result, not a reason to stop
+            local.client = Client(raise_request_exception=False)
+        if i in headers:
+            local.client.defaults["HTTP_AUTHORIZATION"] = headers[i]
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = scenario.request(local.client, i)
+            elapsed = time.perf_counter() - started
+        results[i] = (elapsed, len(queries), response.status_code)
+
+    # Threads own their database connections. The barrier makes every
+    # thread take exactly one of the closing tasks, so none stays open when
+    # the test database is destroyed.
+    barrier = threading.Barrier(concurrency)
+
+    def close_connection(_):
+        barrier.wait()
+        connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(requests)))
+        wall = time.perf_counter() - started
+        list(pool.map(close_connection, range(concurrency)))
+
+    return _summarize_results(results, wall)
+
+
+def _summarize_results(results, wall):
+    latencies = [elapsed for elapsed, _, _ in results]
+    query_counts = [count for _, count, _ in results]
+    errors = {}
+    for _, _, code in results:
+        if code >= 400:
+            errors[str(code)] = errors.get(str(code), 0) + 1
+
+    summary = {
+        "latency": summarize(latencies),
+        "throughput_rps": len(results) / wall,
+        "errors": errors,
+    }
+    if all(count is not None for count in query_counts):
+        summary["queries_per_request"] = {
+            "mean": statistics.fmean(query_counts),
+            "max": max(query_counts),
+        }
+    return summary
+
+
+AsgiResponse = namedtuple("AsgiResponse", "status_code content")
+
+
+class AsgiClient:
+    """
+    Minimal HTTP client for an ASGI application, with the subset of the
+    test client's interface the scenarios use.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.defaults = {}
+
+    async def get(self, path, data=None):
+        return await self.request("GET", path, urlencode(data or {}), b"")
+
+    async def post(self, path, data=None, content_type="application/json"):
+        return await self.request("POST", path, "", json.dumps(data).encode(), content_type)
+
+    async def request(self, method, path, query_string, body, content_type=None):
+        headers = [(b"host", b"testserver")]
+        if content_type:
+            headers.append((b"content-type", content_type.encode()))
+            headers.append((b"content-length", str(len(body)).encode()))
+        if "HTTP_AUTHORIZATION" in self.defaults:
+            headers.append((b"authorization", self.defaults["HTTP_AUTHORIZATION"].encode()))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query_string.encode(),
+            "headers": headers,
+            "server": ("testserver", 80),
+            "client": ("127.0.0.1", 0),
+        }
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        status_code = None
+        content = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # Django listens for a disconnect while streaming; never sent
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                content.append(message.get("body", b""))
+
+        await self.application(scope, receive, send)
+        return AsgiResponse(status_code, b"".join(content))
+
+
+def run_scenario_asgi(scenario, requests, concurrency):
+    """
+    Issue `requests` requests through the ASGI application with at most
+    `concurrency` in flight and summarize them like `run_scenario`.
+
+    Queries per request are not reported: the async ORM runs queries on
+    short-lived threads that cannot be observed from here.
+    """
+    if scenario.prepare is not None:
+        scenario.prepare(requests)
+    headers = {}
+    if scenario.user is not None:
+        headers = {i: authorization(scenario.user(i)) for i in range(requests)}
+    application = get_asgi_application()
+    results = [None] * requests
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            client = AsgiClient(application)
+            if i in headers:
+                client.defaults["HTTP_AUTHORIZATION"] = headers[i]
+            async with semaphore:
+                started = time.perf_counter()
+                response = await scenario.request(client, i)
+                results[i] = (time.perf_counter() - started, None, response.status_code)
+
+        await asyncio.gather(*(one(i) for i in range(requests)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    wall = time.perf_counter() - started
+    return _summarize_results(results, wall)
@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import archive_messages
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming message partitions and move months of history older than the hot window "
+        "into compressed per-group archive files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hot-months", type=int,
+            help="Whole months kept in the database (default: MESSAGE_HOT_MONTHS).",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Messages deleted per statement.")
+
+    def handle(self, *args, **options):
+        if options["hot_months"] is not None and options["hot_months"] < 0:
+            raise CommandError("--hot-months cannot be negative.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        summary = archive_messages(options["hot_months"], options["batch_size"])
+        self.stdout.write(json.dumps(summary, indent=2))
@@ -0,0 +1,71 @@
+import json
+import platform
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.benchmarks import throwaway_database
+from api.loadtest import build_scenarios, run_scenario, run_scenario_asgi, seed
+
+SCENARIOS = ("send_message", "get_messages", "get_users", "add_members", "token_obtain", "token_refresh")
+INTERFACES = {"wsgi": run_scenario, "asgi": run_scenario_asgi}
+
+
+class Command(BaseCommand):
+    help = "Load-test the chat API at a fixed concurrency against a throwaway test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)}).")
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--participants", type=int, default=20, help="Members per group.")
+        parser.add_argument("--messages", type=int, default=500, help="Messages per group.")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per scenario.")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--interface", choices=["wsgi", "asgi", "both"], default="wsgi",
+            help="Serve the requests through the WSGI handler, the ASGI application, or each in turn.",
+        )
+        parser.add_argument("--output", help="Write the report as JSON to this file.")
+
+    def handle(self, *args, **options):
+        names = options["scenarios"] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        if options["users"] < 1 or options["groups"] < 1:
+            raise CommandError("--users and --groups must be at least 1.")
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1.")
+
+        interfaces = list(INTERFACES) if options["interface"] == "both" else [options["interface"]]
+        dataset_options = {key: options[key] for key in ("users", "groups", "participants", "messages")}
+        with throwaway_database():
+            started = time.perf_counter()
+            dataset = seed(**dataset_options)
+            seed_seconds = time.perf_counter() - started
+            scenarios = build_scenarios(dataset)
+            results = {
+                interface: {
+                    name: INTERFACES[interface](scenarios[name], options["requests"], options["concurrency"])
+                    for name in names
+                }
+                for interface in interfaces
+            }
+
+        report = json.dumps(
+            {
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "dataset": dict(dataset_options, seed_seconds=seed_seconds),
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "scenarios": results,
+            },
+            indent=2,
+        )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(report)
+        self.stdout.write(report)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.revocation import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete expired refresh tokens and their blacklist entries in bounded batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Tokens deleted per statement.")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+        parser.add_argument("--max-batches", type=int, help="Stop after this many batches.")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        deleted = purge_expired_tokens(options["batch_size"], options["pause"], options["max_batches"])
+        self.stdout.write(f"Deleted {deleted} expired token(s).")
@@ -0,0 +1,77 @@
+import logging
+import os
+import signal
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.broker import get_broker
+from api.jobs import MESSAGE_CREATED, drain, queue_stats, work
+
+logger = logging.getLogger("api.jobs")
+
+
+class Command(BaseCommand):
+    help = "Run a pool of background job workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Worker threads.")
+        parser.add_argument("--batch-size", type=int, default=settings.JOB_BATCH_SIZE)
+        parser.add_argument("--poll-interval", type=float, default=settings.JOB_POLL_INTERVAL,
+                            help="Seconds an idle worker waits before looking for jobs again.")
+        parser.add_argument("--kind", action="append", dest="kinds", help="Only run jobs of this kind (repeatable).")
+        parser.add_argument("--once", action="store_true", help="Run the jobs that are due, then exit.")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--workers and --batch-size must be at least 1.")
+        delivers = not options["kinds"] or MESSAGE_CREATED in options["kinds"]
+        if delivers and not get_broker().cross_process:
+            raise CommandError(
+                f"{type(get_broker()).__name__} cannot reach the WebSocket subscribers of other processes; "
+                "set CHAT_BROKER_BACKEND to a cross-process broker such as api.broker.RedisBroker, "
+                f"or leave {MESSAGE_CREATED} jobs out with --kind."
+            )
+        name = f"{socket.gethostname()}:{os.getpid()}"
+
+        if options["once"]:
+            count = drain(name, options["batch_size"], options["kinds"])
+            self.stdout.write(f"Ran {count} job(s).")
+            return
+
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+
+        def run(worker):
+            try:
+                while not stop.is_set():
+                    try:
+                        count = work(worker, options["batch_size"], options["kinds"])
+                    except Exception:
+                        # Usually the database going away; keep the worker alive
+                        logger.exception("Worker %s could not claim jobs", worker)
+                        count = 0
+                    if not count:
+                        stop.wait(options["poll_interval"])
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=run, args=(f"{name}:{i}",), name=f"job-worker-{i}")
+            for i in range(options["workers"])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Started {len(threads)} job worker(s); queue: {queue_stats()}")
+        try:
+            # A timeout keeps the main thread responsive to signals
+            while not stop.wait(60):
+                logger.info("Job queue: %s", queue_stats())
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,196 @@
+# membership.py
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed
+
+from .models import Group, User
+
+# Outcome of a batched membership change, as sorted lists of user ids
+MembershipChange = namedtuple("MembershipChange", "changed unchanged missing")
+
+
+class MembershipCache:
+    """
+    Per-process LRU cache of `(user_id, group_id) -> is member` answers with
+    a time-to-live. Entries are invalidated from `api.signals` when a
+    group's participants or host change, so the TTL only bounds staleness
+    across processes. The keys are also indexed by user and by group, so
+    invalidation only visits the entries it drops.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._by_user = defaultdict(set)
+        self._by_group = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, group_id):
+        key = (user_id, group_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+        return None
+
+    def set(self, user_id, group_id, value):
+        if self.ttl <= 0:
+            return
+        key = (user_id, group_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._by_user[user_id].add(key)
+            self._by_group[group_id].add(key)
+            while len(self._entries) > self.max_size:
+                oldest, _ = self._entries.popitem(last=False)
+                self._unindex(oldest)
+
+    def _unindex(self, key):
+        for index, value in ((self._by_user, key[0]), (self._by_group, key[1])):
+            keys = index.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[value]
+
+    def invalidate(self, user_ids=None, group_ids=None):
+        """
+        Drop the entries matching the given users and/or groups.
+        """
+        if user_ids is None and group_ids is None:
+            self.clear()
+            return
+        user_ids = set(user_ids) if user_ids is not None else None
+        group_ids = set(group_ids) if group_ids is not None else None
+        with self._lock:
+            # Walk the keys of the smaller side and filter on the other
+            if group_ids is not None and (user_ids is None or len(group_ids) <= len(user_ids)):
+                keys = [key for group_id in group_ids for key in self._by_group.get(group_id, ())]
+                if user_ids is not None:
+                    keys = [key for key in keys if key[0] in user_ids]
+            else:
+                keys = [key for user_id in user_ids for key in self._by_user.get(user_id, ())]
+                if group_ids is not None:
+                    keys = [key for key in keys if key[1] in group_ids]
+            for key in keys:
+                del self._entries[key]
+                self._unindex(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self._by_group.clear()
+
+
+membership_cache = MembershipCache(
+    ttl=getattr(settings, "MEMBERSHIP_CACHE_TTL", 300),
+    max_size=getattr(settings, "MEMBERSHIP_CACHE_SIZE", 100000),
+)
+
+
+def _membership_query(user_id, group_id):
+    # Always asked of the primary: a lagging replica would deny a member
+    # who was just added, and the answer is cached
+    using = router.db_for_write(Group)
+    participant = Group.participants.through.objects.using(using).filter(group_id=group_id, user_id=user_id)
+    return Group.objects.using(using).filter(
+        Q(host_id=user_id) | Q(id__in=participant.values("group_id")), id=group_id
+    )
+
+
+def is_member(user_id, group_id):
+    """
+    Return True when the user hosts or participates in the group.
+    """
+    cached = membership_cache.get(user_id, group_id)
+    if cached is not None:
+        return cached
+
+    member = _membership_query(user_id, group_id).exists()
+    membership_cache.set(user_id, group_id, member)
+    return member
+
+
+async def ais_member(user_id, group_id):
+    """
+    Asynchronous version of `is_member`.
+    """
+    cached = membership_cache.get(user_id, group_id)
+    if cached is not None:
+        return cached
+
+    member = await _membership_query(user_id, group_id).aexists()
+    membership_cache.set(user_id, group_id, member)
+    return member
+
+
+def _send_participants_changed(group, action, pk_set, using):
+    # Bulk writes bypass the related manager, so send the signals it would
+    # have sent; the membership and response caches listen to them
+    m2m_changed.send(
+        sender=Group.participants.through, instance=group, action=action,
+        reverse=False, model=User, pk_set=pk_set, using=using,
+    )
+
+
+def _split_user_ids(group, user_ids, using):
+    """
+    Return the requested ids that exist as users, those that are already
+    participants of the group, and those that do not exist.
+    """
+    requested = set(user_ids)
+    existing = set(User.objects.using(using).filter(id__in=requested).values_list("id", flat=True))
+    present = set(
+        Group.participants.through.objects.using(using)
+        .filter(group_id=group.id, user_id__in=existing)
+        .values_list("user_id", flat=True)
+    )
+    return existing, present, requested - existing
+
+
+def add_participants(group, user_ids):
+    """
+    Add the users to the group's participants with one bulk insert into the
+    through table. `changed` lists the users that were added, `unchanged`
+    those that already participated.
+    """
+    Membership = Group.participants.through
+    using = router.db_for_write(Membership, instance=group)
+    with transaction.atomic(using=using):
+        existing, present, missing = _split_user_ids(group, user_ids, using)
+        added = existing - present
+        if added:
+            _send_participants_changed(group, "pre_add", added, using)
+            Membership.objects.using(using).bulk_create(
+                [Membership(group_id=group.id, user_id=user_id) for user_id in added],
+                ignore_conflicts=True,
+            )
+            _send_participants_changed(group, "post_add", added, using)
+    return MembershipChange(sorted(added), sorted(present), sorted(missing))
+
+
+def remove_participants(group, user_ids):
+    """
+    Remove the users from the group's participants with one DELETE.
+    `changed` lists the users that were removed, `unchanged` those that
+    did not participate.
+    """
+    Membership = Group.participants.through
+    using = router.db_for_write(Membership, instance=group)
+    with transaction.atomic(using=using):
+        existing, present, missing = _split_user_ids(group, user_ids, using)
+        if present:
+            _send_participants_changed(group, "pre_remove", present, using)
+            Membership.objects.using(using).filter(group_id=group.id, user_id__in=present).delete()
+            _send_participants_changed(group, "post_remove", present, using)
+    return MembershipChange(sorted(present), sorted(existing - present), sorted(missing))
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.3 on 2026-10-17 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['group', 'created', 'id'], name='message_group_created_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.1.3 on 2026-10-17 03:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_group_counters(apps, schema_editor):
+    Group = apps.get_model('api', 'Group')
+    Message = apps.get_model('api', 'Message')
+    for group in Group.objects.all().iterator():
+        messages = Message.objects.filter(group=group)
+        Group.objects.filter(pk=group.pk).update(
+            message_count=messages.count(),
+            last_message=messages.order_by('-created', '-id').values('id')[:1],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_message_group_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.message'),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='GroupReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_count', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='api.group')),
+                ('last_read_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.message')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='groupreadstate',
+            constraint=models.UniqueConstraint(fields=('user', 'group'), name='unique_read_state_per_user_group'),
+        ),
+        migrations.RunPython(backfill_group_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+from django.db import migrations
+
+SQLITE_FTS = [
+    """
+    CREATE VIRTUAL TABLE api_message_fts USING fts5(
+        content, content='api_message', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER api_message_fts_insert AFTER INSERT ON api_message BEGIN
+        INSERT INTO api_message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER api_message_fts_delete AFTER DELETE ON api_message BEGIN
+        INSERT INTO api_message_fts(api_message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER api_message_fts_update AFTER UPDATE OF content ON api_message BEGIN
+        INSERT INTO api_message_fts(api_message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO api_message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    "INSERT INTO api_message_fts(api_message_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_REVERSE = [
+    "DROP TRIGGER IF EXISTS api_message_fts_update",
+    "DROP TRIGGER IF EXISTS api_message_fts_delete",
+    "DROP TRIGGER IF EXISTS api_message_fts_insert",
+    "DROP TABLE IF EXISTS api_message_fts",
+]
+
+
+def postgres_search_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    # Must match the vector built in api.search for the planner to use it
+    return GinIndex(SearchVector('content', config='english'), name='message_content_search_idx')
+
+
+def create_search_index(apps, schema_editor):
+    Message = apps.get_model('api', 'Message')
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.add_index(Message, postgres_search_index())
+    elif vendor == 'sqlite':
+        for statement in SQLITE_FTS:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    Message = apps.get_model('api', 'Message')
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.remove_index(Message, postgres_search_index())
+    elif vendor == 'sqlite':
+        for statement in SQLITE_FTS_REVERSE:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_group_counters_and_read_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+
+# Match the UPPER(<column>::text) LIKE UPPER('prefix%') that Django emits for
+# istartswith on PostgreSQL; text_pattern_ops makes LIKE prefixes indexable
+# whatever the database collation.
+POSTGRES_INDEXES = [
+    "CREATE INDEX user_username_prefix_idx ON api_user (UPPER(username::text) text_pattern_ops)",
+    "CREATE INDEX user_email_prefix_idx ON api_user (UPPER(email::text) text_pattern_ops)",
+]
+
+SQLITE_INDEXES = [
+    "CREATE INDEX user_username_prefix_idx ON api_user (username COLLATE NOCASE)",
+    "CREATE INDEX user_email_prefix_idx ON api_user (email COLLATE NOCASE)",
+]
+
+DROP_INDEXES = [
+    "DROP INDEX IF EXISTS user_username_prefix_idx",
+    "DROP INDEX IF EXISTS user_email_prefix_idx",
+]
+
+
+def create_prefix_indexes(apps, schema_editor):
+    statements = {
+        'postgresql': POSTGRES_INDEXES,
+        'sqlite': SQLITE_INDEXES,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        for statement in DROP_INDEXES:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_message_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index the expiry of simplejwt's outstanding tokens so `purgetokens` finds
+    expired rows without scanning the table. The model belongs to a
+    third-party app, hence plain SQL.
+    """
+
+    dependencies = [
+        ('api', '0006_job_queue'),
+        ('token_blacklist', '0011_linearizes_history'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX outstanding_token_expires_idx ON token_blacklist_outstandingtoken (expires_at, id)',
+            reverse_sql='DROP INDEX outstanding_token_expires_idx',
+        ),
+    ]
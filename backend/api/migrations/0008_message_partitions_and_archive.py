@@ -0,0 +1,160 @@
+# Generated by Django 4.1.3 on 2026-10-17 03:55
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Partitions created ahead of time; api.partitions keeps them coming
+MONTHS_AHEAD = 2
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def capture_schema(cursor, table):
+    """
+    Definitions of the secondary indexes and foreign keys of `table`, which
+    have to move to the table that replaces it.
+    """
+    cursor.execute(
+        """
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s
+        AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)
+        """,
+        [table, table],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [table])
+    primary_key = cursor.fetchone()[0]
+    return indexes, foreign_keys, primary_key
+
+
+def replace_table(schema_editor, Message, create, partition):
+    """
+    Move the rows of the message table into a new table made by `create`,
+    then give the new table the old one's name, indexes and foreign keys.
+    """
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    table = Message._meta.db_table
+    old = f"{table}_old"
+    columns = ", ".join(quote(field.column) for field in Message._meta.local_concrete_fields)
+
+    with connection.cursor() as cursor:
+        indexes, foreign_keys, primary_key = capture_schema(cursor, table)
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0), MIN(created) FROM {quote(table)}")
+        max_id, oldest = cursor.fetchone()
+
+    # Index names are unique per schema, so free them for the new table
+    for name, _ in indexes:
+        schema_editor.execute(f"DROP INDEX {quote(name)}")
+    schema_editor.execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(old)}")
+    schema_editor.execute(f"ALTER TABLE {quote(old)} RENAME CONSTRAINT {quote(primary_key)} TO {quote(old + '_pkey')}")
+    schema_editor.execute(f"ALTER TABLE {quote(old)} ALTER COLUMN id DROP IDENTITY IF EXISTS")
+    schema_editor.execute(f"ALTER TABLE {quote(old)} ALTER COLUMN id DROP DEFAULT")
+    schema_editor.execute(f"DROP SEQUENCE IF EXISTS {quote(table + '_id_seq')}")
+
+    create(schema_editor, Message)
+    if partition:
+        schema_editor.execute(f"CREATE TABLE {quote(table + '_default')} PARTITION OF {quote(table)} DEFAULT")
+        month = month_start(oldest) if oldest else month_start(datetime.now(timezone.utc))
+        last = add_months(month_start(datetime.now(timezone.utc)), MONTHS_AHEAD)
+        while month <= last:
+            schema_editor.execute(
+                f"CREATE TABLE {quote(f'{table}_p{month:%Y%m}')} PARTITION OF {quote(table)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [month, add_months(month, 1)],
+            )
+            month = add_months(month, 1)
+
+    schema_editor.execute(f"INSERT INTO {quote(table)} ({columns}) SELECT {columns} FROM {quote(old)}")
+    schema_editor.execute(
+        "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, %s)", [table, max(max_id, 1), max_id > 0]
+    )
+    schema_editor.execute(f"DROP TABLE {quote(old)}")
+    for _, definition in indexes:
+        schema_editor.execute(definition)
+    for name, definition in foreign_keys:
+        schema_editor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}")
+
+
+def column_definitions(schema_editor, Message):
+    definitions = []
+    for field in Message._meta.local_concrete_fields:
+        null = "" if field.null else " NOT NULL"
+        definitions.append(f"{schema_editor.quote_name(field.column)} {field.db_type(schema_editor.connection)}{null}")
+    return definitions
+
+
+def create_partitioned_table(schema_editor, Message):
+    # The partition key must be part of the primary key, so ids are only
+    # unique through their sequence
+    table = Message._meta.db_table
+    quote = schema_editor.quote_name
+    sequence = quote(f"{table}_id_seq")
+    schema_editor.execute(f"CREATE SEQUENCE {sequence}")
+    schema_editor.execute(
+        f"CREATE TABLE {quote(table)} ({', '.join(column_definitions(schema_editor, Message))}, "
+        f"PRIMARY KEY (id, created)) PARTITION BY RANGE (created)"
+    )
+    schema_editor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+    schema_editor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.id")
+
+
+def create_plain_table(schema_editor, Message):
+    table = Message._meta.db_table
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        f"CREATE TABLE {quote(table)} ({', '.join(column_definitions(schema_editor, Message))}, PRIMARY KEY (id))"
+    )
+    schema_editor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY")
+
+
+def partition_messages(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        replace_table(schema_editor, apps.get_model('api', 'Message'), create_partitioned_table, partition=True)
+
+
+def unpartition_messages(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        replace_table(schema_editor, apps.get_model('api', 'Message'), create_plain_table, partition=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_outstanding_token_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='archived_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='group',
+            name='last_message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.message'),
+        ),
+        migrations.AlterField(
+            model_name='groupreadstate',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.message'),
+        ),
+        # Monthly range partitions of the message table on PostgreSQL
+        migrations.RunPython(partition_messages, unpartition_messages),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.1.3 on 2026-10-17 04:09
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+search_index = import_module('api.migrations.0004_message_search_index')
+
+
+def number_messages(apps, schema_editor):
+    """
+    Give the existing messages of each group sequence numbers in the order
+    they were sent, as if each had been inserted once.
+    """
+    Group = apps.get_model('api', 'Group')
+    Message = apps.get_model('api', 'Message')
+    for group_id in Group.objects.values_list('id', flat=True).iterator():
+        ids = Message.objects.filter(group_id=group_id).order_by('created', 'id').values_list('id', flat=True)
+        seq = 0
+        batch = []
+        for pk in ids.iterator(chunk_size=BATCH_SIZE):
+            seq += 1
+            batch.append(Message(pk=pk, seq=seq))
+            if len(batch) == BATCH_SIZE:
+                Message.objects.bulk_update(batch, ['seq'])
+                batch = []
+        Message.objects.bulk_update(batch, ['seq'])
+        Group.objects.filter(id=group_id).update(change_seq=seq)
+
+
+def restore_search_triggers(apps, schema_editor):
+    # SQLite adds the columns by rebuilding the message table, which drops
+    # the triggers that keep the full-text index in sync
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in search_index.SQLITE_FTS_REVERSE[:3] + search_index.SQLITE_FTS[1:]:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_message_partitions_and_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='group',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='pruned_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='deleted',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(number_messages, migrations.RunPython.noop),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['group', 'seq'], name='message_group_seq_idx'),
+        ),
+    ]
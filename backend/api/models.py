@@ -1,5 +1,6 @@
-from django.db import models
-from django.contrib.auth.hashers import make_password
+from django.db import models, router, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.validators import UnicodeUsernameValidator
@@ -22,6 +23,36 @@ class CustomUserManager(BaseUserManager):
         user.save()
         return user
 
+    def bulk_create(self, objs, *args, hashed_passwords=False, **kwargs):
+        """
+        Insert users in bulk, hashing the raw passwords that were assigned
+        to them. Pass `hashed_passwords=True` when the passwords already are
+        hashes, e.g. from `make_password` or an import.
+        """
+        objs = list(objs)
+        if not hashed_passwords:
+            for user in objs:
+                user.hash_pending_password()
+        created = super().bulk_create(objs, *args, **kwargs)
+        for user in objs:
+            user.mark_password_stored()
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        """
+        Update users in bulk. Rows whose password was left untouched never go
+        through the (deliberately slow) password hasher.
+        """
+        objs = list(objs)
+        if "password" in fields:
+            for user in objs:
+                user.hash_pending_password()
+        updated = super().bulk_update(objs, fields, *args, **kwargs)
+        if "password" in fields:
+            for user in objs:
+                user.mark_password_stored()
+        return updated
+
     def create_superuser(self, email, password, **extra_fields):
         """
         Create and save a SuperUser with the given email and password.
@@ -34,7 +65,7 @@ class CustomUserManager(BaseUserManager):
             raise ValueError("Superuser must have is_staff=True.")
         if extra_fields.get("is_superuser") is not True:
             raise ValueError("Superuser must have is_superuser=True.")
-        return self.create_user(email, make_password(password), **extra_fields)
+        return self.create_user(email, password, **extra_fields)
 
 
 class MyValidator(UnicodeUsernameValidator):
@@ -84,9 +115,38 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    # Password value as last loaded from or written to the database
+    _stored_password = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.mark_password_stored()
+        return instance
+
+    def hash_pending_password(self):
+        """
+        Hash `password` if a raw value was assigned to it since the user was
+        loaded. Values set through `set_password` are already hashed.
+        """
+        if "password" not in self.__dict__ or self._password is not None:
+            return
+        # An empty password stays unusable, as Django stores it
+        if self.password and self.password != self._stored_password:
+            self.set_password(self.password)
+
+    def mark_password_stored(self):
+        self._stored_password = self.__dict__.get("password")
+        self._password = None
+
     def save(self, *args, **kwargs):
-        self.password = make_password(self.password)
+        update_fields = kwargs.get("update_fields")
+        writes_password = update_fields is None or "password" in update_fields
+        if writes_password:
+            self.hash_pending_password()
         super(User, self).save(*args, **kwargs)
+        if writes_password:
+            self.mark_password_stored()
 
 
 class Group(models.Model):
@@ -94,6 +154,18 @@ class Group(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     participants = models.ManyToManyField(User,related_name='participants',blank=True)
+    # Denormalized from Message so the inbox never has to scan history.
+    # No database constraint: a partitioned message table has no unique id.
+    last_message = models.ForeignKey(
+        'Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_constraint=False
+    )
+    message_count = models.PositiveIntegerField(default=0)
+    # Messages created before this moved to the archive, see api.archive
+    archived_until = models.DateTimeField(null=True, blank=True)
+    # Last change sequence number issued to the group's messages, and the
+    # highest one whose change left the table (see api.changes)
+    change_seq = models.PositiveBigIntegerField(default=0)
+    pruned_seq = models.PositiveBigIntegerField(default=0)
     updated = models.DateTimeField(auto_now=True)#will be updated always when ever there is a change
     created = models.DateTimeField(auto_now_add=True)#now_add will only be created at the time of creation
 
@@ -104,6 +176,63 @@ class Group(models.Model):
     def __str__(self):
         return self.name
 
+    def _message_counters(self, messages):
+        latest_id = max(message.id for message in messages)
+        return {
+            "message_count": F('message_count') + len(messages),
+            "last_message": Case(
+                When(Q(last_message__isnull=True) | Q(last_message__lt=latest_id), then=Value(latest_id)),
+                default=F('last_message'),
+                output_field=models.BigIntegerField(),
+            ),
+            "updated": timezone.now(),
+        }
+
+    def record_messages(self, messages):
+        """
+        Update `message_count` and `last_message` after `messages` were
+        stored, with a single UPDATE that is safe under concurrent senders.
+        """
+        if not messages:
+            return
+        Group.objects.filter(pk=self.pk).update(**self._message_counters(messages))
+
+    async def arecord_messages(self, messages):
+        """
+        Asynchronous version of `record_messages`.
+        """
+        if not messages:
+            return
+        await Group.objects.filter(pk=self.pk).aupdate(**self._message_counters(messages))
+
+    @staticmethod
+    def reserve_change_seqs(group_id, count):
+        """
+        Reserve `count` change sequence numbers of a group and return the
+        last one. Call it in the transaction that writes the changes: the
+        UPDATE locks the group row until commit, so the changes of a group
+        commit in sequence order.
+        """
+        groups = Group.objects.using(router.db_for_write(Group)).filter(pk=group_id)
+        groups.update(change_seq=F('change_seq') + count)
+        return groups.values_list('change_seq', flat=True).get()
+
+
+class MessageQuerySet(models.QuerySet):
+    def for_listing(self):
+        """
+        Join each message's sender so serializing a page costs one query
+        instead of one extra query per message.
+        """
+        return self.select_related('sender')
+
+    def visible(self):
+        """
+        Leave out deleted messages, which stay behind as tombstones for the
+        change feed.
+        """
+        return self.filter(deleted=None)
+
 
 class Message(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE)
@@ -111,10 +240,122 @@ class Message(models.Model):
     content = models.TextField()
     updated = models.DateTimeField(auto_now=True)#will be updated always when ever there is a change
     created = models.DateTimeField(auto_now_add=True)#now_add will only be created at the time of creation
+    # Position of the message's latest change in its group, see api.changes
+    seq = models.PositiveBigIntegerField(default=0)
+    # Set when the message is deleted; its content is cleared
+    deleted = models.DateTimeField(null=True, blank=True)
     # likes = models.ManyToManyField(User, related_name='liked_messages', blank=True)
 
+    objects = MessageQuerySet.as_manager()
+
     class Meta:
         ordering =['-updated','-created']#-makes the order desc of those fields
+        indexes = [
+            # Backs keyset pagination of a group's history on (created, id)
+            models.Index(fields=['group', 'created', 'id'], name='message_group_created_idx'),
+            # Backs the change feed of a group
+            models.Index(fields=['group', 'seq'], name='message_group_seq_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username}: {self.content[:20]}"
+
+    @staticmethod
+    def assign_seqs(messages):
+        """
+        Give each of `messages` the next change sequence number of its
+        group, in list order. Must run in the transaction that saves them.
+        """
+        by_group = {}
+        for message in messages:
+            by_group.setdefault(message.group_id, []).append(message)
+        for group_id, changed in by_group.items():
+            last = Group.reserve_change_seqs(group_id, len(changed))
+            for seq, message in enumerate(changed, start=last - len(changed) + 1):
+                message.seq = seq
+
+    def save(self, *args, **kwargs):
+        # Every insert or edit is a change; bulk inserts call assign_seqs
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'seq'}
+        with transaction.atomic(using=router.db_for_write(Message)):
+            Message.assign_seqs([self])
+            super().save(*args, **kwargs)
+
+    def soft_delete(self):
+        """
+        Replace the message with a tombstone. Clients that synced it learn
+        about the deletion from the change feed.
+        """
+        self.content = ''
+        self.deleted = timezone.now()
+        with transaction.atomic(using=router.db_for_write(Message)):
+            self.save(update_fields=['content', 'deleted', 'updated'])
+            # `message_count` only counts messages that are still there, and
+            # neither do the read counts of readers who got past this one
+            Group.objects.filter(pk=self.group_id, message_count__gt=0).update(message_count=F('message_count') - 1)
+            GroupReadState.objects.filter(
+                Q(last_read_message__created__gt=self.created)
+                | Q(last_read_message__created=self.created, last_read_message__id__gte=self.id),
+                group_id=self.group_id,
+                read_count__gt=0,
+            ).update(read_count=F('read_count') - 1)
+
+
+class GroupReadState(models.Model):
+    """
+    How far a user has read in a group.
+
+    `read_count` is the group's `message_count` up to `last_read_message`,
+    so the unread count is `group.message_count - read_count`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='read_states')
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='read_states')
+    # May point to an archived message
+    last_read_message = models.ForeignKey(
+        Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_constraint=False
+    )
+    read_count = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'group'], name='unique_read_state_per_user_group'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} read {self.group_id} up to {self.last_read_message_id}"
+
+
+class Job(models.Model):
+    """
+    Background job stored in the database; see `api.jobs`.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after', 'id'], name='job_status_run_after_idx'),
+            models.Index(fields=['locked_by'], name='job_locked_by_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
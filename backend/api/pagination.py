@@ -0,0 +1,136 @@
+# pagination.py
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a cursor or page size sent by the client cannot be decoded.
+    """
+
+
+def encode_values(*values):
+    """
+    Encode a keyset position as an opaque, url-safe cursor string.
+    """
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_values(cursor, count):
+    """
+    Decode a cursor produced by `encode_values` holding `count` values.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != count:
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def encode_cursor(created, pk):
+    """
+    Encode a `(created, id)` position as an opaque cursor.
+    """
+    return encode_values(created.isoformat(), pk)
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by `encode_cursor` back into `(created, id)`.
+    """
+    created, pk = decode_values(cursor, 2)
+    try:
+        created = parse_datetime(created) if isinstance(created, str) else None
+    except ValueError:
+        created = None
+    if created is None or not isinstance(pk, int):
+        raise InvalidCursor("Invalid cursor")
+    return created, pk
+
+
+def get_page_size(params, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Read the `limit` query parameter, clamped to `maximum`.
+    """
+    try:
+        limit = int(params.get("limit", default))
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor("limit must be an integer") from e
+    if limit < 1:
+        raise InvalidCursor("limit must be a positive integer")
+    return min(limit, maximum)
+
+
+async def apaginate_by_created(queryset, params, extend=None):
+    """
+    Return one page of `queryset`, a `.values()` queryset that includes
+    `created` and `id`, using keyset pagination on `(created, id)`.
+
+    Pages are always returned newest first. `before` walks back into older
+    history and `after` walks forward towards newer rows, so each page is a
+    single index range scan no matter how deep the history goes.
+
+    Returns a tuple `(rows, next_cursor, previous_cursor)`; `next_cursor` is
+    passed as `before` to fetch older rows and `previous_cursor` as `after`
+    to fetch newer ones.
+
+    `extend(rows, limit, before, after)`, a synchronous function, may add
+    rows stored elsewhere (see `api.archive`). It receives up to
+    `limit + 1` rows in fetch order, newest first unless paging with
+    `after`, and returns up to `limit + 1` rows in the same order.
+    """
+    queryset, limit, before, after = _keyset_window(queryset, params)
+    rows = [row async for row in queryset[: limit + 1]]
+    if extend is not None:
+        rows = await sync_to_async(extend)(rows, limit, before, after)
+    return _page(rows, limit, before, after)
+
+
+def _keyset_window(queryset, params):
+    before = params.get("before")
+    after = params.get("after")
+    if before and after:
+        raise InvalidCursor("Use either before or after, not both")
+    limit = get_page_size(params)
+
+    if after:
+        created, pk = decode_cursor(after)
+        queryset = queryset.filter(
+            Q(created__gt=created) | Q(created=created, id__gt=pk)
+        ).order_by("created", "id")
+    else:
+        if before:
+            created, pk = decode_cursor(before)
+            queryset = queryset.filter(
+                Q(created__lt=created) | Q(created=created, id__lt=pk)
+            )
+        queryset = queryset.order_by("-created", "-id")
+    return queryset, limit, before, after
+
+
+def _page(rows, limit, before, after):
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if after:
+        rows.reverse()
+        # Older rows always exist behind an `after` cursor; newer ones only
+        # when the page was cut short.
+        next_cursor = encode_cursor(rows[-1]["created"], rows[-1]["id"]) if rows else None
+        previous_cursor = encode_cursor(rows[0]["created"], rows[0]["id"]) if rows else after
+        return rows, next_cursor, previous_cursor
+
+    next_cursor = encode_cursor(rows[-1]["created"], rows[-1]["id"]) if has_more else None
+    previous_cursor = encode_cursor(rows[0]["created"], rows[0]["id"]) if rows else before
+    return rows, next_cursor, previous_cursor
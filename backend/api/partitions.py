@@ -0,0 +1,135 @@
+# partitions.py
+"""
+Monthly range partitions of the message table on PostgreSQL.
+
+Migration 0008 turns `api_message` into a table partitioned on `created`,
+with one partition per calendar month (UTC) named `api_message_pYYYYMM`
+and a default partition for rows outside them. `ensure_partitions()`
+creates the partitions of the coming months before rows arrive for them;
+`python manage.py archivemessages` calls it on every run, so schedule that
+command at least monthly. When it did not run for longer than
+`MESSAGE_PARTITIONS_AHEAD` months, the rows of the missing months are in
+the default partition; they move to their month's partition when it is
+created. On other databases the message table is a plain table and these
+functions do nothing.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Message
+
+
+def month_start(moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f"{Message._meta.db_table}_p{month:%Y%m}"
+
+
+def default_partition_name():
+    return f"{Message._meta.db_table}_default"
+
+
+def is_partitioned():
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)",
+            [Message._meta.db_table],
+        )
+        return cursor.fetchone()[0]
+
+
+def partitions():
+    """
+    Names of the partitions attached to the message table.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [Message._meta.db_table],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def ensure_partitions(months_ahead=None):
+    """
+    Create the partitions of this month and the next `months_ahead` ones
+    that do not exist yet. Returns the names of those created.
+    """
+    if not is_partitioned():
+        return []
+    if months_ahead is None:
+        months_ahead = settings.MESSAGE_PARTITIONS_AHEAD
+    existing = partitions()
+    created = []
+    current = month_start(timezone.now())
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        create_partition(month, move_defaults=default_partition_name() in existing)
+        created.append(name)
+    return created
+
+
+def create_partition(month, move_defaults=True):
+    """
+    Create the partition of `month`. Rows of that month in the default
+    partition would make the plain `CREATE TABLE ... PARTITION OF` fail, so
+    when there are any the partition is created on its own, the rows move
+    into it, and it is attached, all in one transaction.
+    """
+    table = Message._meta.db_table
+    quote = connection.ops.quote_name
+    name = quote(partition_name(month))
+    bounds = [month, add_months(month, 1)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        stranded = False
+        if move_defaults:
+            cursor.execute(
+                f"SELECT EXISTS (SELECT 1 FROM {quote(default_partition_name())} WHERE created >= %s AND created < %s)",
+                bounds,
+            )
+            stranded = cursor.fetchone()[0]
+        if not stranded:
+            cursor.execute(f"CREATE TABLE {name} PARTITION OF {quote(table)} FOR VALUES FROM (%s) TO (%s)", bounds)
+            return
+        columns = ", ".join(quote(field.column) for field in Message._meta.concrete_fields)
+        cursor.execute(f"CREATE TABLE {name} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {quote(default_partition_name())} "
+            f"WHERE created >= %s AND created < %s RETURNING {columns}) "
+            f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved",
+            bounds,
+        )
+        # Attaching creates the partition's indexes and foreign keys
+        cursor.execute(f"ALTER TABLE {quote(table)} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+
+
+def drop_partition(month):
+    """
+    Detach and drop the partition of `month`, if there is one. Returns
+    whether it existed.
+    """
+    name = partition_name(month)
+    if not is_partitioned() or name not in partitions():
+        return False
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {quote(Message._meta.db_table)} DETACH PARTITION {quote(name)}")
+        cursor.execute(f"DROP TABLE {quote(name)}")
+    return True
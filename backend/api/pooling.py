@@ -0,0 +1,107 @@
+# pooling.py
+"""
+Database connection metrics.
+
+With `CONN_MAX_AGE` set, each worker thread keeps its connection between
+requests, so the number of connections opened should stay far below the
+number of requests served. `connection_stats()` reports, per database
+alias, the connections opened and closed next to the number of requests,
+together with the pooling settings in effect.
+
+Opens are counted by Django's `connection_created` signal. Django closes
+expired and broken connections when a request starts or finishes, so the
+connections closed are noticed there, right after it; a connection that
+is replaced in the middle of a request, e.g. after a failed health check,
+counts as closed when its replacement opens.
+"""
+import threading
+import weakref
+from collections import defaultdict
+
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+def _counters():
+    return {"opened": 0, "closed": 0}
+
+
+class ConnectionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Database wrappers whose connection was open when last seen
+        self._open = weakref.WeakSet()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.aliases = defaultdict(_counters)
+            self._open.clear()
+
+    def opened(self, wrapper):
+        with self._lock:
+            if wrapper in self._open:
+                self.aliases[wrapper.alias]["closed"] += 1
+            self._open.add(wrapper)
+            self.aliases[wrapper.alias]["opened"] += 1
+
+    def check_closed(self, wrappers):
+        with self._lock:
+            for wrapper in wrappers:
+                if wrapper.connection is None and wrapper in self._open:
+                    self._open.discard(wrapper)
+                    self.aliases[wrapper.alias]["closed"] += 1
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def snapshot(self):
+        with self._lock:
+            return self.requests, {alias: dict(counters) for alias, counters in self.aliases.items()}
+
+
+stats = ConnectionStats()
+
+
+def _connection_created(sender, connection, **kwargs):
+    stats.opened(connection)
+
+
+def _request_started(**kwargs):
+    # Connected after django.db's close_old_connections, so it runs after it
+    stats.record_request()
+    stats.check_closed(connections.all(initialized_only=True))
+
+
+def _request_finished(**kwargs):
+    stats.check_closed(connections.all(initialized_only=True))
+
+
+connection_created.connect(_connection_created, dispatch_uid="api.pooling.connection_created")
+request_started.connect(_request_started, dispatch_uid="api.pooling.request_started")
+request_finished.connect(_request_finished, dispatch_uid="api.pooling.request_finished")
+
+
+def connection_stats():
+    """
+    Connection counters of this process per database alias, and how many
+    requests each new connection served on average.
+    """
+    requests, aliases = stats.snapshot()
+    databases = {}
+    for alias in connections:
+        settings_dict = connections.settings[alias]
+        counters = aliases.get(alias) or _counters()
+        databases[alias] = {
+            "conn_max_age": settings_dict["CONN_MAX_AGE"],
+            "health_checks": settings_dict["CONN_HEALTH_CHECKS"],
+            "server_side_cursors": not settings_dict.get("DISABLE_SERVER_SIDE_CURSORS", False),
+            "opened": counters["opened"],
+            "closed": counters["closed"],
+            "open": counters["opened"] - counters["closed"],
+            "requests_per_connection": requests / counters["opened"] if counters["opened"] else None,
+        }
+    return {"requests": requests, "databases": databases}
@@ -0,0 +1,58 @@
+# renderers.py
+"""
+Compact MessagePack representation of message pages.
+
+Clients opt in with `Accept: application/msgpack`. Instead of repeating
+the nested sender on every message, a page lists each sender once under
+`senders` and each message as a row of `fields` values, whose `sender` is
+an index into that table. `compact_messages()` builds this straight from
+the `.values()` rows of the page instead of going through a serializer,
+and timestamps are MessagePack timestamps instead of ISO strings.
+"""
+import datetime
+import decimal
+import uuid
+
+import msgpack
+from django.utils.functional import Promise
+from rest_framework.renderers import BaseRenderer
+
+MESSAGE_FIELDS = ["id", "sender", "content", "created"]
+
+
+def _encode_default(value):
+    if isinstance(value, (Promise, decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} cannot be packed")
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_encode_default, datetime=True)
+
+
+def compact_messages(messages):
+    """
+    The `senders`, `fields` and `data` of a compact page of `messages`,
+    rows read with `.values(*MessageValuesSerializer.lookups)`.
+    """
+    senders = []
+    positions = {}
+    rows = []
+    for message in messages:
+        sender_id = message["sender__id"]
+        position = positions.get(sender_id)
+        if position is None:
+            position = positions[sender_id] = len(senders)
+            senders.append({"username": message["sender__username"], "email": message["sender__email"], "id": sender_id})
+        rows.append([message["id"], position, message["content"], message["created"]])
+    return {"senders": senders, "fields": MESSAGE_FIELDS, "data": rows}
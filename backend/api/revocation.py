@@ -0,0 +1,145 @@
+# revocation.py
+"""
+Fast refresh-token revocation checks and blacklist compaction.
+
+`revocations` keeps a Bloom filter of the blacklisted token ids (jti) of
+this process. A token the filter has never seen is certainly not
+blacklisted, so the common case needs no table lookup; a hit is confirmed
+against `BlacklistedToken`, which absorbs the filter's false positives.
+
+The filter learns about revocations made by this process immediately and
+about those made elsewhere by reading new `BlacklistedToken` rows at most
+every `REVOCATION_CACHE_REFRESH` seconds. Rotation itself never trusts the
+filter: blacklisting a token that is already blacklisted fails, so a
+refresh token can only be used once even inside that window.
+
+`purge_expired_tokens` deletes expired outstanding tokens (and their
+blacklist entries) in bounded batches; run it with `python manage.py
+purgetokens`.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class BloomFilter:
+    """
+    Bloom filter sized for `capacity` items at the given false positive rate.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class RevocationCache:
+    def __init__(self, capacity, refresh_interval, error_rate=0.01):
+        self.capacity = capacity
+        self.refresh_interval = refresh_interval
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_id = 0
+        self._synced_at = 0.0
+
+    def _rebuild(self):
+        # Rows added after this point are picked up by the next `_sync`
+        last_id = BlacklistedToken.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        jtis = list(
+            BlacklistedToken.objects.filter(id__lte=last_id, token__expires_at__gt=timezone.now())
+            .values_list("token__jti", flat=True)
+        )
+        capacity = self.capacity
+        while capacity < 2 * len(jtis):
+            capacity *= 2
+        self._filter = BloomFilter(capacity, self.error_rate)
+        for jti in jtis:
+            self._filter.add(jti)
+        self._last_id = last_id
+        self._synced_at = time.monotonic()
+
+    def _sync(self):
+        if self._filter is None:
+            self._rebuild()
+            return
+        if time.monotonic() - self._synced_at < self.refresh_interval:
+            return
+        rows = BlacklistedToken.objects.filter(id__gt=self._last_id).order_by("id").values_list("id", "token__jti")
+        for pk, jti in rows:
+            self._filter.add(jti)
+            self._last_id = pk
+        self._synced_at = time.monotonic()
+        if self._filter.count > self._filter.capacity:
+            self._rebuild()
+
+    def might_be_revoked(self, jti):
+        """
+        False when the token id is certainly not blacklisted.
+        """
+        with self._lock:
+            self._sync()
+            return jti in self._filter
+
+    def add(self, jti):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def clear(self):
+        with self._lock:
+            self._filter = None
+            self._last_id = 0
+
+
+revocations = RevocationCache(
+    capacity=getattr(settings, "REVOCATION_CACHE_CAPACITY", 100000),
+    refresh_interval=getattr(settings, "REVOCATION_CACHE_REFRESH", 1.0),
+)
+
+
+def purge_expired_tokens(batch_size=1000, pause=0.0, max_batches=None):
+    """
+    Delete expired outstanding tokens and their blacklist entries, at most
+    `batch_size` tokens per statement, sleeping `pause` seconds between
+    batches. Returns the number of outstanding tokens deleted.
+    """
+    deleted = 0
+    batches = 0
+    now = timezone.now()
+    while max_batches is None or batches < max_batches:
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lte=now)
+            .order_by("id").values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        # Blacklist rows first, so deleting the tokens cascades to nothing
+        BlacklistedToken.objects.filter(token_id__in=ids).delete()
+        deleted += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    return deleted
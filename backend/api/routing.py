@@ -0,0 +1,195 @@
+# routing.py
+"""
+Read-replica routing.
+
+`ReplicaRouter` sends reads to one of `settings.DATABASE_REPLICAS` only
+inside views decorated with `@read_from_replica` (the history, export,
+change feed and directory endpoints). Everything else, including every
+write, uses the primary.
+
+Replicas lag behind the primary, so a user whose request changed something
+is pinned to the primary for `REPLICA_STICKY_SECONDS` and reads their own
+writes. `ReplicaPinningMiddleware` sets the pin after every successful
+unsafe request; pins live in the `REPLICA_PIN_CACHE` cache, which must be
+shared when several processes serve the API.
+"""
+import asyncio
+import functools
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY = DEFAULT_DB_ALIAS
+
+# Alias that reads of the current request go to; None means the primary
+_read_alias = ContextVar("read_alias", default=None)
+
+
+def _pin_cache():
+    return caches[settings.REPLICA_PIN_CACHE]
+
+
+def _pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def pin_to_primary(user_id):
+    _pin_cache().set(_pin_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+async def apin_to_primary(user_id):
+    await _pin_cache().aset(_pin_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(user_id):
+    return _pin_cache().get(_pin_key(user_id)) is not None
+
+
+def choose_replica(user_id):
+    """
+    Alias of a replica for the user's reads, or None when there is none or
+    the user recently wrote.
+    """
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas or (user_id is not None and is_pinned(user_id)):
+        return None
+    return random.choice(replicas)
+
+
+async def achoose_replica(user_id):
+    """
+    Asynchronous version of `choose_replica`.
+    """
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas or (user_id is not None and await _pin_cache().aget(_pin_key(user_id)) is not None):
+        return None
+    return random.choice(replicas)
+
+
+@contextmanager
+def reads_from(alias):
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def primary_reads():
+    """
+    Send reads in the block to the primary, e.g. when they must reflect a
+    change made a moment ago.
+    """
+    return reads_from(None)
+
+
+def bind_reads(iterable):
+    """
+    Iterate over `iterable` with the reads going where they go now, e.g.
+    for the content of a `StreamingHttpResponse`, which is consumed after
+    the view returned.
+    """
+    alias = _read_alias.get()
+
+    def steps():
+        iterator = iter(iterable)
+        while True:
+            with reads_from(alias):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    return steps()
+
+
+def read_from_replica(view):
+    """
+    Let the reads of a view go to a replica. Place it below
+    `@permission_classes` so that `request.user` is authenticated and the
+    permission checks still read from the primary.
+    """
+    if asyncio.iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with reads_from(await achoose_replica(request.user.id)):
+                return await view(request, *args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with reads_from(choose_replica(request.user.id)):
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def _written_by(request, response):
+    """
+    Id of the authenticated user whose request may have written, if any.
+    """
+    if request.method in SAFE_METHODS or response.status_code >= 400:
+        return None
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return None
+    return user.id
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pin users to the primary after their successful unsafe requests. DRF
+    stores the user it authenticated on the underlying request, so token
+    authenticated users are seen here too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if settings.DATABASE_REPLICAS:
+            user_id = _written_by(request, response)
+            if user_id is not None:
+                pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if settings.DATABASE_REPLICAS:
+            # Resolving a session user may query the database
+            user_id = await sync_to_async(_written_by)(request, response)
+            if user_id is not None:
+                await apin_to_primary(user_id)
+        return response
@@ -0,0 +1,119 @@
+# search.py
+"""
+Full-text search over message content.
+
+PostgreSQL uses `to_tsvector` backed by the GIN index created in migration
+0004; SQLite uses the `api_message_fts` FTS5 table kept in sync by triggers
+from the same migration. Both return results ranked best first, paged with
+a `(score, id)` keyset cursor. Only messages still in the table are
+searched: archived history is not indexed.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast
+
+from .models import Group, Message
+from .pagination import InvalidCursor, decode_values, encode_values, get_page_size
+from .serializers import MessageValuesSerializer
+
+SEARCH_CONFIG = "english"
+WORD = re.compile(r"\w+")
+
+
+def searchable_group_ids(user_id):
+    """
+    Subquery of the ids of groups `user_id` hosts or participates in.
+    """
+    member_of = Group.participants.through.objects.filter(user_id=user_id).values("group_id")
+    return Group.objects.filter(Q(id__in=member_of) | Q(host_id=user_id)).values("id")
+
+
+def search_messages(user_id, query, params):
+    """
+    Return `(messages, next_cursor)` for one page of messages matching
+    `query` in the groups visible to `user_id`, serialized like
+    `MessageSerializer` with their relevance added as `score`, higher is
+    better.
+
+    Query parameters:
+        group (int): Only search this group.
+        cursor (str): `next` cursor of the previous page.
+        limit (int): Page size.
+    """
+    limit = get_page_size(params)
+    after = None
+    if params.get("cursor"):
+        after = decode_values(params["cursor"], 2)
+        if not isinstance(after[0], (int, float)) or not isinstance(after[1], int):
+            raise InvalidCursor("Invalid cursor")
+
+    group_ids = searchable_group_ids(user_id)
+    if params.get("group"):
+        try:
+            group_ids = group_ids.filter(id=int(params["group"]))
+        except ValueError as e:
+            raise InvalidCursor("group must be an integer") from e
+
+    if connection.vendor == "postgresql":
+        rows = _search_postgresql(query, group_ids, after, limit + 1)
+    else:
+        rows = _search_sqlite(query, group_ids, after, limit + 1)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    data = MessageValuesSerializer(Message.objects.filter(id__in=[pk for pk, _ in rows]).order_by()).data
+    messages = {item["id"]: item for item in data}
+    page = [{**messages[pk], "score": score} for pk, score in rows]
+
+    next_cursor = encode_values(rows[-1][1], rows[-1][0]) if has_more else None
+    return page, next_cursor
+
+
+def _search_postgresql(query, group_ids, after, limit):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    # Same expression as the GIN index in migration 0004
+    vector = SearchVector("content", config=SEARCH_CONFIG)
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch")
+    queryset = (
+        Message.objects.annotate(
+            search=vector,
+            # Cast the float4 rank so it survives the round trip through a cursor
+            score=Cast(SearchRank(vector, search_query), FloatField()),
+        )
+        .filter(search=search_query, group_id__in=group_ids)
+    )
+    if after is not None:
+        score, pk = after
+        queryset = queryset.filter(Q(score__lt=score) | Q(score=score, id__lt=pk))
+    return list(queryset.order_by("-score", "-id").values_list("id", "score")[:limit])
+
+
+def _search_sqlite(query, group_ids, after, limit):
+    words = WORD.findall(query)
+    if not words:
+        return []
+    # Quote every word so user input is never parsed as FTS5 syntax
+    match = " ".join('"%s"' % word for word in words)
+
+    group_sql, group_params = group_ids.query.sql_with_params()
+    sql = f"""
+        SELECT id, score FROM (
+            SELECT m.id AS id, -bm25(api_message_fts) AS score
+            FROM api_message_fts
+            JOIN api_message m ON m.id = api_message_fts.rowid
+            WHERE api_message_fts MATCH %s AND m.group_id IN ({group_sql})
+        )
+    """
+    params = [match, *group_params]
+    if after is not None:
+        sql += " WHERE score < %s OR (score = %s AND id < %s)"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY score DESC, id DESC LIMIT %s"
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
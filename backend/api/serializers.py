@@ -1,5 +1,15 @@
 # serializers.py
+import operator
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models, transaction
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import RevocableRefreshToken, get_token_for_user
 from .models import User, Group, Message
 
 class SuperUserSerializer(serializers.ModelSerializer):
@@ -56,3 +66,237 @@ class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = ['id', 'group', 'sender', 'content', 'created']
+
+
+class MessageChangeSerializer(MessageSerializer):
+    """
+    A message as the change feed reports it: its latest state, the
+    sequence number of that change and when it was deleted, if it was.
+    """
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ['seq', 'deleted']
+
+
+# Representation of temporal model fields, as ModelSerializer maps them
+TEMPORAL_FIELDS = [
+    (models.DateTimeField, serializers.DateTimeField),
+    (models.DateField, serializers.DateField),
+    (models.TimeField, serializers.TimeField),
+]
+
+
+def _field_getter(field, key):
+    for model_field, serializer_field in TEMPORAL_FIELDS:
+        if isinstance(field, model_field):
+            convert = serializer_field().to_representation
+            return lambda row: convert(row[key])
+    return operator.itemgetter(key)
+
+
+def _nested_getter(key, plan):
+    def get(row):
+        if row[key] is None:
+            return None
+        return {name: read(row) for name, read in plan}
+    return get
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer for list endpoints. It reads only the columns it
+    needs with `.values()` and turns each row into a plain dict with the
+    same output as the matching `ModelSerializer`, without building DRF
+    fields for every object.
+
+    Subclasses set `model` and `fields`. A field is the name of a model
+    field, a `(name, ValuesSerializer subclass)` pair for a nested object
+    read through the foreign key `name` (None when the key is null), or
+    the name of a `get_<name>(row)` method, like `SerializerMethodField`,
+    whose columns are listed in `extra_lookups`. Many-to-many fields become
+    lists of primary keys, read with one extra query per page. The plan of
+    each row is compiled once, when the class is created.
+
+        MessageValuesSerializer(Message.objects.filter(group=group)).data
+    """
+    model = None
+    fields = []
+    extra_lookups = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.lookups, cls.plan, cls.many = cls.compile()
+
+    @classmethod
+    def compile(cls, prefix=""):
+        """
+        The `.values()` lookups, the row plan and the many-to-many fields of
+        this serializer, nested under `prefix`. The plan pairs each output
+        name with a function of the row.
+        """
+        lookups = [prefix + lookup for lookup in cls.extra_lookups]
+        plan = []
+        many = []
+        for spec in cls.fields:
+            if isinstance(spec, tuple):
+                name, nested = spec
+                key = prefix + cls.model._meta.get_field(name).attname
+                nested_lookups, nested_plan, _ = nested.compile(prefix + name + "__")
+                lookups.append(key)
+                lookups.extend(nested_lookups)
+                plan.append((name, _nested_getter(key, nested_plan)))
+                continue
+            try:
+                field = cls.model._meta.get_field(spec)
+            except FieldDoesNotExist:
+                plan.append((spec, getattr(cls, f"get_{spec}")))
+                continue
+            if field.many_to_many:
+                # Filled in by `fill_many`
+                many.append(field)
+                plan.append((spec, lambda row: []))
+                continue
+            key = prefix + field.attname
+            lookups.append(key)
+            plan.append((spec, _field_getter(field, key)))
+        if many:
+            lookups.append(prefix + cls.model._meta.pk.attname)
+        return list(dict.fromkeys(lookups)), plan, many
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    @property
+    def data(self):
+        return self.represent(list(self.queryset.values(*self.lookups)))
+
+    @classmethod
+    def represent(cls, rows):
+        """
+        Serialize rows that were already read with `.values()`, with at
+        least the columns in `lookups`.
+        """
+        data = [{name: read(row) for name, read in cls.plan} for row in rows]
+        if cls.many:
+            pk = cls.model._meta.pk.attname
+            cls.fill_many(dict(zip((row[pk] for row in rows), data)))
+        return data
+
+    @classmethod
+    def fill_many(cls, objects):
+        for field in cls.many:
+            through = field.remote_field.through
+            source = field.m2m_field_name() + "_id"
+            target = field.m2m_reverse_field_name() + "_id"
+            links = (
+                through.objects.filter(**{f"{source}__in": list(objects)})
+                .order_by(source, target).values_list(source, target)
+            )
+            for pk, related in links:
+                objects[pk][field.name].append(related)
+
+
+class UserValuesSerializer(ValuesSerializer):
+    """
+    Fast `GetUserSerializer`.
+    """
+    model = User
+    fields = GetUserSerializer.Meta.fields
+
+
+class GroupValuesSerializer(ValuesSerializer):
+    """
+    Fast `GroupSerializer`, participants ordered by id.
+    """
+    model = Group
+    fields = GroupSerializer.Meta.fields
+
+
+class MessageValuesSerializer(ValuesSerializer):
+    """
+    Fast `MessageSerializer`.
+    """
+    model = Message
+    fields = ['id', 'group', ('sender', UserValuesSerializer), 'content', 'created']
+
+
+class MessageChangeValuesSerializer(ValuesSerializer):
+    """
+    Fast `MessageChangeSerializer`.
+    """
+    model = Message
+    fields = MessageValuesSerializer.fields + ['seq', 'deleted']
+
+
+class InboxGroupValuesSerializer(ValuesSerializer):
+    """
+    Group summary for the inbox, with the latest message. Expects
+    `read_count` to be annotated.
+    """
+    model = Group
+    fields = ['id', 'name', 'description', ('last_message', MessageValuesSerializer), 'message_count', 'unread_count', 'updated']
+    extra_lookups = ['message_count', 'read_count']
+
+    @staticmethod
+    def get_unread_count(row):
+        return max(row['message_count'] - row['read_count'], 0)
+
+
+class BulkMessageListSerializer(serializers.ListSerializer):
+    """
+    Writes a validated batch with multi-row inserts of `chunk_size` rows,
+    all inside one transaction.
+    """
+
+    def create(self, validated_data):
+        chunk_size = self.context.get("chunk_size", settings.BULK_MESSAGE_CHUNK_SIZE)
+        messages = [Message(**item) for item in validated_data]
+        with transaction.atomic():
+            Message.assign_seqs(messages)
+            for start in range(0, len(messages), chunk_size):
+                Message.objects.bulk_create(messages[start:start + chunk_size])
+        return messages
+
+
+class BulkMessageSerializer(MessageSerializer):
+    """
+    Message serializer for batches. The group comes from the URL, so it is
+    not validated once per item.
+    """
+
+    class Meta(MessageSerializer.Meta):
+        read_only_fields = ['group']
+        list_serializer_class = BulkMessageListSerializer
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Token pair serializer that embeds the claims read by `LazyTokenUser`.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        return get_token_for_user(user)
+
+
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh serializer that checks revocation through the revocation cache
+    and refuses a token that was already rotated, even when the cache has
+    not seen its revocation yet.
+    """
+
+    def validate(self, attrs):
+        refresh = RevocableRefreshToken(attrs['refresh'])
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                blacklisted, created = refresh.blacklist()
+                if not created:
+                    raise TokenError(_('Token is blacklisted'))
+            refresh.set_jti()
+            refresh.set_exp()
+            data['refresh'] = str(refresh)
+
+        return data
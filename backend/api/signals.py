@@ -0,0 +1,107 @@
+# signals.py
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import archive, cache
+from .authentication import user_cache
+from .membership import membership_cache
+from .models import Group, Message, User
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_group_membership(sender, instance, **kwargs):
+    # The host may have changed
+    membership_cache.invalidate(group_ids=[instance.id])
+
+
+@receiver(m2m_changed, sender=Group.participants.through)
+def invalidate_participant_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        # `instance` is a user, `pk_set` the groups
+        membership_cache.invalidate(user_ids=[instance.id], group_ids=pk_set)
+    else:
+        membership_cache.invalidate(user_ids=pk_set, group_ids=[instance.id])
+
+
+@receiver(m2m_changed, sender=Group.participants.through)
+def touch_group_on_participant_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Bump `Group.updated` so conditional GETs of the group see the change.
+    """
+    if reverse:
+        if action == "pre_clear":
+            groups = Group.objects.filter(participants=instance.id)
+        elif action in ("post_add", "post_remove"):
+            groups = Group.objects.filter(id__in=pk_set)
+        else:
+            return
+    elif action in ("post_add", "post_remove", "post_clear"):
+        groups = Group.objects.filter(id=instance.id)
+    else:
+        return
+    groups.update(updated=timezone.now())
+
+
+def invalidate_now_and_on_commit(*resources):
+    cache.invalidate(*resources)
+    # Again after commit: a concurrent reader may have cached the old rows
+    # under the token issued above while the transaction was still open
+    transaction.on_commit(lambda: cache.invalidate(*resources))
+
+
+# User fields that cached responses show
+SHOWN_USER_FIELDS = {"username", "email"}
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user_responses(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SHOWN_USER_FIELDS & set(update_fields):
+        # e.g. last_login or a password change
+        return
+    # Message pages embed sender details, so the groups the user sent
+    # messages to change as well
+    group_ids = (
+        Message.objects.filter(sender_id=instance.id).order_by().values_list("group_id", flat=True).distinct()
+    )
+    invalidate_now_and_on_commit(
+        cache.USERS, cache.user_version(instance.id), *[cache.group_version(group_id) for group_id in group_ids]
+    )
+
+
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_cached_group_responses(sender, instance, **kwargs):
+    invalidate_now_and_on_commit(cache.group_version(instance.id))
+
+
+@receiver([post_save, post_delete], sender=Message)
+def invalidate_cached_message_responses(sender, instance, **kwargs):
+    invalidate_now_and_on_commit(cache.group_version(instance.group_id))
+
+
+@receiver(m2m_changed, sender=Group.participants.through)
+def invalidate_cached_participant_responses(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear", "post_clear"):
+        return
+    if not reverse:
+        if action != "pre_clear":
+            invalidate_now_and_on_commit(cache.group_version(instance.id))
+    elif action == "pre_clear":
+        group_ids = Group.objects.filter(participants=instance.id).values_list("id", flat=True)
+        invalidate_now_and_on_commit(*[cache.group_version(group_id) for group_id in group_ids])
+    elif action != "post_clear":
+        invalidate_now_and_on_commit(*[cache.group_version(group_id) for group_id in pk_set])
+
+
+@receiver(post_delete, sender=Group)
+def delete_archived_messages(sender, instance, **kwargs):
+    group_id = instance.id
+    transaction.on_commit(lambda: archive.delete_group_archive(group_id))
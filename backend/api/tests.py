@@ -1,3 +1,1658 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .archive import archive_messages, archive_path
+from .authentication import LazyTokenUser, RevocableRefreshToken, get_token_for_user, user_cache
+from .models import User, Group, GroupReadState, Job, Message
+from .pagination import decode_cursor, encode_cursor
+from .serializers import (
+    GetUserSerializer, GroupSerializer, GroupValuesSerializer, InboxGroupValuesSerializer,
+    MessageChangeSerializer, MessageChangeValuesSerializer, MessageSerializer, MessageValuesSerializer,
+    UserValuesSerializer,
+)
+from .cache import stats as cache_stats
+from .instrumentation import RequestMetrics, report
+from .jobs import JOB_HANDLERS, MESSAGE_CREATED, claim, drain, enqueue, queue_stats
+from .partitions import add_months, month_start
+from .pooling import stats as connection_counters
+from .routing import PRIMARY, ReplicaRouter, is_pinned, pin_to_primary, primary_reads, reads_from
+from .revocation import BloomFilter, purge_expired_tokens, revocations
+from .loadtest import SEED_PASSWORD, authorization, build_scenarios, seed
+from .membership import MembershipCache, is_member, membership_cache
+from .websocket import websocket_application
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=0.0, CHAT_BROKER={"BACKEND": "api.broker.InProcessBroker"})
+class ChatTestCase(TestCase):
+    """
+    Clears the per-process caches, which outlive the rolled back test
+    transactions and could otherwise hold rows of a previous test.
+    Request instrumentation is off unless a test enables it, and live
+    messages go through the in-process broker.
+    """
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        user_cache.clear()
+        membership_cache.clear()
+        revocations.clear()
+        caches["default"].clear()
+        caches["responses"].clear()
+        cache_stats.reset()
+
+
+class MessagePaginationTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.group = Group.objects.create(host=cls.user, name="general")
+        cls.group.participants.add(cls.user)
+        Message.objects.bulk_create(
+            Message(group=cls.group, sender=cls.user, content=f"message {i}")
+            for i in range(25)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("get-group-messages", args=[self.group.id])
+
+    def test_cursor_round_trip(self):
+        message = Message.objects.first()
+        self.assertEqual(
+            decode_cursor(encode_cursor(message.created, message.id)),
+            (message.created, message.id),
+        )
+
+    def test_walks_history_newest_first_without_gaps(self):
+        seen = []
+        params = {"limit": 10}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item["id"] for item in response.data["data"])
+            if response.data["next"] is None:
+                break
+            params = {"limit": 10, "before": response.data["next"]}
+
+        expected = list(
+            self.group.message_set.order_by("-created", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_after_returns_only_newer_messages(self):
+        first_page = self.client.get(self.url, {"limit": 5}).data
+        new_message = Message.objects.create(group=self.group, sender=self.user, content="new")
+
+        response = self.client.get(self.url, {"after": first_page["previous"]})
+        self.assertEqual([item["id"] for item in response.data["data"]], [new_message.id])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {"before": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data["status"])
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        other = User.objects.create_user("bob@example.com", "secret", username="bob")
+        Message.objects.bulk_create(
+            Message(group=self.group, sender=other, content=f"reply {i}") for i in range(10)
+        )
+
+        self.client.get(self.url)  # warm the membership cache
+        with CaptureQueriesContext(connection) as small_queries:
+            small = self.client.get(self.url, {"limit": 2})
+        with CaptureQueriesContext(connection) as large_queries:
+            large = self.client.get(self.url, {"limit": 30})
+
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertEqual(len(small.data["data"]), 2)
+        self.assertEqual(len(large.data["data"]), 30)
+        self.assertEqual(len({item["sender"]["id"] for item in large.data["data"]}), 2)
+
+
+class LiveMessageTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.outsider = User.objects.create_user("eve@example.com", "secret", username="eve")
+        cls.group = Group.objects.create(host=cls.user, name="general")
+        cls.group.participants.add(cls.user)
+
+    def connect(self, user):
+        token = str(AccessToken.for_user(user))
+        return ApplicationCommunicator(websocket_application, {
+            "type": "websocket",
+            "path": f"/ws/groups/{self.group.id}/",
+            "query_string": f"token={token}".encode(),
+        })
+
+    def send(self, content):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(reverse("send-message", args=[self.group.id]), {"content": content}, format="json")
+        # Delivery happens in the background job
+        drain()
+        return response
+
+    async def test_participant_receives_sent_message_once(self):
+        communicator = self.connect(self.user)
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual((await communicator.receive_output(1))["type"], "websocket.accept")
+
+        response = await sync_to_async(self.send)("hello")
+
+        event = await communicator.receive_output(1)
+        payload = json.loads(event["text"])
+        self.assertEqual(payload["type"], "message.created")
+        self.assertEqual(payload["data"]["id"], response.data["data"]["id"])
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait(1)
+
+    async def test_non_participant_is_rejected(self):
+        communicator = self.connect(self.outsider)
+        await communicator.send_input({"type": "websocket.connect"})
+        event = await communicator.receive_output(1)
+        self.assertEqual(event, {"type": "websocket.close", "code": 4403})
+
+
+class PasswordHashingTests(ChatTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_saving_other_fields_keeps_the_hash(self):
+        stored = self.user.password
+        response = self.client.patch(
+            reverse("user-management"), {"id": self.user.id, "username": "alice b"}, format="json"
+        )
+        self.assertEqual(response.status_code, 205)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, stored)
+        self.assertTrue(self.user.check_password("secret"))
+
+    def test_assigned_raw_password_is_hashed_once(self):
+        self.client.patch(
+            reverse("user-management"), {"id": self.user.id, "password": "changed"}, format="json"
+        )
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("changed"))
+
+    def test_superuser_password_is_not_double_hashed(self):
+        admin = User.objects.create_superuser("root@example.com", "secret", username="root")
+        self.assertTrue(User.objects.get(id=admin.id).check_password("secret"))
+
+    def test_bulk_update_skips_untouched_passwords(self):
+        other = User.objects.create_user("bob@example.com", "secret", username="bob")
+        users = list(User.objects.order_by("id"))
+        stored = [user.password for user in users]
+        users[1].password = "changed"
+
+        User.objects.bulk_update(users, ["username", "password"])
+
+        users = list(User.objects.order_by("id"))
+        self.assertEqual(users[0].password, stored[0])
+        self.assertTrue(users[1].check_password("changed"))
+        self.assertEqual(users[1].id, other.id)
+
+    def test_bulk_create_hashes_raw_passwords_only(self):
+        hashed = make_password("imported")
+        User.objects.bulk_create([
+            User(email="raw@example.com", username="raw", password="raw secret"),
+            User(email="none@example.com", username="none"),
+        ])
+        User.objects.bulk_create(
+            [User(email="imported@example.com", username="imported", password=hashed)], hashed_passwords=True
+        )
+        self.assertTrue(User.objects.get(username="raw").check_password("raw secret"))
+        self.assertFalse(User.objects.get(username="none").check_password(""))
+        self.assertEqual(User.objects.get(username="imported").password, hashed)
+
+    def test_raw_password_left_out_of_a_write_is_hashed_later(self):
+        self.user.password = "changed"
+        self.user.save(update_fields=["username"])
+        self.user.save()
+        self.assertTrue(User.objects.get(id=self.user.id).check_password("changed"))
+
+        self.user.password = "again"
+        User.objects.bulk_update([self.user], ["username"])
+        User.objects.bulk_update([self.user], ["password"])
+        self.assertTrue(User.objects.get(id=self.user.id).check_password("again"))
+
+
+class StatelessAuthenticationTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice@example.com", "secret", username="alice", is_staff=True)
+        cls.group = Group.objects.create(host=cls.user, name="general")
+
+    def setUp(self):
+        self.client = APIClient()
+        token = get_token_for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"JWT {token}")
+
+    def test_reads_do_not_load_the_user_row(self):
+        # The first request caches the row for the active check
+        self.client.get(reverse("get-group-messages", args=[self.group.id]))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("get-group-messages", args=[self.group.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('FROM "api_user"' in query["sql"] for query in queries))
+
+    def test_deactivated_users_are_rejected(self):
+        self.assertEqual(self.client.get(reverse("inbox")).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("inbox")).status_code, 401)
+
+    def test_deleted_users_are_rejected(self):
+        self.assertEqual(self.client.get(reverse("inbox")).status_code, 200)
+        self.user.delete()
+        self.assertEqual(self.client.get(reverse("inbox")).status_code, 401)
+        response = self.client.post(reverse("send-message", args=[999999]), {"content": "hi"}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_claims_build_the_user(self):
+        token = get_token_for_user(self.user).access_token
+        user = LazyTokenUser(token)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.id, self.user.id)
+            self.assertTrue(user.is_staff)
+            self.assertFalse(user.is_superuser)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "alice@example.com")
+            self.assertEqual(user.username, "alice")
+
+    def test_cached_user_is_invalidated_on_save(self):
+        self.assertEqual(user_cache.get(self.user.id).username, "alice")
+        with self.assertNumQueries(0):
+            user_cache.get(self.user.id)
+
+        self.user.username = "alice b"
+        self.user.save()
+        self.assertEqual(user_cache.get(self.user.id).username, "alice b")
+
+    def test_send_message_with_token_user(self):
+        response = self.client.post(
+            reverse("send-message", args=[self.group.id]), {"content": "hi"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["data"]["sender"]["username"], "alice")
+
+
+class BulkMessageTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("bot@example.com", "secret", username="bridge bot")
+        cls.group = Group.objects.create(host=cls.user, name="general")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("send-messages-bulk", args=[self.group.id])
+
+    def test_json_array_is_inserted_in_chunks(self):
+        items = [{"content": f"message {i}"} for i in range(25)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f"{self.url}?chunk_size=10", items, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["metrics"]["count"], 25)
+        inserts = [query for query in queries if query["sql"].startswith('INSERT INTO "api_message"')]
+        self.assertEqual(len(inserts), 3)
+        ids = [item["id"] for item in response.data["data"]]
+        self.assertEqual(
+            list(Message.objects.filter(id__in=ids).order_by("id").values_list("content", flat=True)),
+            [item["content"] for item in items],
+        )
+
+    def test_ndjson_stream_is_accepted(self):
+        body = "\n".join(json.dumps({"content": f"line {i}"}) for i in range(3)) + "\n"
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.group.message_set.count(), 3)
+
+    def test_invalid_item_rejects_the_whole_batch(self):
+        response = self.client.post(self.url, [{"content": "ok"}, {"content": ""}], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"][0], {})
+        self.assertIn("content", response.data["error"][1])
+        self.assertEqual(self.group.message_set.count(), 0)
+
+
+class InboxTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.bob = User.objects.create_user("bob@example.com", "secret", username="bob")
+        cls.groups = [Group.objects.create(host=cls.alice, name=f"group {i}") for i in range(3)]
+        for group in cls.groups:
+            group.participants.add(cls.alice, cls.bob)
+
+    def setUp(self):
+        self.alice_client = APIClient()
+        self.alice_client.force_authenticate(self.alice)
+        self.bob_client = APIClient()
+        self.bob_client.force_authenticate(self.bob)
+
+    def send(self, group, content):
+        return self.alice_client.post(
+            reverse("send-message", args=[group.id]), {"content": content}, format="json"
+        )
+
+    def test_counters_follow_sent_messages(self):
+        self.send(self.groups[0], "one")
+        last = self.send(self.groups[0], "two").data["data"]
+        self.bob_client.post(
+            reverse("send-messages-bulk", args=[self.groups[1].id]), [{"content": "bulk"}] * 3, format="json"
+        )
+
+        self.groups[0].refresh_from_db()
+        self.groups[1].refresh_from_db()
+        self.assertEqual(self.groups[0].message_count, 2)
+        self.assertEqual(self.groups[0].last_message_id, last["id"])
+        self.assertEqual(self.groups[1].message_count, 3)
+
+    def test_unread_counts_in_constant_queries(self):
+        first = [self.send(group, "hello").data["data"] for group in self.groups][0]
+        self.send(self.groups[0], "again")
+        self.bob_client.post(
+            reverse("mark-read", args=[self.groups[0].id]), {"message_id": first["id"]}, format="json"
+        )
+        self.bob_client.post(reverse("mark-read", args=[self.groups[1].id]))
+
+        with self.assertNumQueries(1):
+            response = self.bob_client.get(reverse("inbox"))
+
+        unread = {item["id"]: item["unread_count"] for item in response.data["data"]}
+        self.assertEqual(unread, {self.groups[0].id: 1, self.groups[1].id: 0, self.groups[2].id: 1})
+        self.assertEqual(response.data["data"][0]["last_message"]["content"], "again")
+
+
+class MessageSearchTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.group = Group.objects.create(host=cls.user, name="general")
+        cls.hidden = Group.objects.create(name="private")
+        Message.objects.bulk_create(
+            [Message(group=cls.group, sender=cls.user, content=f"deploy number {i}") for i in range(5)]
+            + [
+                Message(group=cls.group, sender=cls.user, content="deploy deploy deploy tonight"),
+                Message(group=cls.group, sender=cls.user, content="lunch?"),
+                Message(group=cls.hidden, sender=cls.user, content="deploy secrets"),
+            ]
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("search-messages")
+
+    def test_ranked_results_are_scoped_and_paginated(self):
+        seen = []
+        params = {"q": "deploy", "limit": 4}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(response.data["data"])
+            if response.data["next"] is None:
+                break
+            params = {"q": "deploy", "limit": 4, "cursor": response.data["next"]}
+
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(seen[0]["content"], "deploy deploy deploy tonight")
+        self.assertEqual(len({item["id"] for item in seen}), 6)
+        self.assertTrue(all(item["group"] == self.group.id for item in seen))
+
+    def test_search_syntax_is_treated_as_plain_words(self):
+        response = self.client.get(self.url, {"q": 'lunch" * ('})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["content"] for item in response.data["data"]], ["lunch?"])
+
+    def test_edits_are_reindexed(self):
+        message = Message.objects.get(content="lunch?")
+        message.content = "dinner?"
+        message.save()
+        self.assertEqual(self.client.get(self.url, {"q": "lunch"}).data["data"], [])
+        self.assertEqual(len(self.client.get(self.url, {"q": "dinner"}).data["data"]), 1)
+
+
+
+class MembershipTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.eve = User.objects.create_user("eve@example.com", "secret", username="eve")
+        cls.group = Group.objects.create(host=cls.alice, name="general")
+
+    def test_non_members_cannot_read_or_write(self):
+        client = APIClient()
+        client.force_authenticate(self.eve)
+        self.assertEqual(client.get(reverse("get-group-messages", args=[self.group.id])).status_code, 403)
+        response = client.post(reverse("send-message", args=[self.group.id]), {"content": "hi"}, format="json")
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Message.objects.exists())
+
+    def test_checks_are_cached_and_invalidated_on_change(self):
+        self.assertFalse(is_member(self.eve.id, self.group.id))
+        self.assertTrue(is_member(self.alice.id, self.group.id))
+        with self.assertNumQueries(0):
+            self.assertFalse(is_member(self.eve.id, self.group.id))
+            self.assertTrue(is_member(self.alice.id, self.group.id))
+
+        self.group.participants.add(self.eve)
+        self.assertTrue(is_member(self.eve.id, self.group.id))
+
+        self.eve.participants.remove(self.group)
+        self.assertFalse(is_member(self.eve.id, self.group.id))
+
+    def test_invalidation_drops_only_matching_entries(self):
+        cache = MembershipCache(ttl=60, max_size=4)
+        for user_id, group_id in [(1, 10), (1, 20), (2, 10), (2, 20)]:
+            cache.set(user_id, group_id, True)
+
+        cache.invalidate(group_ids=[10])
+        self.assertEqual([cache.get(1, 10), cache.get(2, 10)], [None, None])
+        cache.invalidate(user_ids=[1], group_ids=[20, 30])
+        self.assertEqual([cache.get(1, 20), cache.get(2, 20)], [None, True])
+
+        # Evicted entries leave the indexes too
+        for group_id in range(100, 105):
+            cache.set(3, group_id, False)
+        cache.invalidate(user_ids=[2, 3])
+        self.assertEqual(len(cache._entries), 0)
+        self.assertEqual((dict(cache._by_user), dict(cache._by_group)), ({}, {}))
+
+
+class ExportTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.group = Group.objects.create(host=cls.user, name="general")
+        Message.objects.bulk_create(
+            Message(group=cls.group, sender=cls.user, content=f'line {i}, "quoted"') for i in range(30)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("export-messages", args=[self.group.id])
+
+    def test_ndjson_matches_message_serializer(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+        expected = MessageSerializer(
+            self.group.message_set.for_listing().order_by("created", "id"), many=True
+        ).data
+        self.assertEqual(rows, json.loads(json.dumps(expected)))
+
+    def test_csv_resumes_after_message(self):
+        ids = list(self.group.message_set.order_by("created", "id").values_list("id", flat=True))
+        response = self.client.get(self.url, {"output": "csv", "after_id": ids[19]})
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+
+        self.assertEqual(rows[0][0], "id")
+        self.assertEqual([int(row[0]) for row in rows[1:]], ids[20:])
+        self.assertEqual(rows[1][5], 'line 20, "quoted"')
+
+
+class UserDirectoryTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(email=f"user{i}@example.com", username=f"{'Alice' if i % 2 else 'bob'} {i}")
+            for i in range(12)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        self.url = reverse("get-all-users")
+
+    def test_pages_cover_every_user_once(self):
+        seen = []
+        params = {"limit": 5}
+        while True:
+            response = self.client.get(self.url, params)
+            seen.extend(row["id"] for row in response.data["data"])
+            if response.data["next"] is None:
+                break
+            params = {"limit": 5, "cursor": response.data["next"]}
+        self.assertEqual(seen, sorted(user.id for user in self.users))
+
+    def test_default_rows_match_get_user_serializer(self):
+        response = self.client.get(self.url, {"limit": 3})
+        expected = GetUserSerializer(User.objects.order_by("id")[:3], many=True).data
+        self.assertEqual(response.data["data"], expected)
+
+    def test_prefix_search_with_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {"search": "ali", "fields": "username"})
+        self.assertEqual(len(response.data["data"]), 6)
+        self.assertTrue(all(list(row) == ["username"] for row in response.data["data"]))
+        self.assertNotIn('"api_user"."email"', queries[-1]["sql"].split(" FROM ")[0])
+
+    def test_bulk_lookup_by_ids(self):
+        ids = [self.users[3].id, self.users[7].id]
+        response = self.client.get(self.url, {"ids": ",".join(map(str, ids)), "fields": "id"})
+        self.assertEqual(response.data["data"], [{"id": ids[0]}, {"id": ids[1]}])
+
+    def test_unknown_field_is_rejected(self):
+        self.assertEqual(self.client.get(self.url, {"fields": "password"}).status_code, 400)
+
+
+class ConditionalGetTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.group = Group.objects.create(host=cls.user, name="general")
+        Message.objects.bulk_create(
+            Message(group=cls.group, sender=cls.user, content=f"message {i}") for i in range(20)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def revalidate(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        with patch.object(MessageSerializer, "to_representation") as serialize:
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        serialize.assert_not_called()
+        return first, second
+
+    def test_unchanged_message_page_is_not_resent(self):
+        url = reverse("get-group-messages", args=[self.group.id])
+        first, second = self.revalidate(url)
+
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(len(second.content), 0)
+        self.assertGreater(len(first.content), 1000)
+
+        # Pages are validated by ETag only, see test_deletions_change_the_page_validators
+        self.assertNotIn("Last-Modified", first)
+
+    def test_deletions_change_the_page_validators(self):
+        url = reverse("get-group-messages", args=[self.group.id])
+        first = self.client.get(url, {"limit": 200})
+        Message.objects.filter(group=self.group).order_by("created").first().soft_delete()
+        since = self.client.get(
+            url, {"limit": 200}, HTTP_IF_NONE_MATCH=first["ETag"], HTTP_IF_MODIFIED_SINCE=http_date(time.time())
+        )
+        self.assertEqual(since.status_code, 200)
+
+        directory = reverse("get-all-users")
+        bob = User.objects.create_user("bob@example.com", "secret", username="bob")
+        first = self.client.get(directory)
+        self.assertNotIn("Last-Modified", first)
+        bob.delete()
+        self.assertEqual(self.client.get(directory, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+
+    def test_sender_rename_changes_the_etag(self):
+        url = reverse("get-group-messages", args=[self.group.id])
+        etag = self.client.get(url)["ETag"]
+        self.user.username = "alice b"
+        self.user.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_group_and_users_support_revalidation(self):
+        for url in (
+            reverse("get-group", args=[self.group.id]),
+            reverse("get-user", args=[self.user.id]),
+            reverse("get-all-users"),
+        ):
+            first, second = self.revalidate(url)
+            self.assertEqual(second.status_code, 304, url)
+
+    def test_adding_a_participant_changes_the_group_etag(self):
+        url = reverse("get-group", args=[self.group.id])
+        etag = self.client.get(url)["ETag"]
+        self.group.participants.add(self.user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+
+class ResponseCacheTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.other = User.objects.create_user("bob@example.com", "secret", username="bob")
+        cls.group = Group.objects.create(host=cls.user, name="general")
+        cls.group.participants.add(cls.other)
+        Message.objects.create(group=cls.group, sender=cls.user, content="hello")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("get-group-messages", args=[self.group.id])
+
+    def test_hits_skip_the_database(self):
+        self.assertEqual(self.client.get(self.url)["X-Cache"], "MISS")
+        with self.assertNumQueries(1):  # the group lookup
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.data["data"][0]["content"], "hello")
+        self.assertEqual(cache_stats.as_dict()["hits"], 1)
+
+    def test_entries_are_per_user(self):
+        self.client.get(self.url)
+        other = APIClient()
+        other.force_authenticate(self.other)
+        self.assertEqual(other.get(self.url)["X-Cache"], "MISS")
+
+    def test_writes_invalidate_cached_pages(self):
+        self.client.get(self.url)
+        self.client.post(reverse("send-message", args=[self.group.id]), {"content": "new"}, format="json")
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["data"][0]["content"], "new")
+
+        self.client.post(
+            reverse("send-messages-bulk", args=[self.group.id]), [{"content": "bulk"}], format="json"
+        )
+        self.assertEqual(self.client.get(self.url).data["data"][0]["content"], "bulk")
+
+        self.user.username = "alice b"
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).data["data"][0]["sender"]["username"], "alice b")
+
+    def test_user_changes_only_invalidate_where_they_are_shown(self):
+        quiet = Group.objects.create(host=self.other, name="quiet")
+        quiet.participants.add(self.user)
+        quiet_url = reverse("get-group-messages", args=[quiet.id])
+        self.client.get(self.url)
+        self.client.get(quiet_url)
+
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=["last_login"])
+        self.assertEqual(self.client.get(self.url)["X-Cache"], "HIT")
+
+        self.user.username = "alice b"
+        self.user.save()
+        self.assertEqual(self.client.get(self.url)["X-Cache"], "MISS")
+        self.assertEqual(self.client.get(quiet_url)["X-Cache"], "HIT")
+
+    def test_stats_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse("cache-stats")).status_code, 403)
+
+
+class LoadTestSeedTests(ChatTestCase):
+    def test_seeds_requested_dataset(self):
+        dataset = seed(users=6, groups=2, participants=3, messages=4)
+        self.assertEqual(len(dataset.users), 6)
+        self.assertEqual(Message.objects.count(), 8)
+        for group in Group.objects.all():
+            self.assertEqual(group.participants.count(), 3)
+            self.assertEqual(group.message_count, 4)
+            self.assertIsNotNone(group.last_message_id)
+        self.assertTrue(User.objects.get(email="load5@example.com").check_password(SEED_PASSWORD))
+
+    def test_scenarios_hit_working_endpoints(self):
+        scenarios = build_scenarios(seed(users=6, groups=2, participants=3, messages=4))
+        for name, scenario in scenarios.items():
+            with self.subTest(name):
+                if scenario.prepare is not None:
+                    scenario.prepare(1)
+                client = Client()
+                if scenario.user is not None:
+                    client.defaults["HTTP_AUTHORIZATION"] = authorization(scenario.user(0))
+                self.assertLess(scenario.request(client, 0).status_code, 400)
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0)
+class InstrumentationTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.group = Group.objects.create(host=cls.user, name="general")
+        cls.group.participants.add(cls.user)
+        Message.objects.create(group=cls.group, sender=cls.user, content="hello")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("get-group-messages", args=[self.group.id])
+
+    @override_settings(INSTRUMENTATION_SERVER_TIMING=True)
+    def test_reports_server_timing_and_log_line(self):
+        with self.assertLogs("api.instrumentation", "INFO") as logs:
+            response = self.client.get(self.url)
+        timing = response["Server-Timing"]
+        for metric in ("db;dur=", "serializer;dur=", "handler;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "get_messages")
+        self.assertEqual(record["status"], 200)
+        self.assertGreater(record["queries"], 0)
+        self.assertGreater(record["serializer_ms"], 0)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_not_reported(self):
+        self.assertNotIn("Server-Timing", self.client.get(self.url))
+
+    def test_server_timing_is_for_staff_only(self):
+        with self.assertLogs("api.instrumentation", "INFO"):
+            response = self.client.get(self.url)
+        self.assertNotIn("Server-Timing", response)
+
+        staff = User.objects.create_user("staff@example.com", "secret", username="staff", is_staff=True)
+        self.group.participants.add(staff)
+        self.client.force_authenticate(staff)
+        with self.assertLogs("api.instrumentation", "INFO"):
+            response = self.client.get(self.url)
+        self.assertIn("serializer;dur=", response["Server-Timing"])
+
+    @override_settings(INSTRUMENTATION_SERVER_TIMING=True)
+    @modify_settings(MIDDLEWARE={"remove": "api.instrumentation.RequestInstrumentationMiddleware"})
+    def test_decorator_reports_without_middleware(self):
+        with self.assertLogs("api.instrumentation", "INFO"):
+            response = self.client.get(self.url)
+        self.assertIn("handler;dur=", response["Server-Timing"])
+        self.assertNotIn("total;dur=", response["Server-Timing"])
+
+    @override_settings(INSTRUMENTATION_N_PLUS_ONE_THRESHOLD=2)
+    def test_warns_about_repeated_statements(self):
+        metrics = RequestMetrics()
+        for _ in range(3):
+            metrics.record_query("SELECT 1 FROM api_user WHERE id = %s", 0.001)
+        request = RequestFactory().get("/api/inbox/")
+        with self.assertLogs("api.instrumentation", "WARNING") as logs:
+            report(request, HttpResponse(), metrics)
+        self.assertIn("ran 3 times", logs.output[-1])
+
+
+class MemberBatchTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user("host@example.com", "secret", username="host")
+        cls.users = [
+            User.objects.create_user(f"user{i}@example.com", "secret", username=f"user {i}") for i in range(4)
+        ]
+        cls.group = Group.objects.create(host=cls.host, name="general")
+        cls.group.participants.add(cls.users[0])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+        self.add_url = reverse("add-members", args=[self.group.id])
+        self.remove_url = reverse("remove-members", args=[self.group.id])
+
+    def test_add_reports_diff(self):
+        ids = [user.id for user in self.users]
+        response = self.client.post(self.add_url, {"user_ids": ids + [999999]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"], {
+            "added": sorted(ids[1:]), "already_present": [ids[0]], "missing": [999999],
+        })
+        self.assertEqual(set(self.group.participants.values_list("id", flat=True)), set(ids))
+
+    def test_add_updates_membership_and_caches(self):
+        user = self.users[1]
+        self.assertFalse(is_member(user.id, self.group.id))
+        group_url = reverse("get-group", args=[self.group.id])
+        self.client.get(group_url)
+        self.client.post(self.add_url, {"user_ids": [user.id]}, format="json")
+        self.assertTrue(is_member(user.id, self.group.id))
+        response = self.client.get(group_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIn(user.id, response.data["data"]["participants"])
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        extra = User.objects.bulk_create(
+            User(email=f"bulk{i}@example.com", username=f"bulk {i}", password="x") for i in range(30)
+        )
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.add_url, {"user_ids": [self.users[1].id]}, format="json")
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(self.add_url, {"user_ids": [user.id for user in extra]}, format="json")
+        self.assertEqual(len(small), len(large))
+
+    def test_remove_reports_diff(self):
+        ids = [self.users[0].id, self.users[1].id, 999999]
+        response = self.client.post(self.remove_url, {"user_ids": ids}, format="json")
+        self.assertEqual(response.data["data"], {
+            "removed": [self.users[0].id], "not_present": [self.users[1].id], "missing": [999999],
+        })
+        self.assertFalse(self.group.participants.exists())
+        self.assertFalse(is_member(self.users[0].id, self.group.id))
+
+    def test_only_host_can_change_members(self):
+        self.client.force_authenticate(self.users[0])
+        response = self.client.post(self.add_url, {"user_ids": [self.users[1].id]}, format="json")
+        self.assertEqual(response.status_code, 403)
+
+    def test_rejects_invalid_ids(self):
+        for payload in ({}, {"user_ids": "1"}, {"user_ids": ["1"]}, {"user_ids": [True]}):
+            with self.subTest(payload):
+                response = self.client.post(self.add_url, payload, format="json")
+                self.assertEqual(response.status_code, 400)
+
+
+class AsyncViewTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.outsider = User.objects.create_user("bob@example.com", "secret", username="bob")
+        cls.group = Group.objects.create(host=cls.user, name="general")
+
+    def setUp(self):
+        # Issuing a token records it in the database, so do it outside the
+        # event loop
+        self.tokens = {
+            user.id: f"JWT {get_token_for_user(user).access_token}" for user in (self.user, self.outsider)
+        }
+
+    def headers(self, user):
+        # AsyncClient turns extra arguments into ASGI headers, without the
+        # HTTP_ prefix the synchronous client expects
+        return {"AUTHORIZATION": self.tokens[user.id]}
+
+    async def test_send_and_read_messages_through_async_client(self):
+        response = await self.async_client.post(
+            reverse("send-message", args=[self.group.id]), {"content": "hello"},
+            content_type="application/json", **self.headers(self.user),
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["data"]["sender"]["username"], "alice")
+
+        response = await self.async_client.get(
+            reverse("get-group-messages", args=[self.group.id]), **self.headers(self.user)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["content"] for item in response.json()["data"]], ["hello"])
+        group = await Group.objects.aget(id=self.group.id)
+        self.assertEqual(group.message_count, 1)
+
+    async def test_rejects_non_members_and_unknown_groups(self):
+        url = reverse("get-group-messages", args=[self.group.id])
+        response = await self.async_client.get(url, **self.headers(self.outsider))
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.get(
+            reverse("get-group-messages", args=[999999]), **self.headers(self.user)
+        )
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0, INSTRUMENTATION_SERVER_TIMING=True)
+    async def test_async_requests_are_instrumented(self):
+        with self.assertLogs("api.instrumentation", "INFO") as logs:
+            response = await self.async_client.get(
+                reverse("get-group-messages", args=[self.group.id]), **self.headers(self.user)
+            )
+        self.assertIn("total;dur=", response["Server-Timing"])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "get_messages")
+        self.assertGreater(record["queries"], 0)
+
+
+class JobQueueTests(ChatTestCase):
+    def setUp(self):
+        self.batches = []
+        handlers = patch.dict(JOB_HANDLERS, {"test": self.batches.append})
+        handlers.start()
+        self.addCleanup(handlers.stop)
+
+    def test_send_message_only_enqueues(self):
+        user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        group = Group.objects.create(host=user, name="general")
+        client = APIClient()
+        client.force_authenticate(user)
+        with patch("api.jobs.publish_message") as publish:
+            response = client.post(reverse("send-message", args=[group.id]), {"content": "hi"}, format="json")
+            publish.assert_not_called()
+            job = Job.objects.get()
+            self.assertEqual((job.kind, job.payload), (MESSAGE_CREATED, {"message_id": response.data["data"]["id"]}))
+            drain()
+        publish.assert_called_once_with(group.id, response.data["data"])
+        self.assertFalse(Job.objects.exists())
+
+    def test_deleted_messages_are_not_fanned_out(self):
+        user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        group = Group.objects.create(host=user, name="general")
+        message = Message.objects.create(group=group, sender=user, content="oops")
+        message.soft_delete()
+        enqueue(MESSAGE_CREATED, {"message_id": message.id})
+        with patch("api.jobs.publish_message") as publish:
+            drain()
+        publish.assert_not_called()
+
+    def test_only_failed_deliveries_are_retried(self):
+        user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        group = Group.objects.create(host=user, name="general")
+        delivered, lost = (Message.objects.create(group=group, sender=user, content=content) for content in "ab")
+        for message in (delivered, lost):
+            enqueue(MESSAGE_CREATED, {"message_id": message.id})
+
+        def publish(group_id, data):
+            if data["id"] == lost.id:
+                raise ConnectionError("broker is down")
+
+        with patch("api.jobs.publish_message", side_effect=publish) as published, self.assertLogs("api.jobs", "ERROR"):
+            drain()
+        self.assertEqual(published.call_count, 2)
+        job = Job.objects.get()
+        self.assertEqual((job.payload["message_id"], job.status), (lost.id, Job.PENDING))
+        self.assertEqual(job.last_error, "ConnectionError: broker is down")
+
+    def test_batches_jobs_of_the_same_kind(self):
+        for i in range(3):
+            enqueue("test", {"n": i})
+        enqueue("other", {})
+        with patch.dict(JOB_HANDLERS, {"other": self.batches.append}):
+            self.assertEqual(drain(batch_size=10), 4)
+        self.assertEqual([[job.payload for job in batch] for batch in self.batches], [
+            [{"n": 0}, {"n": 1}, {"n": 2}], [{}],
+        ])
+
+    @override_settings(JOB_MAX_ATTEMPTS=2)
+    def test_retries_with_backoff_then_fails(self):
+        job = enqueue("broken", {})
+        with self.assertLogs("api.jobs", "ERROR"):
+            drain()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn("No handler", job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        # Not due yet
+        self.assertEqual(drain(), 0)
+
+        Job.objects.update(run_after=timezone.now())
+        with self.assertLogs("api.jobs", "ERROR"):
+            drain()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_worker_refuses_to_deliver_through_an_in_process_broker(self):
+        enqueue(MESSAGE_CREATED, {"message_id": 0})
+        with self.assertRaisesMessage(CommandError, "InProcessBroker cannot reach"):
+            call_command("runjobs", "--once")
+        self.assertTrue(Job.objects.exists())
+        call_command("runjobs", "--once", "--kind", "test", stdout=StringIO())
+
+    def test_reclaims_jobs_of_dead_workers(self):
+        enqueue("test", {})
+        self.assertEqual(len(claim("dead")), 1)
+        self.assertEqual(claim("alive"), [])
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT + 1))
+        self.assertEqual(len(claim("alive")), 1)
+
+    def test_stats_report_depth_and_lag(self):
+        enqueue("test", {}, run_after=timezone.now() - timedelta(seconds=30))
+        enqueue("test", {}, run_after=timezone.now() + timedelta(hours=1))
+        stats = queue_stats()
+        self.assertEqual(stats["depth"], 2)
+        self.assertEqual(stats["kinds"]["test"]["due"], 1)
+        self.assertGreaterEqual(stats["lag_seconds"], 30)
+
+        admin = User.objects.create_superuser("admin@example.com", "secret", username="admin")
+        client = APIClient()
+        client.force_authenticate(admin)
+        self.assertEqual(client.get(reverse("job-stats")).data["data"]["depth"], 2)
+
+
+class TokenRevocationTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice@example.com", "secret", username="alice")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.refresh_url = reverse("token_refresh")
+
+    def refresh(self, token):
+        return self.client.post(self.refresh_url, {"refresh": str(token)}, format="json")
+
+    def test_rotated_token_cannot_be_reused(self):
+        token = get_token_for_user(self.user)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(response.data["refresh"]).status_code, 200)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_unrevoked_tokens_are_checked_without_queries(self):
+        token = str(get_token_for_user(self.user))
+        revocations.might_be_revoked("warm-up")
+        with self.assertNumQueries(0):
+            RevocableRefreshToken(token)
+
+    def test_logged_out_token_is_rejected(self):
+        token = get_token_for_user(self.user)
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse("logout"), {"refresh_token": str(token)}, format="json")
+        self.assertEqual(response.status_code, 205)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_rotation_does_not_trust_a_stale_cache(self):
+        token = get_token_for_user(self.user)
+        revocations.might_be_revoked("warm-up")
+        # Revoked by another process, which this one has not synced yet
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token["jti"]))
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_purges_expired_tokens_in_batches(self):
+        past = timezone.now() - timedelta(days=1)
+        for i in range(3):
+            expired = OutstandingToken.objects.create(jti=f"expired-{i}", token="x", expires_at=past)
+            BlacklistedToken.objects.create(token=expired)
+        live = get_token_for_user(self.user)
+        self.assertEqual(purge_expired_tokens(batch_size=2), 3)
+        self.assertEqual(list(OutstandingToken.objects.values_list("jti", flat=True)), [live["jti"]])
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"jti-{i}")
+        self.assertTrue(all(f"jti-{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class ConnectionStatsTests(ChatTestCase):
+    def setUp(self):
+        connection_counters.reset()
+
+    def test_counts_opened_and_closed_connections(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, directory)
+        path = os.path.join(directory, "pooling.sqlite3")
+        self.addCleanup(os.remove, path)
+        wrapper = type(connections[DEFAULT_DB_ALIAS])({**connection.settings_dict, "NAME": path}, alias="pooling")
+        self.addCleanup(wrapper.close)
+
+        wrapper.ensure_connection()
+        wrapper.close()
+        # Closes are noticed at request boundaries
+        self.assertEqual(connection_counters.snapshot()[1]["pooling"]["closed"], 0)
+        connection_counters.check_closed([wrapper])
+
+        # A failed health check replaces the connection within a request
+        wrapper.ensure_connection()
+        wrapper.health_check_enabled = True
+        wrapper.health_check_done = False
+        with patch.object(wrapper, "is_usable", return_value=False):
+            wrapper.close_if_health_check_failed()
+        wrapper.ensure_connection()
+
+        requests, aliases = connection_counters.snapshot()
+        self.assertEqual(aliases["pooling"], {"opened": 3, "closed": 2})
+
+    def test_stats_endpoint_requires_admin(self):
+        user = User.objects.create_user("alice@example.com", "secret", username="alice")
+        admin = User.objects.create_user("root@example.com", "secret", username="root", is_staff=True)
+        client = APIClient()
+        url = reverse("db-stats")
+
+        client.force_authenticate(user)
+        self.assertEqual(client.get(url).status_code, 403)
+
+        client.force_authenticate(admin)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        default = response.data["data"]["databases"]["default"]
+        self.assertEqual(default["conn_max_age"], connection.settings_dict["CONN_MAX_AGE"])
+        self.assertIn("requests_per_connection", default)
+        self.assertGreaterEqual(response.data["data"]["requests"], 1)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"], REPLICA_STICKY_SECONDS=0)
+class ReplicaRoutingTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.group = Group.objects.create(host=cls.alice, name="general")
+        cls.group.participants.add(cls.alice)
+        Message.objects.create(group=cls.group, sender=cls.alice, content="hello")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def reads(self, func):
+        """
+        Run `func` and return the (model, alias) of every read it routed.
+        The test database has no replica, so reads still run on the primary.
+        """
+        routed = []
+        original = ReplicaRouter.db_for_read
+
+        def db_for_read(router, model, **hints):
+            routed.append((model, original(router, model, **hints)))
+            return PRIMARY
+
+        with patch.object(ReplicaRouter, "db_for_read", db_for_read):
+            func()
+        return routed
+
+    def test_routes_reads_inside_replica_blocks_and_writes_to_primary(self):
+        self.assertEqual(Message.objects.all().db, PRIMARY)
+        with reads_from("replica_1"):
+            self.assertEqual(Message.objects.all().db, "replica_1")
+            with primary_reads():
+                self.assertEqual(Message.objects.all().db, PRIMARY)
+            self.assertEqual(router.db_for_write(Message), PRIMARY)
+
+    def test_history_and_directory_reads_go_to_replica(self):
+        routed = self.reads(lambda: self.client.get(reverse("get-group-messages", args=[self.group.id])))
+        self.assertIn((Message, "replica_1"), routed)
+        routed = self.reads(lambda: self.client.get(reverse("get-all-users")))
+        self.assertIn((User, "replica_1"), routed)
+
+    def test_exports_stream_from_replica(self):
+        url = reverse("export-messages", args=[self.group.id])
+        routed = self.reads(lambda: b"".join(self.client.get(url).streaming_content))
+        self.assertIn((Message, "replica_1"), routed)
+        self.assertNotIn((Message, PRIMARY), routed)
+
+    def test_membership_checks_read_from_primary(self):
+        routed = self.reads(lambda: self.client.get(reverse("get-group-messages", args=[self.group.id])))
+        self.assertNotIn((Group.participants.through, "replica_1"), routed)
+
+    def test_writers_read_their_writes_from_primary(self):
+        with override_settings(REPLICA_STICKY_SECONDS=60):
+            response = self.client.post(reverse("send-message", args=[self.group.id]), {"content": "hi"}, format="json")
+            self.assertEqual(response.status_code, 201)
+            self.assertTrue(is_pinned(self.alice.id))
+            routed = self.reads(lambda: self.client.get(reverse("get-group-messages", args=[self.group.id])))
+        self.assertTrue(routed)
+        self.assertNotIn("replica_1", [alias for _, alias in routed])
+
+    @override_settings(REPLICA_STICKY_SECONDS=60)
+    def test_pins_live_in_the_configured_cache(self):
+        pin_to_primary(self.alice.id)
+        self.assertTrue(is_pinned(self.alice.id))
+        with override_settings(REPLICA_PIN_CACHE="default"):
+            self.assertFalse(is_pinned(self.alice.id))
+
+    def test_failed_writes_do_not_pin(self):
+        self.client.post(reverse("send-message", args=[self.group.id]), {}, format="json")
+        self.assertFalse(is_pinned(self.alice.id))
+
+    def test_recently_changed_resources_are_cached_from_primary(self):
+        bob = User.objects.create_user("bob@example.com", "secret", username="bob")
+        self.group.participants.add(bob)
+        client = APIClient()
+        client.force_authenticate(bob)
+        with override_settings(REPLICA_STICKY_SECONDS=60):
+            routed = self.reads(lambda: client.get(reverse("get-group-messages", args=[self.group.id])))
+        self.assertIn((Message, PRIMARY), routed)
+        self.assertNotIn((Message, "replica_1"), routed)
+
+
+class MessageArchiveTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.bob = User.objects.create_user("bob@example.com", "secret", username="bob")
+        cls.group = Group.objects.create(host=cls.alice, name="general")
+        cls.group.participants.add(cls.alice, cls.bob)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        archive_settings = override_settings(MESSAGE_ARCHIVE_DIR=directory, MESSAGE_HOT_MONTHS=3)
+        archive_settings.enable()
+        self.addCleanup(archive_settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.url = reverse("get-group-messages", args=[self.group.id])
+        self.this_month = month_start(timezone.now())
+
+    def post(self, months_ago, count, sender=None):
+        """
+        Store `count` messages created `months_ago` months ago.
+        """
+        start = add_months(self.this_month, -months_ago) + timedelta(days=1)
+        messages = Message.objects.bulk_create(
+            Message(group=self.group, sender=sender or self.alice, content=f"{months_ago} months ago #{i}")
+            for i in range(count)
+        )
+        for i, message in enumerate(messages):
+            Message.objects.filter(id=message.id).update(created=start + timedelta(minutes=i))
+        self.group.record_messages(messages)
+        return [message.id for message in messages]
+
+    def history(self):
+        return list(self.group.message_set.order_by("-created", "-id").values_list("id", flat=True))
+
+    def walk(self, params):
+        seen = []
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item["id"] for item in response.data["data"])
+            if response.data["next"] is None:
+                return seen, response.data["previous"]
+            params = {"limit": params["limit"], "before": response.data["next"]}
+
+    def test_moves_cold_months_to_files(self):
+        old = self.post(6, 4) + self.post(5, 4)
+        recent = self.post(0, 4)
+
+        summary = archive_messages()
+
+        self.assertEqual(summary["messages"], 8)
+        self.assertEqual(list(self.group.message_set.values_list("id", flat=True).order_by("id")), recent)
+        self.assertFalse(Message.objects.filter(id__in=old).exists())
+        for months_ago in (6, 5):
+            self.assertTrue(os.path.exists(archive_path(self.group.id, add_months(self.this_month, -months_ago))))
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.archived_until, add_months(self.this_month, -4))
+
+    def test_history_pages_continue_into_the_archive(self):
+        self.post(6, 5)
+        self.post(5, 5, sender=self.bob)
+        self.post(0, 5)
+        expected = self.history()
+        archive_messages()
+
+        seen, oldest_previous = self.walk({"limit": 4})
+        self.assertEqual(seen, expected)
+
+        # And back from the oldest page towards the newest messages
+        newer = []
+        params = {"after": oldest_previous, "limit": 4}
+        while True:
+            page = self.client.get(self.url, params).data
+            if not page["data"]:
+                break
+            newer = [item["id"] for item in page["data"]] + newer
+            params["after"] = page["previous"]
+        oldest_page = len(expected) % 4 or 4
+        self.assertEqual(newer, expected[:-oldest_page])
+
+    def test_archived_messages_render_like_stored_ones(self):
+        self.post(6, 2, sender=self.bob)
+        self.post(0, 1)
+        before = self.client.get(self.url).data["data"]
+        archive_messages()
+        caches["responses"].clear()
+        self.assertEqual(self.client.get(self.url).data["data"], before)
+
+    def test_keeps_the_latest_message_of_a_group(self):
+        ids = self.post(6, 3)
+        archive_messages()
+        self.assertEqual(list(self.group.message_set.values_list("id", flat=True)), ids[-1:])
+        self.assertEqual(self.walk({"limit": 2})[0], self.history()[:1] + ids[-2::-1])
+
+    def test_archiving_again_moves_nothing_twice(self):
+        self.post(6, 3)
+        self.post(0, 1)
+        archive_messages()
+        self.assertEqual(archive_messages()["messages"], 0)
+        self.assertEqual(len(self.walk({"limit": 50})[0]), 4)
+
+    def test_messages_of_deleted_senders_are_skipped(self):
+        self.post(6, 2, sender=self.bob)
+        kept = self.post(6, 2)
+        self.post(0, 1)
+        archive_messages()
+        self.bob.delete()
+        self.assertEqual(self.walk({"limit": 50})[0], self.history() + kept[::-1])
+
+    def test_unread_counts_include_archived_messages(self):
+        old = self.post(6, 3)
+        self.post(0, 2)
+        archive_messages()
+        url = reverse("mark-read", args=[self.group.id])
+
+        response = self.client.post(url, {"message_id": old[0]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"]["unread_count"], 4)
+        response = self.client.post(url, {"message_id": self.history()[-1]}, format="json")
+        self.assertEqual(response.data["data"]["unread_count"], 1)
+        self.assertEqual(self.client.post(url, {"message_id": 0}, format="json").status_code, 404)
+
+    def test_exports_include_archived_messages(self):
+        self.post(6, 3)
+        self.post(5, 2, sender=self.bob)
+        self.post(0, 2)
+        url = reverse("export-messages", args=[self.group.id])
+
+        def export(**params):
+            response = self.client.get(url, params)
+            return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+        before = export()
+        archive_messages()
+        self.assertEqual(export(), before)
+        self.assertEqual(export(after_id=before[1]["id"]), before[2:])
+
+    def test_deleting_a_group_deletes_its_archive(self):
+        self.post(6, 2)
+        self.post(0, 1)
+        archive_messages()
+        path = archive_path(self.group.id, add_months(self.this_month, -6))
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_deleted_messages_are_not_archived_and_prune_the_feed(self):
+        old = self.post(6, 3)
+        self.post(0, 1)
+        tombstone = Message.objects.get(id=old[1])
+        tombstone.soft_delete()
+
+        archive_messages()
+
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.pruned_seq, tombstone.seq)
+        with gzip.open(archive_path(self.group.id, add_months(self.this_month, -6)), "rt") as archive:
+            self.assertEqual([json.loads(line)["id"] for line in archive], [old[0], old[2]])
+        response = self.client.get(reverse("group-changes", args=[self.group.id]), {"since": 0})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.data["seq"], self.group.change_seq)
+
+
+class CompactMessagePageTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.bob = User.objects.create_user("bob@example.com", "secret", username="bob")
+        cls.group = Group.objects.create(host=cls.alice, name="general")
+        cls.group.participants.add(cls.alice, cls.bob)
+        Message.objects.bulk_create(
+            Message(group=cls.group, sender=(cls.alice, cls.bob)[i % 2], content=f"message {i}") for i in range(6)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.url = reverse("get-group-messages", args=[self.group.id])
+
+    def get_compact(self, **params):
+        response = self.client.get(self.url, params, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        return response, msgpack.unpackb(response.content, timestamp=3)
+
+    def test_json_stays_the_default(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("Accept", response["Vary"])
+
+    def test_compact_page_lists_each_sender_once(self):
+        json_page = self.client.get(self.url, {"limit": 4}).data
+        response, page = self.get_compact(limit=4)
+
+        self.assertEqual(len(page["senders"]), 2)
+        self.assertEqual(page["group"], self.group.id)
+        self.assertEqual(page["next"], json_page["next"])
+        expanded = []
+        for row in page["data"]:
+            message = dict(zip(page["fields"], row))
+            expanded.append({
+                "id": message["id"],
+                "group": page["group"],
+                "sender": page["senders"][message["sender"]],
+                "content": message["content"],
+                "created": message["created"].isoformat().replace("+00:00", "Z"),
+            })
+        self.assertEqual(expanded, json.loads(json.dumps(json_page["data"])))
+
+    def test_formats_are_cached_and_validated_separately(self):
+        json_response = self.client.get(self.url)
+        compact_response, _ = self.get_compact()
+        self.assertNotEqual(json_response["ETag"], compact_response["ETag"])
+
+        cached, _ = self.get_compact()
+        self.assertEqual(cached["X-Cache"], "HIT")
+        self.assertEqual(cached.content, compact_response.content)
+        revalidated = self.client.get(
+            self.url, HTTP_ACCEPT="application/msgpack", HTTP_IF_NONE_MATCH=compact_response["ETag"]
+        )
+        self.assertEqual(revalidated.status_code, 304)
+
+
+class InboxGroupSerializer(serializers.ModelSerializer):
+    """
+    Reference implementation of `InboxGroupValuesSerializer`. Expects
+    `read_count` to be annotated and `last_message__sender` to be selected.
+    """
+    last_message = MessageSerializer(read_only=True)
+    unread_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Group
+        fields = ['id', 'name', 'description', 'last_message', 'message_count', 'unread_count', 'updated']
+
+    def get_unread_count(self, group):
+        return max(group.message_count - group.read_count, 0)
+
+
+class ValuesSerializerTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.bob = User.objects.create_user("bob@example.com", "secret", username="bob")
+        cls.carol = User.objects.create_user("carol@example.com", "secret", username="carol")
+        cls.general = Group.objects.create(host=cls.alice, name="general", description="everyone")
+        cls.general.participants.add(cls.carol, cls.alice, cls.bob)
+        cls.quiet = Group.objects.create(host=None, name="quiet")
+        cls.quiet.participants.add(cls.bob)
+        cls.empty = Group.objects.create(host=cls.bob, name="empty")
+        for i in range(5):
+            Message.objects.create(group=cls.general, sender=(cls.alice, cls.bob)[i % 2], content=f"message {i}")
+        Message.objects.create(group=cls.quiet, sender=cls.bob, content="alone")
+
+    def assertSameJSON(self, fast, reference):
+        # Compare the rendered bytes so key order and formatting count too
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(reference))
+
+    def test_users_match_get_user_serializer(self):
+        users = User.objects.order_by("id")
+        self.assertSameJSON(UserValuesSerializer(users).data, GetUserSerializer(users, many=True).data)
+
+    def test_messages_match_message_serializer(self):
+        messages = Message.objects.order_by("-created", "-id")
+        with self.assertNumQueries(1):
+            data = MessageValuesSerializer(messages).data
+        self.assertSameJSON(data, MessageSerializer(messages.for_listing(), many=True).data)
+
+    def test_groups_match_group_serializer(self):
+        groups = Group.objects.order_by("id")
+        with self.assertNumQueries(2):
+            data = GroupValuesSerializer(groups).data
+        self.assertEqual(data[0]["participants"], sorted([self.alice.id, self.bob.id, self.carol.id]))
+        self.assertIsNone(data[1]["host"])
+        self.assertEqual(data[2]["participants"], [])
+        self.assertSameJSON(data, GroupSerializer(groups, many=True).data)
+
+    def test_inbox_matches_inbox_group_serializer(self):
+        GroupReadState.objects.create(group=self.general, user=self.bob, read_count=2)
+        read_count = GroupReadState.objects.filter(group=OuterRef("pk"), user=self.bob).values("read_count")[:1]
+        groups = Group.objects.annotate(read_count=Coalesce(Subquery(read_count), 0)).order_by("-updated", "-id")
+
+        data = InboxGroupValuesSerializer(groups).data
+        self.assertIsNone(next(item for item in data if item["id"] == self.empty.id)["last_message"])
+        self.assertSameJSON(
+            data, InboxGroupSerializer(groups.select_related("last_message__sender"), many=True).data
+        )
+
+    def test_history_and_group_pages_keep_their_shape(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        history = client.get(reverse("get-group-messages", args=[self.general.id])).data["data"]
+        messages = self.general.message_set.for_listing().order_by("-created", "-id")
+        self.assertSameJSON(history, MessageSerializer(messages, many=True).data)
+        group = client.get(reverse("get-group", args=[self.general.id])).data["data"]
+        self.assertSameJSON(group, GroupSerializer(Group.objects.get(id=self.general.id)).data)
+
+    def test_search_results_keep_their_shape(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.get(reverse("search-messages"), {"q": "message"})
+        self.assertEqual(response.status_code, 200)
+        result = response.data["data"][0]
+        self.assertEqual(list(result), ["id", "group", "sender", "content", "created", "score"])
+        message = Message.objects.for_listing().get(id=result["id"])
+        self.assertSameJSON({k: v for k, v in result.items() if k != "score"}, MessageSerializer(message).data)
+
+
+class ChangeFeedTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice@example.com", "secret", username="alice")
+        cls.bob = User.objects.create_user("bob@example.com", "secret", username="bob")
+        cls.outsider = User.objects.create_user("eve@example.com", "secret", username="eve")
+        cls.group = Group.objects.create(host=cls.alice, name="general")
+        cls.group.participants.add(cls.alice, cls.bob)
+
+    def setUp(self):
+        self.alice_client = APIClient()
+        self.alice_client.force_authenticate(self.alice)
+        self.bob_client = APIClient()
+        self.bob_client.force_authenticate(self.bob)
+        self.url = reverse("group-changes", args=[self.group.id])
+
+    def send(self, content, client=None):
+        client = client or self.bob_client
+        return client.post(reverse("send-message", args=[self.group.id]), {"content": content}, format="json").data["data"]
+
+    def message_url(self, message_id):
+        return reverse("edit-message", args=[self.group.id, message_id])
+
+    def changes(self, since, **params):
+        response = self.alice_client.get(self.url, {"since": since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_inserts_are_numbered_in_order(self):
+        first = self.send("one")
+        self.bob_client.post(
+            reverse("send-messages-bulk", args=[self.group.id]), [{"content": "two"}, {"content": "three"}], format="json"
+        )
+
+        page = self.changes(0)
+        self.assertEqual([item["content"] for item in page["data"]], ["one", "two", "three"])
+        self.assertEqual([item["seq"] for item in page["data"]], [1, 2, 3])
+        self.assertEqual((page["seq"], page["more"]), (3, False))
+        self.assertEqual(page["data"][0], {**first, "seq": 1, "deleted": None})
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.change_seq, 3)
+
+        empty = self.changes(3)
+        self.assertEqual((empty["data"], empty["seq"]), ([], 3))
+
+    def test_pages_follow_seq(self):
+        for i in range(5):
+            self.send(f"message {i}")
+        seen = []
+        since = 0
+        while True:
+            page = self.changes(since, limit=2)
+            seen.extend(item["content"] for item in page["data"])
+            since = page["seq"]
+            if not page["more"]:
+                break
+        self.assertEqual(seen, [f"message {i}" for i in range(5)])
+
+    def test_edits_move_a_message_to_the_end_of_the_feed(self):
+        first = self.send("first")
+        self.send("second")
+        since = self.changes(0)["seq"]
+
+        response = self.bob_client.patch(self.message_url(first["id"]), {"content": "first, edited"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"]["seq"], since + 1)
+
+        page = self.changes(since)
+        self.assertEqual([(item["id"], item["content"]) for item in page["data"]], [(first["id"], "first, edited")])
+        self.assertEqual(self.changes(0)["data"][-1]["id"], first["id"])
+
+    def test_only_the_sender_edits_and_the_host_may_delete(self):
+        message = self.send("mine")
+        response = self.alice_client.patch(self.message_url(message["id"]), {"content": "hijacked"}, format="json")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.alice_client.delete(self.message_url(message["id"])).status_code, 200)
+
+        outsider = APIClient()
+        outsider.force_authenticate(self.outsider)
+        self.assertEqual(outsider.get(self.url).status_code, 403)
+        self.assertEqual(outsider.delete(self.message_url(message["id"])).status_code, 403)
+
+    def test_deletes_leave_a_tombstone(self):
+        kept = self.send("kept")
+        deleted = self.send("regrettable")
+        since = self.changes(0)["seq"]
+
+        self.assertEqual(self.bob_client.delete(self.message_url(deleted["id"])).status_code, 200)
+        self.assertEqual(self.bob_client.delete(self.message_url(deleted["id"])).status_code, 400)
+
+        (tombstone,) = self.changes(since)["data"]
+        self.assertEqual((tombstone["id"], tombstone["content"]), (deleted["id"], ""))
+        self.assertIsNotNone(tombstone["deleted"])
+        history = self.alice_client.get(reverse("get-group-messages", args=[self.group.id])).data["data"]
+        self.assertEqual([item["id"] for item in history], [kept["id"]])
+        inbox = self.alice_client.get(reverse("inbox")).data["data"]
+        self.assertEqual(inbox[0]["last_message"]["id"], kept["id"])
+        self.assertEqual(inbox[0]["message_count"], 1)
+        response = self.alice_client.post(
+            reverse("mark-read", args=[self.group.id]), {"message_id": kept["id"]}, format="json"
+        )
+        self.assertEqual(response.data["data"]["unread_count"], 0)
+
+    def test_deleting_a_read_message_keeps_later_messages_unread(self):
+        first = self.send("one")
+        self.send("two")
+        self.send("three")
+        self.alice_client.post(reverse("mark-read", args=[self.group.id]))
+        self.assertEqual(self.bob_client.delete(self.message_url(first["id"])).status_code, 200)
+        self.send("four")
+
+        inbox = self.alice_client.get(reverse("inbox")).data["data"]
+        self.assertEqual((inbox[0]["message_count"], inbox[0]["unread_count"]), (3, 1))
+
+    def test_since_is_validated(self):
+        for since in ("abc", "-1"):
+            response = self.alice_client.get(self.url, {"since": since})
+            self.assertEqual(response.status_code, 400)
+
+    def test_matches_the_model_serializer(self):
+        self.send("one")
+        Message.objects.get(content="one").soft_delete()
+        self.send("two")
+        messages = Message.objects.filter(group=self.group).order_by("seq")
+        self.assertEqual(
+            JSONRenderer().render(MessageChangeValuesSerializer(messages).data),
+            JSONRenderer().render(MessageChangeSerializer(messages.for_listing(), many=True).data),
+        )
@@ -1,18 +1,29 @@
 from django.urls import path
-from .views import create_superuser, user_views, get_users, create_group, add_members, send_message, get_messages, logout, superuser_login
+from .views import create_superuser, user_views, get_users, create_group, get_group, add_members, remove_members, send_message, send_messages_bulk, get_messages, edit_message, get_changes, get_inbox, mark_read, search, export_messages, get_cache_stats, get_job_stats, get_db_stats, logout, superuser_login
 
 urlpatterns = [
     path('superuser/', create_superuser, name='create-superuser'),  # Create a superuser
     path("auth/superuser/login/", superuser_login, name="superuser_login"), #Login to superuser account
 
     path('users/', user_views, name='user-management'),  # Create, update, delete users
-      path('users/all/', get_users, name='get-all-users'),  # Get all users
+      path('users/all/', get_users, name='get-all-users'),  # Get a page of the user directory
     path('users/<int:user_id>/', get_users, name='get-user'),  # Get a specific user by ID
   
     path('groups/', create_group, name='create-group'),  # Create a new group
+    path('groups/<int:group_id>/', get_group, name='get-group'),  # Retrieve a group
     path('groups/<int:group_id>/add-members/', add_members, name='add-members'),  # Add members to a group
+    path('groups/<int:group_id>/remove-members/', remove_members, name='remove-members'),  # Remove members from a group
     path('groups/<int:group_id>/messages/', send_message, name='send-message'),  # Send a message to a group
-    path('messages/', get_messages, name='get-messages'),  # Retrieve all messages
-    path('messages/<int:group_id>/', get_messages, name='get-group-messages'),  # Retrieve messages for a specific group
+    path('groups/<int:group_id>/messages/bulk/', send_messages_bulk, name='send-messages-bulk'),  # Send a batch of messages to a group
+    path('groups/<int:group_id>/messages/<int:message_id>/', edit_message, name='edit-message'),  # Edit or delete a message
+    path('groups/<int:group_id>/changes/', get_changes, name='group-changes'),  # Message changes after a sequence number
+    path('groups/<int:group_id>/export/', export_messages, name='export-messages'),  # Stream a group's history as NDJSON or CSV
+    path('groups/<int:group_id>/read/', mark_read, name='mark-read'),  # Mark a group as read
+    path('inbox/', get_inbox, name='inbox'),  # List the user's groups with unread counts
+    path('messages/search/', search, name='search-messages'),  # Full-text search in the user's groups
+    path('messages/<int:group_id>/', get_messages, name='get-group-messages'),  # Retrieve a page of messages for a specific group
+    path('cache/stats/', get_cache_stats, name='cache-stats'),  # Response cache hit/miss counters
+    path('jobs/stats/', get_job_stats, name='job-stats'),  # Background job queue depth and lag
+    path('db/stats/', get_db_stats, name='db-stats'),  # Database connections opened per request
     path("auth/logout/", logout, name='logout'),
 ]
\ No newline at end of file
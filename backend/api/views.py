@@ -1,18 +1,55 @@
 # views.py
+import functools
+import time
+
+from adrf.decorators import api_view as async_api_view
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.db.models import Count
+from django.utils.cache import patch_vary_headers
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes, renderer_classes
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.generics import ListAPIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.contrib.auth import authenticate
 
-from .models import User, Group, Message
-from .serializers import SuperUserSerializer, UserSerializer, GroupSerializer, MessageSerializer, GetUserSerializer
+from .archive import count_archived_after, find_archived, merge_archived
+from .authentication import RevocableRefreshToken, aget_full_user, get_full_user, get_token_for_user
+from .changes import ChangesPruned, list_changes
+from .cache import USERS, acached_read, cached_read, group_version, invalidate, stats as cache_stats, user_version
+from .conditional import make_etag
+from .directory import list_users
+from .export import EXPORT_FORMATS, export_rows
+from .instrumentation import instrument
+from .jobs import MESSAGE_CREATED, aenqueue, enqueue_many, queue_stats
+from .models import User, Group, GroupReadState, Message
+from .parsers import NDJSONParser
+from .pagination import InvalidCursor, apaginate_by_created
+from .search import search_messages
+from .pooling import connection_stats
+from .renderers import MessagePackRenderer, compact_messages
+from .routing import bind_reads, read_from_replica
+from .membership import add_participants, ais_member, is_member, remove_participants
+from .serializers import SuperUserSerializer, UserSerializer, GroupSerializer, MessageSerializer, GetUserSerializer, BulkMessageSerializer, GroupValuesSerializer, InboxGroupValuesSerializer, MessageChangeSerializer, MessageValuesSerializer
+
+
+def not_a_member_response():
+    return Response(
+        {
+            "status": False,
+            "message": "You are not a member of this group.",
+        },
+        status=status.HTTP_403_FORBIDDEN,
+    )
+
 
 @api_view(['POST'])
 def create_superuser(request):
@@ -82,7 +119,7 @@ def superuser_login(request):
             )
 
         # Generate tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = get_token_for_user(user)
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -200,17 +237,30 @@ def user_views(request):
             status=status.HTTP_204_NO_CONTENT
         )
 
+@instrument
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def get_users(request, user_id=None):
     """
-    API view to get all users or a single user by ID.
+    API view to get a page of the user directory or a single user by ID.
+
+    Query parameters (directory only):
+        ids (str): Comma separated ids to resolve in one request.
+        search (str): Case-insensitive prefix of the username or email.
+        fields (str): Comma separated subset of `id,username,email`.
+        cursor (str): `next` cursor of the previous page.
+        limit (int): Page size.
     """
     if user_id is not None:
         try:
-            user = User.objects.get(id=user_id)
-            serializer = GetUserSerializer(user)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+
+            def build():
+                user = User.objects.get(id=user_id)
+                etag = make_etag("user", user.id, user.updated_at)
+                return etag, user.updated_at, lambda: GetUserSerializer(user).data
+
+            return cached_read(request, "user", [user_version(user_id)], build)
         except User.DoesNotExist as e:
             return Response(
                 {
@@ -221,18 +271,31 @@ def get_users(request, user_id=None):
                 status=status.HTTP_404_NOT_FOUND
             )
     
-    # If no user_id is provided, return all users
+    # If no user_id is provided, return a page of the user directory
     try:
-        users = User.objects.all()
-        serializer = GetUserSerializer(users, many=True)
-        return Response(
-            {
+
+        def build():
+            page = list_users(request.query_params)
+            etag = make_etag("users", request.query_params.get("fields"), page.versions, page.next)
+            # No Last-Modified: a deleted user leaves the page without
+            # moving max(updated_at) forward
+            return etag, None, lambda: {
               "status": True,
                "message": "Data retrieved successfully",
-              "data": serializer.data
-            },
-            status=status.HTTP_200_OK
-        )
+              "data": page.rows,
+              "next": page.next,
+            }
+
+        return cached_read(request, "users", [USERS], build)
+    except InvalidCursor as e:
+        return Response(
+                {
+                    "status": False,
+                    "message": "Invalid query parameters",
+                    "error": str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
     except Exception as e:
         return Response(
                 {
@@ -253,7 +316,7 @@ def create_group(request):
     try:
         serializer = GroupSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(host=request.user)   # Set the host to the authenticated user
+            serializer.save(host_id=request.user.id)   # Set the host to the authenticated user
             return Response(
                     {
                         "status": True,
@@ -281,15 +344,47 @@ def create_group(request):
             )
 
 
-@api_view(['POST'])
+@api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def add_members(request, group_id):
+def get_group(request, group_id):
     """
-    Add members to an existing group.
+    Retrieve a single group the user belongs to.
     """
     group = get_object_or_404(Group, id=group_id)
+    if not is_member(request.user.id, group.id):
+        return not_a_member_response()
+
 
-    if group.host.id != request.user.id:
+    def build():
+        # `updated` is bumped on participant changes too, see api.signals
+        etag = make_etag("group", group.id, group.updated)
+        return etag, group.updated, lambda: {
+            "status": True,
+            "message": "Group retrieved successfully",
+            "data": GroupValuesSerializer(Group.objects.filter(id=group.id)).data[0]
+        }
+
+    return cached_read(request, "group", [group_version(group.id)], build)
+
+
+def parse_member_ids(data):
+    """
+    Return the `user_ids` of a membership request, or raise ValueError.
+    """
+    user_ids = data.get("user_ids") if hasattr(data, "get") else None
+    if not isinstance(user_ids, list) or not all(
+        isinstance(user_id, int) and not isinstance(user_id, bool) for user_id in user_ids
+    ):
+        raise ValueError("user_ids must be a list of integers.")
+    if len(user_ids) > settings.MEMBERSHIP_BATCH_MAX_ITEMS:
+        raise ValueError(f"At most {settings.MEMBERSHIP_BATCH_MAX_ITEMS} user ids can be sent at once.")
+    return user_ids
+
+
+def change_members(request, group_id, apply, message, changed_key, unchanged_key):
+    group = get_object_or_404(Group.objects.only("id", "host_id"), id=group_id)
+
+    if group.host_id != request.user.id:
         return Response(
                     {
                         "status": False,
@@ -297,36 +392,95 @@ def add_members(request, group_id):
                     },
                     status=status.HTTP_403_FORBIDDEN,
                 )
-    #Need to remind the user that the participant is already been added
-    user_ids = request.data.get('user_ids', [])
-    users = User.objects.filter(id__in=user_ids)
-    group.participants.add(*users)
-    serializer = GroupSerializer(group)
+    try:
+        user_ids = parse_member_ids(request.data)
+    except ValueError as error:
+        return Response(
+            {"status": False, "message": "Invalid request.", "error": str(error)},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    change = apply(group, user_ids)
     return Response(
         {
            "status": True,
-           "message": "Members added successfully to the group",
-           "data": serializer.data
+           "message": message,
+           "data": {
+               changed_key: change.changed,
+               unchanged_key: change.unchanged,
+               "missing": change.missing,
+           },
         },
         status=status.HTTP_200_OK
     )
 
+
+@instrument
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def send_message(request, group_id):
+def add_members(request, group_id):
+    """
+    Add members to an existing group.
+
+    Only ids go in and out: the response lists the users that were added,
+    those already present and the ids that match no user.
+    """
+    return change_members(
+        request, group_id, add_participants,
+        "Members added successfully to the group", "added", "already_present",
+    )
+
+
+@instrument
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def remove_members(request, group_id):
+    """
+    Remove members from an existing group.
+
+    The response lists the users that were removed, those that were not
+    members and the ids that match no user.
+    """
+    return change_members(
+        request, group_id, remove_participants,
+        "Members removed successfully from the group", "removed", "not_present",
+    )
+
+
+async def aget_group(group_id):
+    try:
+        return await Group.objects.aget(id=group_id)
+    except Group.DoesNotExist:
+        raise Http404("No Group matches the given query.")
+
+
+@instrument
+@async_api_view(['POST'])
+@permission_classes([IsAuthenticated])
+async def send_message(request, group_id):
     """
     Send a message to a specific group.
+
+    Runs natively under ASGI: every database call goes through Django's
+    async ORM, so a waiting request does not hold a worker thread.
     """
-    group = get_object_or_404(Group, id=group_id)
-    request.data['group'] = group_id
-    serializer = MessageSerializer(data=request.data)
+    group = await aget_group(group_id)
+    if not await ais_member(request.user.id, group.id):
+        return not_a_member_response()
+    # The group comes from the URL, so validation needs no database access
+    serializer = BulkMessageSerializer(data=request.data)
     if serializer.is_valid():
-        message = serializer.save(group=group, sender=request.user)
+        sender = await aget_full_user(request.user)
+        message = await Message.objects.acreate(group=group, sender=sender, **serializer.validated_data)
+        await group.arecord_messages([message])
+        # Fan-out to WebSocket subscribers happens in a background job
+        await aenqueue(MESSAGE_CREATED, {"message_id": message.id})
+        data = MessageSerializer(message).data
         return Response(
             {
               "status": True,
                "message": "Message sent successfully",
-               "data": serializer.data
+               "data": data
             },
             status=status.HTTP_201_CREATED
         )
@@ -339,24 +493,294 @@ def send_message(request, group_id):
         status=status.HTTP_400_BAD_REQUEST
     )
 
+@instrument
+@api_view(['POST'])
+@parser_classes([JSONParser, NDJSONParser])
+@permission_classes([IsAuthenticated])
+def send_messages_bulk(request, group_id):
+    """
+    Send a batch of messages to a specific group in one request.
+
+    Accepts a JSON array or an NDJSON stream of `{"content": ...}` objects.
+    The batch is validated as a whole and written with multi-row inserts in
+    one transaction; either every message is stored or none is.
+
+    Query parameters:
+        chunk_size (int): Rows per INSERT, defaults to `BULK_MESSAGE_CHUNK_SIZE`.
+    """
+    group = get_object_or_404(Group, id=group_id)
+    if not is_member(request.user.id, group.id):
+        return not_a_member_response()
+    items = request.data
+    if not isinstance(items, list):
+        return Response(
+            {
+                "status": False,
+                "message": "Expected a list of messages",
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > settings.BULK_MESSAGE_MAX_ITEMS:
+        return Response(
+            {
+                "status": False,
+                "message": f"A batch may contain at most {settings.BULK_MESSAGE_MAX_ITEMS} messages",
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        chunk_size = int(request.query_params.get("chunk_size", settings.BULK_MESSAGE_CHUNK_SIZE))
+        if chunk_size < 1:
+            raise ValueError(chunk_size)
+    except ValueError:
+        return Response(
+            {
+                "status": False,
+                "message": "chunk_size must be a positive integer",
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    started = time.perf_counter()
+    serializer = BulkMessageSerializer(data=items, many=True, context={"chunk_size": chunk_size})
+    if not serializer.is_valid():
+        return Response(
+            {
+                "status": False,
+                "message": "Unable to send the messages",
+                "error": serializer.errors
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    messages = serializer.save(group=group, sender=get_full_user(request.user))
+    group.record_messages(messages)
+    # bulk_create sends no post_save signals
+    invalidate(group_version(group.id))
+    elapsed = time.perf_counter() - started
+
+    enqueue_many(MESSAGE_CREATED, [{"message_id": message.id} for message in messages])
+    return Response(
+        {
+            "status": True,
+            "message": "Messages sent successfully",
+            "data": [{"index": index, "id": message.id} for index, message in enumerate(messages)],
+            "metrics": {
+                "count": len(messages),
+                "chunk_size": chunk_size,
+                "elapsed_ms": round(elapsed * 1000, 3),
+                "messages_per_second": round(len(messages) / elapsed, 1) if elapsed else None,
+            },
+        },
+        status=status.HTTP_201_CREATED
+    )
+
+
+# Columns of a history page: the serialized ones and the validators
+HISTORY_LOOKUPS = [*MessageValuesSerializer.lookups, "updated", "sender__updated_at"]
+
+
+@instrument
+@async_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([*api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer])
+@read_from_replica
+async def get_messages(request, group_id):
+    """
+    Retrieve one page of messages for a specific group, newest first.
+
+    Runs natively under ASGI, like `send_message`. Clients sending
+    `Accept: application/msgpack` get the compact page described in
+    `api.renderers`.
+
+    Query parameters:
+        before (str): Cursor returned as `next`, fetches older messages.
+        after (str): Cursor returned as `previous`, fetches newer messages.
+        limit (int): Page size, capped at `pagination.MAX_PAGE_SIZE`.
+    """
+    try:
+        group = await aget_group(group_id)
+        if not await ais_member(request.user.id, group.id):
+            return not_a_member_response()
+
+        async def build():
+            messages, next_cursor, previous_cursor = await apaginate_by_created(
+                Message.objects.filter(group_id=group.id).visible().values(*HISTORY_LOOKUPS), request.query_params,
+                extend=functools.partial(merge_archived, group, HISTORY_LOOKUPS),
+            )
+            # Validators cover every row of the page, including its sender
+            versions = [(message["id"], message["updated"], message["sender__updated_at"]) for message in messages]
+            etag = make_etag("messages", compact, group.id, versions, next_cursor, previous_cursor)
+            # Only the ETag: a deleted message or sender leaves the page
+            # without moving any modification time forward
+            last_modified = None
+
+            def render():
+                if compact:
+                    return {
+                        "status": True,
+                        "message": "Messages retrieved successfully",
+                        "group": group.id,
+                        **compact_messages(messages),
+                        "next": next_cursor,
+                        "previous": previous_cursor,
+                    }
+                return {
+                  "status": True,
+                   "message": "Messages retrieved successfully",
+                   "data": MessageValuesSerializer.represent(messages),
+                   "next": next_cursor,
+                   "previous": previous_cursor,
+                }
+            return etag, last_modified, render
+
+        compact = request.accepted_renderer.format == MessagePackRenderer.format
+        response = await acached_read(request, "messages", [group_version(group.id)], build)
+        patch_vary_headers(response, ["Accept"])
+        return response
+    except InvalidCursor as e:
+        return Response(
+                {
+                    "status": False,
+                    "message": "Invalid pagination parameters",
+                    "error": str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    except Http404:
+        raise
+    except Exception as e:
+        return Response(
+                {
+                    "status": False,
+                    "message": "Something went wrong issue with the server",
+                    "error": str(e)
+                }, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def get_messages(request, group_id=None):
+@read_from_replica
+def export_messages(request, group_id):
     """
-    Retrieve messages for a specific group or all messages if no group_id is provided.
+    Stream the full history of a group, oldest first.
+
+    Query parameters:
+        output (str): `ndjson` (default) or `csv`.
+        after_id (int): Resume the export after this message.
     """
+    group = get_object_or_404(Group, id=group_id)
+    if not is_member(request.user.id, group.id):
+        return not_a_member_response()
+
+    output = request.query_params.get("output", "ndjson")
+    if output not in EXPORT_FORMATS:
+        return Response(
+            {
+                "status": False,
+                "message": f"output must be one of {', '.join(EXPORT_FORMATS)}",
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
     try:
-        if group_id:
-            group = get_object_or_404(Group, id=group_id)
-            messages = group.message_set.all()
-        else:
-            messages = Message.objects.all()
-        
-        serializer = MessageSerializer(messages, many=True)
+        after_id = request.query_params.get("after_id")
+        rows = export_rows(group.id, int(after_id) if after_id else None)
+    except (ValueError, Message.DoesNotExist) as e:
+        return Response(
+            {
+                "status": False,
+                "message": "Invalid after_id",
+                "error": str(e)
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    content_type, encode = EXPORT_FORMATS[output]
+    response = StreamingHttpResponse(bind_reads(encode(rows)), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="group-{group.id}.{output}"'
+    return response
+
+
+@instrument
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search(request):
+    """
+    Full-text search over the messages of the groups the user belongs to,
+    best matches first. Archived messages are not searched.
+
+    Query parameters:
+        q (str): Search terms.
+        group (int): Restrict the search to one group.
+        cursor (str): `next` cursor of the previous page.
+        limit (int): Page size.
+    """
+    query = request.query_params.get("q", "").strip()
+    if not query:
+        return Response(
+            {
+                "status": False,
+                "message": "The q parameter is required",
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        data, next_cursor = search_messages(request.user.id, query, request.query_params)
         return Response(
             {
               "status": True,
                "message": "Messages retrieved successfully",
+               "data": data,
+               "next": next_cursor,
+            },
+            status=status.HTTP_200_OK
+        )
+    except InvalidCursor as e:
+        return Response(
+                {
+                    "status": False,
+                    "message": "Invalid search parameters",
+                    "error": str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    except Exception as e:
+        return Response(
+                {
+                    "status": False,
+                    "message": "Something went wrong issue with the server",
+                    "error": str(e)
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+@instrument
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_inbox(request):
+    """
+    List the groups of the authenticated user with their latest message and
+    unread count, most recently active first. Runs a single query whatever
+    the number of groups.
+    """
+    try:
+        user_id = request.user.id
+        read_count = GroupReadState.objects.filter(
+            group=OuterRef('pk'), user_id=user_id
+        ).values('read_count')[:1]
+        member_of = Group.participants.through.objects.filter(user_id=user_id).values('group_id')
+        groups = (
+            Group.objects.filter(Q(id__in=member_of) | Q(host_id=user_id))
+            .annotate(read_count=Coalesce(Subquery(read_count), 0))
+            .order_by('-updated', '-id')
+        )
+        serializer = InboxGroupValuesSerializer(groups)
+        return Response(
+            {
+              "status": True,
+               "message": "Inbox retrieved successfully",
                "data": serializer.data
             },
             status=status.HTTP_200_OK
@@ -367,11 +791,244 @@ def get_messages(request, group_id=None):
                     "status": False,
                     "message": "Something went wrong issue with the server",
                     "error": str(e)
-                }, 
+                },
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
 
+@api_view(['PATCH', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def edit_message(request, group_id, message_id):
+    """
+    Edit (PATCH, sender only) or delete (DELETE, sender or group host) a
+    message. A deleted message leaves a tombstone that the change feed
+    reports; it disappears from the history, search and exports.
+    """
+    group = get_object_or_404(Group, id=group_id)
+    if not is_member(request.user.id, group.id):
+        return not_a_member_response()
+    message = get_object_or_404(Message.objects.for_listing(), id=message_id, group=group)
+    allowed = message.sender_id == request.user.id or (request.method == 'DELETE' and group.host_id == request.user.id)
+    if not allowed:
+        return Response(
+            {
+                "status": False,
+                "message": "You are not allowed to change this message",
+            },
+            status=status.HTTP_403_FORBIDDEN
+        )
+    if message.deleted is not None:
+        return Response(
+            {
+                "status": False,
+                "message": "The message was deleted",
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if request.method == 'DELETE':
+        with transaction.atomic():
+            message.soft_delete()
+            # The inbox shows the latest message that is still there
+            latest = group.message_set.visible().order_by('-created', '-id').values('id')[:1]
+            Group.objects.filter(id=group.id, last_message=message.id).update(last_message=Subquery(latest))
+        return Response(
+            {
+                "status": True,
+                "message": "Message deleted successfully",
+                "data": MessageChangeSerializer(message).data
+            },
+            status=status.HTTP_200_OK
+        )
+
+    serializer = BulkMessageSerializer(message, data=request.data)
+    if not serializer.is_valid():
+        return Response(
+            {
+                "status": False,
+                "message": "Unable to edit the message",
+                "error": serializer.errors
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    message.content = serializer.validated_data['content']
+    message.save(update_fields=['content', 'updated'])
+    return Response(
+        {
+            "status": True,
+            "message": "Message edited successfully",
+            "data": MessageChangeSerializer(message).data
+        },
+        status=status.HTTP_200_OK
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@read_from_replica
+def get_changes(request, group_id):
+    """
+    Changes to a group's messages after the `since` sequence number, oldest
+    first, as described in `api.changes`. Pass the returned `seq` as
+    `since` to get the next ones; 410 means the client must reload the
+    history and continue from the `seq` in the response.
+
+    Query parameters:
+        since (int): `seq` of the previous response, 0 for everything.
+        limit (int): Page size, capped at `pagination.MAX_PAGE_SIZE`.
+    """
+    group = get_object_or_404(Group, id=group_id)
+    if not is_member(request.user.id, group.id):
+        return not_a_member_response()
+    try:
+        changes, seq, more = list_changes(group, request.query_params)
+        return Response(
+            {
+              "status": True,
+               "message": "Changes retrieved successfully",
+               "data": changes,
+               "seq": seq,
+               "more": more,
+            },
+            status=status.HTTP_200_OK
+        )
+    except InvalidCursor as e:
+        return Response(
+                {
+                    "status": False,
+                    "message": "Invalid change feed parameters",
+                    "error": str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    except ChangesPruned as e:
+        return Response(
+                {
+                    "status": False,
+                    "message": "Reload the history, then follow the changes from seq",
+                    "error": str(e),
+                    "seq": group.change_seq,
+                },
+                status=status.HTTP_410_GONE
+            )
+    except Exception as e:
+        return Response(
+                {
+                    "status": False,
+                    "message": "Something went wrong issue with the server",
+                    "error": str(e)
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_read(request, group_id):
+    """
+    Mark a group as read up to `message_id`, or up to its latest message
+    when no id is given.
+    """
+    group = get_object_or_404(Group, id=group_id)
+    if not is_member(request.user.id, group.id):
+        return not_a_member_response()
+    try:
+        message_id = int(request.data.get("message_id", group.last_message_id))
+    except TypeError:
+        message_id = None
+    except ValueError:
+        return Response(
+            {
+                "status": False,
+                "message": "message_id must be an integer",
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if message_id is None:
+        read_count = 0
+    elif message_id == group.last_message_id:
+        read_count = group.message_count
+    else:
+        position = group.message_set.filter(id=message_id).values_list('created', 'id').first()
+        if position is None and group.archived_until is not None:
+            position = find_archived(group.id, message_id)
+        if position is None:
+            raise Http404
+        # Counting what is newer works when the older messages are archived
+        created, _ = position
+        newer = group.message_set.visible().filter(
+            Q(created__gt=created) | Q(created=created, id__gt=message_id)
+        ).count()
+        if group.archived_until is not None and created < group.archived_until:
+            newer += count_archived_after(group.id, position)
+        read_count = max(group.message_count - newer, 0)
+
+    GroupReadState.objects.update_or_create(
+        user_id=request.user.id,
+        group=group,
+        defaults={"last_read_message_id": message_id, "read_count": read_count},
+    )
+    return Response(
+        {
+            "status": True,
+            "message": "Group marked as read",
+            "data": {
+                "last_read_message": message_id,
+                "unread_count": max(group.message_count - read_count, 0),
+            },
+        },
+        status=status.HTTP_200_OK
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_cache_stats(request):
+    """
+    Hit/miss counters of the response cache in this process.
+    """
+    return Response(
+        {
+            "status": True,
+            "message": "Cache statistics retrieved successfully",
+            "data": cache_stats.as_dict()
+        },
+        status=status.HTTP_200_OK
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_job_stats(request):
+    """
+    Depth and lag of the background job queue.
+    """
+    return Response(
+        {
+            "status": True,
+            "message": "Job queue statistics retrieved successfully",
+            "data": queue_stats()
+        },
+        status=status.HTTP_200_OK
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_db_stats(request):
+    """
+    Database connections opened, closed and reused by this process.
+    """
+    return Response(
+        {
+            "status": True,
+            "message": "Database connection statistics retrieved successfully",
+            "data": connection_stats()
+        },
+        status=status.HTTP_200_OK
+    )
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def logout(request):
@@ -381,7 +1038,7 @@ def logout(request):
         refresh_token = request.data["refresh_token"]
 
         # Create a RefreshToken object with the refresh token
-        token = RefreshToken(refresh_token)
+        token = RevocableRefreshToken(refresh_token)
 
         # Blacklist the refresh token to invalidate it
         token.blacklist()
@@ -0,0 +1,93 @@
+# websocket.py
+import asyncio
+import re
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .authentication import ActiveTokenUserAuthentication
+from .broker import get_broker, group_channel
+from .membership import is_member
+from .models import Group
+
+GROUP_PATH = re.compile(r"^/ws/groups/(?P<group_id>\d+)/$")
+
+# Application specific close codes, mirroring the HTTP status they stand for
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+
+
+def authorize(raw_token, group_id):
+    """
+    Validate a simplejwt access token and check the user may read the group.
+    Returns a close code on failure and None on success.
+    """
+    close_old_connections()
+    authentication = ActiveTokenUserAuthentication()
+    try:
+        user = authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return CLOSE_UNAUTHORIZED
+
+    if not Group.objects.filter(id=group_id).exists():
+        return CLOSE_NOT_FOUND
+    if not is_member(user.id, group_id):
+        return CLOSE_FORBIDDEN
+    return None
+
+
+async def websocket_application(scope, receive, send):
+    """
+    ASGI application streaming live messages of one group.
+
+    Clients connect to `/ws/groups/<group_id>/?token=<access token>` and
+    receive a `message.created` event for every message sent to the group.
+    """
+    event = await receive()
+    if event["type"] != "websocket.connect":
+        return
+
+    match = GROUP_PATH.match(scope["path"])
+    if match is None:
+        await send({"type": "websocket.close", "code": CLOSE_NOT_FOUND})
+        return
+    group_id = int(match["group_id"])
+
+    query = parse_qs(scope.get("query_string", b"").decode())
+    raw_token = query.get("token", [None])[0]
+    if raw_token is None:
+        await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+        return
+
+    error = await sync_to_async(authorize)(raw_token.encode(), group_id)
+    if error is not None:
+        await send({"type": "websocket.close", "code": error})
+        return
+
+    subscription = await get_broker().subscribe(group_channel(group_id))
+    await send({"type": "websocket.accept"})
+
+    async def forward():
+        while True:
+            payload = await subscription.get()
+            await send({"type": "websocket.send", "text": payload})
+
+    async def wait_for_disconnect():
+        while True:
+            event = await receive()
+            if event["type"] == "websocket.disconnect":
+                return
+
+    tasks = [asyncio.ensure_future(forward()), asyncio.ensure_future(wait_for_disconnect())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await subscription.close()
@@ -56,11 +56,13 @@ AUTH_USER_MODEL = "api.User"
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    "api.instrumentation.RequestInstrumentationMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    "api.routing.ReplicaPinningMiddleware",
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,6 +91,19 @@ WSGI_APPLICATION = 'chartapp.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+#
+# Each worker thread keeps its connection for DB_CONN_MAX_AGE seconds (0
+# closes it after every request) and checks that a reused connection still
+# works before the request uses it. Behind a transaction-pooling proxy such
+# as PgBouncer, set DB_POOLER: connections are then returned to the pooler
+# after every request, and server-side cursors, which do not survive a
+# pooled transaction, are disabled. Use the pooler with the ASGI entry
+# point, whose ORM calls run on short-lived threads that cannot keep a
+# persistent connection. `python manage.py benchmark connections` compares
+# both modes; GET /api/db/stats/ reports how often connections are opened.
+
+DB_POOLER = env.bool("DB_POOLER", default=False)
+
 DATABASES = {
     "default": {
         "ENGINE": env("DB_ENGINE"),
@@ -97,9 +112,32 @@ DATABASES = {
         "PASSWORD": env("DB_PASSWORD"),
         "HOST": env("DB_HOST"),
         "PORT": env("DB_PORT"),
+        "CONN_MAX_AGE": 0 if DB_POOLER else env.int("DB_CONN_MAX_AGE", default=60),
+        "CONN_HEALTH_CHECKS": env.bool("DB_CONN_HEALTH_CHECKS", default=True),
+        "DISABLE_SERVER_SIDE_CURSORS": DB_POOLER,
     }
 }
 
+# Read replicas
+#
+# DB_REPLICAS lists the hosts of replicas of the primary (database files
+# with SQLite); each becomes a "replica_<n>" alias with the primary's
+# other settings. api.routing sends the reads of the history and directory
+# endpoints to them, except for users who wrote in the last
+# REPLICA_STICKY_SECONDS, which should cover the replication lag. The pins
+# are kept in the REPLICA_PIN_CACHE cache alias, "responses" by default, so
+# they are shared whenever the response cache is (see Caches below).
+
+DATABASE_REPLICAS = []
+for index, replica in enumerate(env.list("DB_REPLICAS", default=[]), start=1):
+    location = "NAME" if DATABASES["default"]["ENGINE"].endswith("sqlite3") else "HOST"
+    DATABASES[f"replica_{index}"] = {**DATABASES["default"], location: replica, "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(f"replica_{index}")
+
+DATABASE_ROUTERS = ["api.routing.ReplicaRouter"]
+REPLICA_STICKY_SECONDS = env.int("REPLICA_STICKY_SECONDS", default=5)
+REPLICA_PIN_CACHE = env("REPLICA_PIN_CACHE", default="responses")
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.sqlite3',
@@ -108,6 +146,35 @@ DATABASES = {
 # }
 
 
+# Caches
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+#
+# "responses" backs the read endpoint cache in api/cache.py. The default
+# in-process LRU is per worker; set RESPONSE_CACHE_BACKEND to
+# django.core.cache.backends.redis.RedisCache and RESPONSE_CACHE_LOCATION to a
+# redis:// URL to share it between processes.
+
+RESPONSE_CACHE_BACKEND = env(
+    "RESPONSE_CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "responses": {
+        "BACKEND": RESPONSE_CACHE_BACKEND,
+        "LOCATION": env("RESPONSE_CACHE_LOCATION", default="responses"),
+        "TIMEOUT": env.int("RESPONSE_CACHE_TIMEOUT", default=300),
+    },
+}
+
+if RESPONSE_CACHE_BACKEND.endswith("LocMemCache"):
+    CACHES["responses"]["OPTIONS"] = {
+        "MAX_ENTRIES": env.int("RESPONSE_CACHE_MAX_ENTRIES", default=10000),
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -151,7 +218,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # Builds request.user from the token claims and checks the user is
+        # still active through the user cache instead of loading the user
+        # row on every request (see api/authentication.py)
+        "api.authentication.ActiveTokenUserAuthentication",
     ),
 }
 
@@ -172,6 +242,86 @@ SIMPLE_JWT = {
     "ISSUER": None,
     "JWK_URL": None,
     "LEEWAY": 0,
+    "TOKEN_USER_CLASS": "api.authentication.LazyTokenUser",
+}
+
+# Per-process cache of user rows loaded by LazyTokenUser, in seconds.
+# Entries are invalidated whenever a user is saved or deleted.
+USER_CACHE_TTL = env.int("USER_CACHE_TTL", default=60)
+USER_CACHE_SIZE = env.int("USER_CACHE_SIZE", default=10000)
+
+# Per-process Bloom filter of revoked refresh tokens (see api/revocation.py).
+# Revocations made by other processes are read every REVOCATION_CACHE_REFRESH
+# seconds; purge expired tokens with `python manage.py purgetokens`.
+REVOCATION_CACHE_CAPACITY = env.int("REVOCATION_CACHE_CAPACITY", default=100000)
+REVOCATION_CACHE_REFRESH = env.float("REVOCATION_CACHE_REFRESH", default=1.0)
+
+# Per-process cache of group membership checks, in seconds. Entries are
+# invalidated when participants or the host of a group change.
+MEMBERSHIP_CACHE_TTL = env.int("MEMBERSHIP_CACHE_TTL", default=300)
+MEMBERSHIP_CACHE_SIZE = env.int("MEMBERSHIP_CACHE_SIZE", default=100000)
+
+# Bulk message ingestion (POST /api/groups/<id>/messages/bulk/)
+BULK_MESSAGE_MAX_ITEMS = env.int("BULK_MESSAGE_MAX_ITEMS", default=10000)
+BULK_MESSAGE_CHUNK_SIZE = env.int("BULK_MESSAGE_CHUNK_SIZE", default=500)
+
+# Message history (see api/partitions.py and api/archive.py). On PostgreSQL
+# the message table is partitioned by month, with MESSAGE_PARTITIONS_AHEAD
+# partitions created in advance. `python manage.py archivemessages` moves
+# months older than MESSAGE_HOT_MONTHS into compressed files per group
+# under MESSAGE_ARCHIVE_DIR, from which get_messages keeps serving them.
+MESSAGE_HOT_MONTHS = env.int("MESSAGE_HOT_MONTHS", default=3)
+MESSAGE_PARTITIONS_AHEAD = env.int("MESSAGE_PARTITIONS_AHEAD", default=2)
+MESSAGE_ARCHIVE_DIR = env("MESSAGE_ARCHIVE_DIR", default=str(BASE_DIR / "archive"))
+
+# Most user ids accepted by one add-members / remove-members request
+MEMBERSHIP_BATCH_MAX_ITEMS = env.int("MEMBERSHIP_BATCH_MAX_ITEMS", default=10000)
+
+# Rows fetched per round trip when streaming exports
+EXPORT_CHUNK_SIZE = env.int("EXPORT_CHUNK_SIZE", default=2000)
+
+# Live message delivery over WebSockets (see api/broker.py). Messages are
+# published by the `runjobs` worker, a different process from the ASGI
+# server that holds the WebSocket subscribers, so the broker has to reach
+# across processes. api.broker.InProcessBroker only suits tests, and
+# runjobs refuses to deliver messages through it.
+CHAT_BROKER = {
+    "BACKEND": env("CHAT_BROKER_BACKEND", default="api.broker.RedisBroker"),
+    "LOCATION": env("CHAT_BROKER_URL", default="redis://localhost:6379/0"),
+}
+
+# Background jobs (see api/jobs.py), run by `python manage.py runjobs`.
+# Failed batches are retried after JOB_RETRY_BACKOFF * 2^(attempt - 1)
+# seconds, capped at JOB_RETRY_BACKOFF_MAX; jobs locked for longer than
+# JOB_LOCK_TIMEOUT seconds are assumed lost and claimed again.
+JOB_BATCH_SIZE = env.int("JOB_BATCH_SIZE", default=100)
+JOB_MAX_ATTEMPTS = env.int("JOB_MAX_ATTEMPTS", default=5)
+JOB_RETRY_BACKOFF = env.float("JOB_RETRY_BACKOFF", default=2.0)
+JOB_RETRY_BACKOFF_MAX = env.float("JOB_RETRY_BACKOFF_MAX", default=300.0)
+JOB_LOCK_TIMEOUT = env.int("JOB_LOCK_TIMEOUT", default=300)
+JOB_POLL_INTERVAL = env.float("JOB_POLL_INTERVAL", default=0.5)
+
+# Request instrumentation (see api/instrumentation.py). Sampled requests get
+# a JSON log line, and a Server-Timing header when the user is staff or
+# INSTRUMENTATION_SERVER_TIMING is on; repeating one SQL statement more than
+# the threshold within a request logs an N+1 warning.
+INSTRUMENTATION_SAMPLE_RATE = env.float("INSTRUMENTATION_SAMPLE_RATE", default=0.1)
+INSTRUMENTATION_SERVER_TIMING = env.bool("INSTRUMENTATION_SERVER_TIMING", default=False)
+INSTRUMENTATION_N_PLUS_ONE_THRESHOLD = env.int("INSTRUMENTATION_N_PLUS_ONE_THRESHOLD", default=10)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "api.instrumentation": {
+            "handlers": ["console"],
+            "level": env("INSTRUMENTATION_LOG_LEVEL", default="INFO"),
+            "propagate": False,
+        },
+    },
 }
 
 SWAGGER_SETTINGS = {
@@ -23,6 +23,8 @@ from drf_yasg import openapi
 
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from api.serializers import ClaimsTokenObtainPairSerializer, RotatingTokenRefreshSerializer
+
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -38,8 +40,8 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("api/auth/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
-    path("api/auth/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("api/auth/token/", TokenObtainPairView.as_view(serializer_class=ClaimsTokenObtainPairSerializer), name="token_obtain_pair"),
+    path("api/auth/token/refresh/", TokenRefreshView.as_view(serializer_class=RotatingTokenRefreshSerializer), name="token_refresh"),
     path("api/", include("api.urls")),
      path(
         "swagger/",